@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookmyadvocate.settings')
 
 application = get_asgi_application()
+
+# Open database connections now rather than on this worker's first requests
+from main.dbpool import warm_up  # noqa: E402 (needs the app registry)
+
+warm_up()
@@ -2,6 +2,8 @@
 Path: bookmyadvocate/bookmyadvocate/settings.py
 """
 import os
+import sys
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -23,7 +25,14 @@ INSTALLED_APPS = [
 
 # Middleware
 MIDDLEWARE = [
+    # Outermost, so request latency covers every other middleware
+    'main.metrics.metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
+    # Collected static files, before sessions and auth have any work to do
+    'main.staticfiles.static_files_middleware',
+    # Replica reads and read-your-writes pinning (main/routers.py); outside
+    # sessions so that saving one pins the browser to the primary
+    'main.routers.replica_routing_middleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -36,7 +45,8 @@ ROOT_URLCONF = 'bookmyadvocate.urls'
 # Templates
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's backend plus render timing for the metrics endpoint
+        'BACKEND': 'main.metrics.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -54,11 +64,26 @@ TEMPLATES = [
 WSGI_APPLICATION = 'bookmyadvocate.wsgi.application'
 
 # ======================================
-# ✅ DATABASE (Use SQLite for now)
+# ✅ DATABASE (MySQL in production, SQLite for tests)
 # ======================================
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
+# Connections are pooled per process (main/dbpool.py): each request hands its
+# connection back when it ends, so CONN_MAX_AGE stays 0, under WSGI and ASGI
+# alike. DB_POOL_SIZE=0 falls back to Django's persistent per-thread
+# connections, which only help WSGI workers.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_POOL = {
+    'SIZE': DB_POOL_SIZE,
+    'MAX_LIFETIME': int(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+    'PING_AFTER': int(os.environ.get('DB_POOL_PING_AFTER', 30)),
+    # Opened as each worker boots (bookmyadvocate/wsgi.py and asgi.py)
+    'WARMUP': int(os.environ.get('DB_POOL_WARMUP', 2)),
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'main.db_backends.mysql' if DB_POOL_SIZE else 'django.db.backends.mysql',
         'NAME': 'bookmyadvocate_db',
         'USER': 'root',
         'PASSWORD': '',
@@ -67,22 +92,160 @@ DATABASES = {
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
         },
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE else int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': DB_POOL,
     }
 }
+
+if TESTING or os.environ.get('BOOKMYADVOCATE_DB') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
+if TESTING:
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# `manage.py benchmark` seeds and measures a throwaway SQLite database
+BENCHMARKING = len(sys.argv) > 1 and sys.argv[1] == 'benchmark'
+if BENCHMARKING:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'main.db_backends.sqlite3',
+            'NAME': os.environ.get('BOOKMYADVOCATE_BENCHMARK_DB',
+                                   Path(tempfile.gettempdir()) / 'bookmyadvocate-benchmark.sqlite3'),
+            'POOL': DB_POOL,
+        }
+    }
+
+# Read replicas (main/routers.py): the home, search and advocate pages read
+# from DATABASE_REPLICAS, everything else from the primary. DB_REPLICA_HOSTS
+# lists MySQL replicas ("host" or "host:port", comma separated) that share
+# the primary's name and credentials. With BOOKMYADVOCATE_DB=sqlite,
+# BOOKMYADVOCATE_SQLITE_REPLICA names a second SQLite file to read from
+# (refresh it by copying db.sqlite3 over it). After a write, that browser
+# reads from the primary for DATABASE_REPLICA_MAX_LAG seconds; replicas
+# further behind are skipped, checked every DATABASE_REPLICA_CHECK_INTERVAL.
+DATABASE_ROUTERS = ['main.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+if TESTING:
+    # A second (in-memory) database for the tests that opt in to replicas
+    DATABASES['replica'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db-replica.sqlite3'}
+elif os.environ.get('BOOKMYADVOCATE_DB') == 'sqlite' and not BENCHMARKING:
+    if os.environ.get('BOOKMYADVOCATE_SQLITE_REPLICA'):
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ['BOOKMYADVOCATE_SQLITE_REPLICA'],
+        }
+        DATABASE_REPLICAS = ['replica']
+elif not BENCHMARKING:
+    for index, replica in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+        host, _, port = replica.strip().partition(':')
+        DATABASES[f'replica{index}'] = {**DATABASES['default'], 'HOST': host, 'PORT': port or '3306'}
+        DATABASE_REPLICAS.append(f'replica{index}')
+DATABASE_REPLICA_MAX_LAG = int(os.environ.get('DATABASE_REPLICA_MAX_LAG', 5))
+DATABASE_REPLICA_CHECK_INTERVAL = int(os.environ.get('DATABASE_REPLICA_CHECK_INTERVAL', 5))
 # ======================================
 
+# Password hashing pool used by the async login and registration views
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', min(4, os.cpu_count() or 1)))
+# Beyond this many waiting hashes, logins and registrations get a 503
+PASSWORD_HASHING_MAX_PENDING = int(os.environ.get('PASSWORD_HASHING_MAX_PENDING', PASSWORD_HASHING_WORKERS * 8))
+
+# Cache: local memory by default (and in tests); point CACHE_BACKEND and
+# CACHE_LOCATION at a shared cache such as Redis or Memcached in production
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Seconds before the home page advocate showcase is rebuilt (it is also
+# invalidated whenever a showcased advocate changes)
+HOME_SHOWCASE_TTL = int(os.environ.get('HOME_SHOWCASE_TTL', 300))
+
+# Metrics (main/metrics.py). With several worker processes, point
+# METRICS_DIR at a directory they share so /metrics/ reports all of them.
+# Scrapes need the METRICS_TOKEN bearer token, or come from METRICS_ALLOWED_IPS.
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1.0))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Background jobs (main/jobs.py), run by `manage.py run_jobs`. Failed jobs are
+# retried after JOBS_RETRY_DELAY seconds, doubling up to JOBS_MAX_RETRY_DELAY,
+# until JOBS_MAX_ATTEMPTS. A worker's claim on a job lapses after JOBS_LEASE
+# seconds; finished jobs are deleted after JOBS_KEEP_DAYS.
+JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', 5))
+JOBS_RETRY_DELAY = int(os.environ.get('JOBS_RETRY_DELAY', 10))
+JOBS_MAX_RETRY_DELAY = int(os.environ.get('JOBS_MAX_RETRY_DELAY', 3600))
+JOBS_LEASE = int(os.environ.get('JOBS_LEASE', 300))
+JOBS_KEEP_DAYS = int(os.environ.get('JOBS_KEEP_DAYS', 7))
+
+# Notification email, sent by the background jobs
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'BookMyAdvocate <no-reply@bookmyadvocate.in>')
+
 # Custom user model
 AUTH_USER_MODEL = 'main.User'
 
+# Email / Bar Council Number login first, username login (admin) second
+AUTHENTICATION_BACKENDS = [
+    'main.backends.RoleCredentialBackend',
+    'main.backends.UsernameBackend',
+]
+
+# Signed-in users (and advocate profiles) are kept per process for this many
+# seconds, so a change saved by another process shows there within it
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', 30))
+AUTH_USER_CACHE_SIZE = int(os.environ.get('AUTH_USER_CACHE_SIZE', 1024))
+
+# Sessions are read from the cache and written through to the database. With
+# several processes this needs the shared CACHE_BACKEND, or a logout in one
+# process would leave the session alive in another's local memory cache.
+# `manage.py purge_sessions` deletes expired rows.
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
 # Static and Media files
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
+# `manage.py collectstatic` writes hashed, precompressed copies here; the
+# static files middleware serves them with far-future cache headers
+STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'main.staticfiles.CompressedManifestStaticFilesStorage'},
+}
+if TESTING or BENCHMARKING:
+    # Pages render without a collectstatic manifest
+    STORAGES['staticfiles'] = {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}
+
 # Razorpay Keys (dummy for now)
 RAZORPAY_KEY_ID = os.environ.get('RAZORPAY_KEY_ID', 'rzp_test_key')
 RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET', 'rzp_test_secret')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Advocate search: MySQL FULLTEXT in production, the portable term index
+# everywhere else (see main/search.py)
+if DATABASES['default']['ENGINE'].endswith('.mysql'):
+    ADVOCATE_SEARCH_BACKEND = 'main.search.MySQLFullTextBackend'
+else:
+    ADVOCATE_SEARCH_BACKEND = 'main.search.TermIndexBackend'
+
+# Seconds the search page's facet counts (main/facets.py) are cached per
+# query and filters
+SEARCH_FACET_CACHE_TTL = int(os.environ.get('SEARCH_FACET_CACHE_TTL', 60))
+
+# Booking calendar feeds (main/ical.py) list consultations from this many
+# days back onwards
+CALENDAR_FEED_HISTORY_DAYS = int(os.environ.get('CALENDAR_FEED_HISTORY_DAYS', 90))
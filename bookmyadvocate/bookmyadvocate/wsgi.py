@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookmyadvocate.settings')
 
 application = get_wsgi_application()
+
+# Open database connections now rather than on this worker's first requests
+from main.dbpool import warm_up  # noqa: E402 (needs the app registry)
+
+warm_up()
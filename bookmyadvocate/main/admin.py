@@ -3,7 +3,7 @@ Path: bookmyadvocate/main/admin.py
 """
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, AdvocateProfile, AdvocateRegistrationPayment, Booking
+from .models import User, AdvocateProfile, AdvocateRegistrationPayment, Booking, AdvocateAvailability, Locality
 
 class UserAdmin(BaseUserAdmin):
     fieldsets = BaseUserAdmin.fieldsets + (('Role',{'fields':('role','is_active_advocate')}),)
@@ -12,3 +12,5 @@ admin.site.register(User, UserAdmin)
 admin.site.register(AdvocateProfile)
 admin.site.register(AdvocateRegistrationPayment)
 admin.site.register(Booking)
+admin.site.register(AdvocateAvailability)
+admin.site.register(Locality)
@@ -0,0 +1,108 @@
+"""
+Path: bookmyadvocate/main/availability.py
+Advocate working hours, free slot lookup and race-safe slot booking.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+
+from .models import AdvocateAvailability, Booking, BookingSlot
+
+MAX_DAYS = 31
+MAX_ADVOCATES = 50
+
+# Bookings in these states give their slot back
+RELEASED_STATUSES = ('rejected', 'cancelled')
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def _day_slots(rules, day):
+    for rule in rules:
+        step = datetime.timedelta(minutes=rule.slot_minutes)
+        start = datetime.datetime.combine(day, rule.start_time)
+        end = datetime.datetime.combine(day, rule.end_time)
+        while start + step <= end:
+            yield start.time()
+            start += step
+
+
+def free_slots(advocate_ids, start, days=7, now=None):
+    """Free slots per advocate and day: ``{advocate_id: {date: [time, ...]}}``.
+
+    Two queries whatever the number of advocates and days: one for working
+    hours, one for claimed slots. Advocates without working hours are left out.
+    """
+    advocate_ids = list(advocate_ids)[:MAX_ADVOCATES]
+    days = max(1, min(days, MAX_DAYS))
+    end = start + datetime.timedelta(days=days - 1)
+    now = now or datetime.datetime.now()
+
+    rules = defaultdict(list)
+    for rule in AdvocateAvailability.objects.filter(advocate_id__in=advocate_ids):
+        rules[rule.advocate_id, rule.weekday].append(rule)
+
+    taken = set(
+        BookingSlot.objects.filter(advocate_id__in=advocate_ids, date__range=(start, end))
+        .values_list('advocate_id', 'date', 'time')
+    )
+
+    result = {}
+    for advocate_id in advocate_ids:
+        calendar = {}
+        for offset in range(days):
+            day = start + datetime.timedelta(days=offset)
+            calendar[day] = [
+                slot for slot in _day_slots(rules.get((advocate_id, day.weekday()), ()), day)
+                if (advocate_id, day, slot) not in taken and datetime.datetime.combine(day, slot) > now
+            ]
+        if any(rules.get((advocate_id, weekday)) for weekday in range(7)):
+            result[advocate_id] = calendar
+    return result
+
+
+def book_slot(client, advocate, date, time, **fields):
+    """Create a booking and claim its slot, or raise SlotUnavailable.
+
+    If the advocate has published working hours the time must be one of their
+    slots. Exclusivity is enforced by BookingSlot's unique constraint, so there
+    is no read-then-write window between checking and booking.
+    """
+    if datetime.datetime.combine(date, time) <= datetime.datetime.now():
+        raise SlotUnavailable("That time is in the past.")
+
+    rules = list(AdvocateAvailability.objects.filter(advocate=advocate, weekday=date.weekday()))
+    if rules and time not in set(_day_slots(rules, date)):
+        raise SlotUnavailable("The advocate is not available at that time.")
+    if not rules and AdvocateAvailability.objects.filter(advocate=advocate).exists():
+        raise SlotUnavailable("The advocate does not work on that day.")
+
+    try:
+        with transaction.atomic():
+            booking = Booking.objects.create(client=client, advocate=advocate, date=date, time=time, **fields)
+            BookingSlot.objects.create(booking=booking, advocate=advocate, date=date, time=time)
+    except IntegrityError:
+        raise SlotUnavailable("That slot has just been booked. Please pick another one.")
+    return booking
+
+
+def release_slot(booking):
+    BookingSlot.objects.filter(booking=booking).delete()
+
+
+def claim_slot(booking):
+    """Claim the slot of a booking leaving a released status again, or raise SlotUnavailable.
+
+    Someone else may have booked the slot since it was released; the unique
+    constraint decides, as in book_slot().
+    """
+    try:
+        with transaction.atomic():
+            BookingSlot.objects.get_or_create(booking=booking, defaults={
+                'advocate_id': booking.advocate_id, 'date': booking.date, 'time': booking.time,
+            })
+    except IntegrityError:
+        raise SlotUnavailable("That slot has been booked by someone else since.")
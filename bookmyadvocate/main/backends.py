@@ -0,0 +1,70 @@
+"""
+Path: bookmyadvocate/main/backends.py
+Role-based login: clients sign in with their email, advocates with their
+Bar Council Number. Both backends read signed-in users through the
+per-process cache in main/usercache.py.
+"""
+from django.contrib.auth.backends import ModelBackend
+
+from . import hashing, usercache
+from .models import User
+
+
+class CachedUserMixin:
+    def get_user(self, user_id):
+        user = usercache.get_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+
+class UsernameBackend(CachedUserMixin, ModelBackend):
+    """Django's username and password login (the admin's)."""
+
+
+class RoleCredentialBackend(CachedUserMixin, ModelBackend):
+    """Finds the user by (role, credential) and checks the password in one query.
+
+    Uses the (role, email) and (role, bar_council_number) indexes. When no
+    account matches, the password is still hashed once so that response time
+    does not reveal whether the account exists.
+    """
+    CREDENTIAL_FIELDS = {
+        'client': 'email',
+        'advocate': 'bar_council_number',
+    }
+
+    def _lookup(self, role, credential):
+        field = self.CREDENTIAL_FIELDS[role]
+        return User._default_manager.filter(role=role, **{field: credential}).order_by('pk')
+
+    def authenticate(self, request, credential=None, password=None, role=None, **kwargs):
+        if role not in self.CREDENTIAL_FIELDS or not credential or password is None:
+            return None
+
+        user = self._lookup(role, credential).first()
+        if user is None:
+            User().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    async def aauthenticate(self, request, credential=None, password=None, role=None):
+        """Async authenticate(): async ORM lookup, hashing on the main.hashing pool.
+
+        May raise hashing.HashingBusy when the pool is saturated.
+        """
+        if role not in self.CREDENTIAL_FIELDS or not credential or password is None:
+            return None
+
+        user = await self._lookup(role, credential).afirst()
+        if user is None:
+            await hashing.ahash(password)
+            return None
+
+        valid, outdated = await hashing.averify(password, user.password)
+        if not valid or not self.user_can_authenticate(user):
+            return None
+        if outdated:
+            user.password = await hashing.ahash(password)
+            await User._default_manager.filter(pk=user.pk).aupdate(password=user.password)
+        return user
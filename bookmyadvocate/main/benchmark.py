@@ -0,0 +1,606 @@
+"""
+Path: bookmyadvocate/main/benchmark.py
+Per-view performance benchmark with query budgets (``manage.py benchmark``).
+
+seed() bulk-loads a synthetic dataset of any size. run() then requests every
+view named in main/urls.py through the test client, each request inside a
+transaction that is rolled back so the dataset never drifts, and records
+latency and query counts. check() compares the results with the query budget
+each scenario declares and with a latency baseline kept in the repository.
+
+Every URL name needs a scenario: a view without one is reported as a failure,
+so new views cannot skip their budget.
+"""
+import asyncio
+import datetime
+import hashlib
+import itertools
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connection, connections, transaction
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+
+from . import availability, dbpool, facets, geo, search, showcase
+from .models import (
+    AdvocateAvailability, AdvocateProfile, Booking, BookingSlot, Document, DocumentBlob, Review, UploadSession, User,
+)
+from .ratings import rebuild_ratings
+from .uploads import partial_path
+
+BASELINE_PATH = Path(__file__).resolve().parent.parent / 'benchmarks' / 'baseline.json'
+BATCH_SIZE = 5000
+PASSWORD = 'benchmark'
+CITIES = ['Mumbai', 'Delhi', 'Bengaluru', 'Chennai', 'Kolkata', 'Hyderabad', 'Pune', 'Ahmedabad', 'Jaipur', 'Lucknow']
+NAMES = ['Aarav', 'Diya', 'Ishaan', 'Kavya', 'Rohan', 'Meera', 'Arjun', 'Ananya', 'Vikram', 'Priya']
+SPECIALIZATIONS = [value for value, _ in AdvocateProfile.SPECIALIZATION_CHOICES]
+# Working hours for every seeded advocate: weekdays 10:00-17:00 in 30 minute slots
+SLOTS_PER_DAY = 14
+
+
+@dataclass
+class Dataset:
+    advocates: int = 500
+    clients: int = 2000
+    bookings: int = 50000
+    reviews: int = 5000
+    documents: int = 2000
+
+
+# -------------------------
+# SEEDING
+# -------------------------
+def _chunks(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _bulk(model, rows):
+    """bulk_create *rows* (any iterable) in batches; returns the primary keys."""
+    pks = []
+    for batch in _chunks(rows):
+        with transaction.atomic():
+            pks.extend(obj.pk for obj in model.objects.bulk_create(batch))
+    return pks
+
+
+def _insert(model, fields, rows):
+    """INSERT value tuples with executemany.
+
+    For millions of rows this is several times faster than bulk_create, which
+    spends most of its time building model instances and compiling SQL.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+    sql = (f"INSERT INTO {quote(model._meta.db_table)} ({columns}) "
+           f"VALUES ({', '.join(['%s'] * len(fields))})")
+    for batch in _chunks(rows):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+
+
+def _slot(start, number):
+    """Date and time of an advocate's *number*-th booking (bookings never collide)."""
+    day = start + datetime.timedelta(days=number // SLOTS_PER_DAY)
+    minutes = 10 * 60 + 30 * (number % SLOTS_PER_DAY)
+    return day, datetime.time(minutes // 60, minutes % 60)
+
+
+def seed(dataset):
+    """Fill an empty database with *dataset*; bookings straddle today."""
+    password = make_password(PASSWORD)
+    advocate_ids = _bulk(User, (
+        User(username=f'BM-{i}', bar_council_number=f'BM-{i}', email=f'advocate{i}@bench.test',
+             first_name=NAMES[i % len(NAMES)], last_name=f'Advocate{i}', password=password,
+             role='advocate', is_active_advocate=True)
+        for i in range(dataset.advocates)
+    ))
+    client_ids = _bulk(User, (
+        User(username=f'client{i}@bench.test', email=f'client{i}@bench.test',
+             first_name=NAMES[i % len(NAMES)], password=password, role='client')
+        for i in range(dataset.clients)
+    ))
+    places = geo.gazetteer()
+    _bulk(AdvocateProfile, (
+        AdvocateProfile(user_id=advocate_id, specialization=SPECIALIZATIONS[i % len(SPECIALIZATIONS)],
+                        location=CITIES[i % len(CITIES)], locality=places.find(CITIES[i % len(CITIES)]),
+                        experience_years=i % 30,
+                        consultation_fee=500 + 100 * (i % 20),
+                        bio=f"{CITIES[i % len(CITIES)]} advocate practising {SPECIALIZATIONS[i % len(SPECIALIZATIONS)]} law")
+        for i, advocate_id in enumerate(advocate_ids)
+    ))
+    _bulk(AdvocateAvailability, (
+        AdvocateAvailability(advocate_id=advocate_id, weekday=weekday,
+                             start_time=datetime.time(10), end_time=datetime.time(17))
+        for advocate_id in advocate_ids for weekday in range(5)
+    ))
+
+    today = timezone.now().date()
+    per_advocate = math.ceil(dataset.bookings / max(dataset.advocates, 1))
+    start = today - datetime.timedelta(days=per_advocate // SLOTS_PER_DAY // 2)
+
+    ops = connection.ops
+    now = ops.adapt_datetimefield_value(timezone.now())
+    first_id = (Booking.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+    live = []
+
+    def bookings():
+        for k in range(dataset.bookings):
+            number = k // dataset.advocates
+            day, at = _slot(start, number)
+            if day < today:
+                status = 'cancelled' if number % 10 == 0 else 'completed'
+            else:
+                status = 'accepted' if number % 3 == 0 else 'pending'
+            row = (first_id + k, client_ids[(k * 7919) % len(client_ids)], advocate_ids[k % dataset.advocates],
+                   ops.adapt_datefield_value(day), ops.adapt_timefield_value(at), f"Consultation {k}", status)
+            if status not in availability.RELEASED_STATUSES:
+                live.append((row[0], row[2], row[3], row[4]))
+            yield row + ('', '', now, now)
+
+    _insert(Booking, ('id', 'client', 'advocate', 'date', 'time', 'purpose', 'status', 'meeting_link', 'notes',
+                      'created_at', 'updated_at'), bookings())
+    _insert(BookingSlot, ('booking', 'advocate', 'date', 'time'), live)
+
+    completed = Booking.objects.filter(status='completed').order_by('pk').values_list('pk', 'advocate_id', 'client_id')
+    _bulk(Review, (
+        Review(booking_id=pk, advocate_id=advocate_id, client_id=client_id, rating=5 - (k * 7) % 5 // 2,
+               comment="Clear and helpful advice.")
+        for k, (pk, advocate_id, client_id) in enumerate(completed[:dataset.reviews].iterator())
+    ))
+
+    blob = DocumentBlob.objects.create(address='0' * 64, file='blobs/benchmark.pdf', size=1024)
+    _bulk(Document, (
+        Document(booking_id=pk, uploaded_by_id=client_id, blob=blob, file=blob.file.name,
+                 filename='brief.pdf', title=f"Brief {pk}")
+        for pk, client_id in Booking.objects.order_by('pk').values_list('pk', 'client_id')[:dataset.documents]
+    ))
+
+    rebuild_ratings(batch_size=BATCH_SIZE)
+    search.rebuild_index(batch_size=BATCH_SIZE)
+    facets.recount()
+    showcase.invalidate()
+
+
+def fixtures():
+    """The users and rows the scenarios act on, found again in a seeded database."""
+    advocate = User.objects.get(bar_council_number='BM-0')
+    booking = Booking.objects.filter(advocate=advocate, status='pending').order_by('pk').first()
+    return {'advocate': advocate, 'client': booking.client, 'booking': booking}
+
+
+# -------------------------
+# SCENARIOS
+# -------------------------
+@dataclass
+class Scenario:
+    url_name: str
+    budget: int
+    user: str = None
+    expect: int = 200
+    request: object = None
+
+
+SCENARIOS = {}
+
+
+def scenario(url_name, budget, user=None, expect=200):
+    """Register a function ``(client, fixtures) -> (method, url, client keyword arguments)``.
+
+    It runs inside the rolled back transaction, before queries are counted,
+    so it may create whatever state the request needs.
+    """
+    def register(func):
+        SCENARIOS[url_name] = Scenario(url_name, budget, user, expect, func)
+        return func
+    return register
+
+
+def _upload(fx, received):
+    data = b'benchmark' * 100  # one chunk
+    upload = UploadSession.objects.create(
+        booking=fx['booking'], uploaded_by=fx['client'], filename='brief.pdf', size=len(data), title="Brief",
+    )
+    if received:
+        partial_path(upload).write_bytes(data)
+        upload.chunk_digests = hashlib.sha256(data).hexdigest()
+        upload.received = len(data)
+        upload.save()
+    else:
+        partial_path(upload).touch()
+    return upload, data
+
+
+_sequence = itertools.count()
+
+
+@scenario('home', budget=1)
+def _home(client, fx):
+    return 'get', reverse('home'), {}
+
+
+@scenario('register_client', budget=2, expect=302)
+def _register_client(client, fx):
+    email = f'new{next(_sequence)}@bench.test'
+    return 'post', reverse('register_client'), {'data': {'username': email, 'email': email, 'password': 'pw'}}
+
+
+@scenario('register_advocate', budget=23, expect=302)
+def _register_advocate(client, fx):
+    number = f'NEW-{next(_sequence)}'
+    return 'post', reverse('register_advocate'), {'data': {
+        'username': number, 'email': f'{number}@bench.test', 'bar_council_number': number, 'password': 'pw',
+    }}
+
+
+@scenario('login', budget=9, expect=302)
+def _login(client, fx):
+    # Sign in afresh: the last iteration's session was rolled back and only lives on in the session cache
+    client.cookies.pop(settings.SESSION_COOKIE_NAME, None)
+    return 'post', reverse('login'), {'data': {
+        'role': 'client', 'credential': fx['client'].email, 'password': PASSWORD,
+    }}
+
+
+@scenario('logout', budget=3, user='client', expect=302)
+def _logout(client, fx):
+    client.force_login(fx['client'])
+    return 'get', reverse('logout'), {}
+
+
+@scenario('client_dashboard', budget=2, user='client')
+def _client_dashboard(client, fx):
+    return 'get', reverse('client_dashboard'), {}
+
+
+@scenario('advocate_dashboard', budget=2, user='advocate')
+def _advocate_dashboard(client, fx):
+    return 'get', reverse('advocate_dashboard'), {}
+
+
+@scenario('search_advocates', budget=2)
+def _search_advocates(client, fx):
+    return 'get', reverse('search_advocates'), {'data': {'q': 'delhi civil'}}
+
+
+@scenario('advocate_detail', budget=1)
+def _advocate_detail(client, fx):
+    return 'get', reverse('advocate_detail', args=[fx['advocate'].pk]), {}
+
+
+@scenario('book_consultation', budget=6, user='client', expect=302)
+def _book_consultation(client, fx):
+    # A Monday well past the seeded bookings
+    day = timezone.now().date() + datetime.timedelta(days=730)
+    day -= datetime.timedelta(days=day.weekday())
+    return 'post', reverse('book_consultation', args=[fx['advocate'].pk]), {'data': {
+        'slot': f'{day.isoformat()} 10:00', 'purpose': "Benchmark consultation",
+    }}
+
+
+@scenario('advocate_availability', budget=2)
+def _advocate_availability(client, fx):
+    return 'get', reverse('advocate_availability'), {'data': {'advocates': fx['advocate'].pk, 'days': 14}}
+
+
+@scenario('booking_calendar', budget=3)
+def _booking_calendar(client, fx):
+    advocate = fx['advocate']
+    return 'get', reverse('booking_calendar', args=[advocate.pk, advocate.calendar_token]), {}
+
+
+@scenario('reset_calendar_token', budget=2, user='client', expect=302)
+def _reset_calendar_token(client, fx):
+    return 'post', reverse('reset_calendar_token'), {}
+
+
+@scenario('update_booking_status', budget=6, user='advocate', expect=302)
+def _update_booking_status(client, fx):
+    return 'post', reverse('update_booking_status', args=[fx['booking'].pk]), {'data': {'status': 'accepted'}}
+
+
+@scenario('edit_advocate_profile', budget=0, user='advocate')
+def _edit_advocate_profile(client, fx):
+    return 'get', reverse('edit_advocate_profile'), {}
+
+
+@scenario('booking_detail', budget=4, user='client')
+def _booking_detail(client, fx):
+    return 'get', reverse('booking_detail', args=[fx['booking'].pk]), {}
+
+
+@scenario('upload_document', budget=3, user='client')
+def _upload_document(client, fx):
+    return 'get', reverse('upload_document', args=[fx['booking'].pk]), {}
+
+
+@scenario('start_document_upload', budget=2, user='client', expect=201)
+def _start_document_upload(client, fx):
+    return 'post', reverse('start_document_upload', args=[fx['booking'].pk]), {'data': {
+        'filename': 'brief.pdf', 'size': 1024, 'title': "Brief",
+    }}
+
+
+@scenario('document_upload_status', budget=1, user='client')
+def _document_upload_status(client, fx):
+    upload, _ = _upload(fx, received=False)
+    return 'get', reverse('document_upload_status', args=[upload.pk]), {}
+
+
+@scenario('upload_document_chunk', budget=5, user='client')
+def _upload_document_chunk(client, fx):
+    upload, data = _upload(fx, received=False)
+    return 'post', reverse('upload_document_chunk', args=[upload.pk, 0]), {
+        'data': data, 'content_type': 'application/octet-stream',
+    }
+
+
+@scenario('complete_document_upload', budget=13, user='client')
+def _complete_document_upload(client, fx):
+    upload, _ = _upload(fx, received=True)
+    return 'post', reverse('complete_document_upload', args=[upload.pk]), {}
+
+
+@scenario('metrics', budget=0)
+def _metrics(client, fx):
+    return 'get', reverse('metrics'), {}
+
+
+def uncovered():
+    """URL names in main/urls.py that have no scenario."""
+    names = {pattern.name for pattern in get_resolver('main.urls').url_patterns if pattern.name}
+    return sorted(names - set(SCENARIOS))
+
+
+# -------------------------
+# RUNNING
+# -------------------------
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+@dataclass
+class Result:
+    url_name: str
+    budget: int
+    queries: int = 0
+    p50_ms: float = 0.0
+    p95_ms: float = 0.0
+    p99_ms: float = 0.0
+    max_ms: float = 0.0
+    errors: list = field(default_factory=list)
+
+
+def run_scenario(scenario, fx, iterations=20, warmup=2):
+    client = Client()
+    if scenario.user:
+        client.force_login(fx[scenario.user])
+    result = Result(scenario.url_name, scenario.budget)
+    samples = []
+    for i in range(warmup + iterations):
+        with transaction.atomic():
+            method, url, kwargs = scenario.request(client, fx)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, **kwargs)
+                if response.streaming:
+                    # Streamed bodies do their queries as they are read
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        if response.status_code != scenario.expect:
+            result.errors.append(f"{method.upper()} {url} returned {response.status_code}, expected {scenario.expect}")
+            break
+        if i >= warmup:
+            samples.append(elapsed * 1000)
+            result.queries = max(result.queries, len(queries))
+    if samples:
+        result.p50_ms, result.p95_ms, result.p99_ms = (round(percentile(samples, p), 2) for p in (50, 95, 99))
+        result.max_ms = round(max(samples), 2)
+    return result
+
+
+def run(iterations=20, warmup=2, names=None):
+    fx = fixtures()
+    return [
+        run_scenario(scenario, fx, iterations, warmup)
+        for name, scenario in SCENARIOS.items() if not names or name in names
+    ]
+
+
+# -------------------------
+# ASGI VS WSGI
+# -------------------------
+# Read-only views that are native async; they are requested concurrently through both handlers
+HANDLER_VIEWS = ('home', 'search_advocates', 'advocate_detail')
+
+
+def _handler_result(handler, url_name, samples, wall):
+    return {
+        'handler': handler,
+        'url_name': url_name,
+        'requests': len(samples),
+        'throughput': round(len(samples) / wall, 1),
+        'p50_ms': round(percentile(samples, 50), 2),
+        'p99_ms': round(percentile(samples, 99), 2),
+    }
+
+
+def _wsgi(url, requests, concurrency):
+    # One test client (and database connection) per worker thread, like a threaded WSGI server
+    local = threading.local()
+
+    def fetch(_):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        started = time.perf_counter()
+        response = local.client.get(url)
+        elapsed = time.perf_counter() - started
+        assert response.status_code == 200, response.status_code
+        return elapsed * 1000
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        started = time.perf_counter()
+        samples = list(pool.map(fetch, range(requests)))
+        return samples, time.perf_counter() - started
+
+
+async def _asgi(url, requests, concurrency):
+    client = AsyncClient()
+    gate = asyncio.Semaphore(concurrency)
+
+    async def fetch():
+        async with gate:
+            started = time.perf_counter()
+            response = await client.get(url)
+            elapsed = time.perf_counter() - started
+        assert response.status_code == 200, response.status_code
+        return elapsed * 1000
+
+    started = time.perf_counter()
+    samples = await asyncio.gather(*(fetch() for _ in range(requests)))
+    return samples, time.perf_counter() - started
+
+
+def compare_handlers(requests=200, concurrency=8, names=HANDLER_VIEWS):
+    """Throughput and latency of *names* under Django's WSGI and ASGI handlers.
+
+    Both run in this process, without a network server, so the numbers show
+    the difference between the handlers and view styles rather than servers.
+    """
+    fx = fixtures()
+    results = []
+    for name in names:
+        _, url, kwargs = SCENARIOS[name].request(None, fx)
+        if kwargs.get('data'):
+            url = f"{url}?{urlencode(kwargs['data'])}"
+        results.append(_handler_result('wsgi', name, *_wsgi(url, requests, concurrency)))
+        results.append(_handler_result('asgi', name, *asyncio.run(_asgi(url, requests, concurrency))))
+    return results
+
+
+# -------------------------
+# CONNECTION HANDLING
+# -------------------------
+# Views that query, requested the way a server would: connections are closed
+# (or handed back) at the start and end of every request
+CONNECTION_VIEWS = ('advocate_detail', 'client_dashboard')
+CONNECTION_MODES = {
+    # What settings.py used to do: a new connection for every request
+    'reconnect': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'POOL_SIZE': 0},
+    # Django's persistent per-thread connections (WSGI only)
+    'persistent': {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True, 'POOL_SIZE': 0},
+    # main/dbpool.py, as configured in settings.py
+    'pooled': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True, 'POOL_SIZE': None},
+}
+
+
+def _connection_mode(mode):
+    settings_dict = connection.settings_dict
+    pool = settings_dict.setdefault('POOL', {})
+    saved = settings_dict['CONN_MAX_AGE'], settings_dict['CONN_HEALTH_CHECKS'], dict(pool)
+    connection.close()
+    dbpool.reset_pools()
+    settings_dict['CONN_MAX_AGE'] = mode['CONN_MAX_AGE']
+    settings_dict['CONN_HEALTH_CHECKS'] = mode['CONN_HEALTH_CHECKS']
+    if mode['POOL_SIZE'] is not None:
+        pool['SIZE'] = mode['POOL_SIZE']
+    return saved
+
+
+def _restore_connection_mode(saved):
+    connection.close()
+    dbpool.reset_pools()
+    connection.settings_dict['CONN_MAX_AGE'], connection.settings_dict['CONN_HEALTH_CHECKS'], pool = saved
+    connection.settings_dict['POOL'] = pool
+
+
+def compare_connections(requests=200, names=CONNECTION_VIEWS):
+    """Latency and connect overhead per request of *names* under each CONNECTION_MODES entry.
+
+    Needs a pooled backend (main/db_backends), whose pool counts and times
+    every connect.
+    """
+    if not isinstance(connections[DEFAULT_DB_ALIAS], dbpool.PooledDatabaseWrapperMixin):
+        raise TypeError("compare_connections() needs a main.db_backends engine")
+    fx = fixtures()
+    results = []
+    for name in names:
+        scenario = SCENARIOS[name]
+        for mode, options in CONNECTION_MODES.items():
+            client = Client()
+            if scenario.user:
+                client.force_login(fx[scenario.user])
+            saved = _connection_mode(options)
+            try:
+                samples = []
+                for _ in range(requests):
+                    method, url, kwargs = scenario.request(client, fx)
+                    started = time.perf_counter()
+                    close_old_connections()  # request_started
+                    response = getattr(client, method)(url, **kwargs)
+                    close_old_connections()  # request_finished
+                    samples.append((time.perf_counter() - started) * 1000)
+                    assert response.status_code == scenario.expect, response.status_code
+                pool = connections[DEFAULT_DB_ALIAS].pool
+                results.append({
+                    'url_name': name,
+                    'mode': mode,
+                    'p50_ms': round(percentile(samples, 50), 2),
+                    'connects': round(pool.connects / requests, 3),
+                    'connect_ms': round(pool.connect_seconds * 1000 / requests, 3),
+                })
+            finally:
+                _restore_connection_mode(saved)
+    return results
+
+
+# -------------------------
+# CHECKING
+# -------------------------
+def load_baseline(path=BASELINE_PATH):
+    try:
+        return json.loads(Path(path).read_text())
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(results, dataset, path=BASELINE_PATH):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_text(json.dumps({
+        'dataset': asdict(dataset),
+        'views': {result.url_name: {'p50_ms': result.p50_ms, 'p95_ms': result.p95_ms} for result in results},
+    }, indent=2, sort_keys=True) + '\n')
+
+
+def check(results, baseline=None, dataset=None, tolerance=1.5, slack_ms=2.0):
+    """Return a list of failure messages.
+
+    Latency fails when p95 exceeds the baseline p95 times *tolerance* plus
+    *slack_ms*; it is only compared for the dataset the baseline was taken on.
+    """
+    failures = [f"{name}: no benchmark scenario" for name in uncovered()]
+    compare = baseline is not None and dataset is not None and baseline['dataset'] == asdict(dataset)
+    for result in results:
+        failures.extend(f"{result.url_name}: {error}" for error in result.errors)
+        if result.queries > result.budget:
+            failures.append(f"{result.url_name}: {result.queries} queries, budget is {result.budget}")
+        recorded = compare and baseline['views'].get(result.url_name)
+        if recorded and not result.errors and result.p95_ms > recorded['p95_ms'] * tolerance + slack_ms:
+            failures.append(
+                f"{result.url_name}: p95 {result.p95_ms:.1f}ms, baseline {recorded['p95_ms']:.1f}ms"
+            )
+    return failures
@@ -0,0 +1,18 @@
+"""
+Path: bookmyadvocate/main/db_backends/mysql/base.py
+Django's MySQL backend with pooled connections (see main/dbpool.py).
+"""
+from django.db.backends.mysql import base
+
+from main.dbpool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    @staticmethod
+    def ping(connection):
+        # A protocol-level ping: no statement to parse
+        try:
+            connection.ping()
+            return True
+        except base.Database.Error:
+            return False
@@ -0,0 +1,13 @@
+"""
+Path: bookmyadvocate/main/db_backends/sqlite3/base.py
+Django's SQLite backend with pooled connections (see main/dbpool.py), used by
+the benchmark and the pool's tests. In-memory databases are never closed, so
+they never reach the pool.
+"""
+from django.db.backends.sqlite3 import base
+
+from main.dbpool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,219 @@
+"""
+Path: bookmyadvocate/main/dbpool.py
+A process-wide pool of database connections, for the backends in
+main/db_backends.
+
+Django keeps one connection per thread at most, and only between requests
+of a WSGI thread (CONN_MAX_AGE); under ASGI every request runs its queries in
+a fresh thread, so persistent connections do not help there. With a pooled
+backend, "closing" a connection hands it back to the pool instead, and the
+next connect, from any thread, takes it back out. So run the pooled backends
+with CONN_MAX_AGE = 0: every request returns its connection when it ends,
+under WSGI and ASGI alike.
+
+The DATABASES entry's POOL dict configures it:
+
+- SIZE: idle connections kept (0 turns pooling off: every close is real).
+- MAX_LIFETIME: seconds after which a connection is replaced, so server-side
+  timeouts and failovers are never hit mid-request.
+- PING_AFTER: a connection idle for longer is checked with a round trip
+  before it is handed out; dead ones are dropped and replaced.
+- WARMUP: connections warm_up() opens when a worker boots.
+
+A connection closed inside a transaction, or after an error that left it
+unusable, is really closed rather than returned.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {'SIZE': 10, 'MAX_LIFETIME': 1800, 'PING_AFTER': 30, 'WARMUP': 2}
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+def ping(connection):
+    """Whether a raw DB-API connection still answers."""
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+        return True
+    except Exception:
+        return False
+
+
+class ConnectionPool:
+    def __init__(self, size, max_lifetime, ping_after, check=ping):
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self.check = check
+        # (connection, opened, last released); the most recently released is
+        # handed out first, which keeps the busy few warm
+        self._idle = deque()
+        self._opened = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.connects = 0
+        self.connect_seconds = 0.0
+
+    def _after_fork(self):
+        # Forked children must not use, or close, their parent's sockets
+        if self._pid != os.getpid():
+            self._idle.clear()
+            self._opened.clear()
+            self._pid = os.getpid()
+
+    def _open(self, connect):
+        started = time.perf_counter()
+        connection = connect()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._opened[id(connection)] = time.monotonic()
+            self.connects += 1
+            self.connect_seconds += elapsed
+        return connection
+
+    def discard(self, connection):
+        with self._lock:
+            self._opened.pop(id(connection), None)
+        _close_quietly(connection)
+
+    def acquire(self, connect):
+        """An idle connection that passes the checks, or a new one from *connect*."""
+        while True:
+            with self._lock:
+                self._after_fork()
+                if not self._idle:
+                    break
+                connection, opened, released = self._idle.pop()
+            now = time.monotonic()
+            if now - opened > self.max_lifetime or (now - released > self.ping_after
+                                                     and not self.check(connection)):
+                self.discard(connection)
+                continue
+            return connection
+        return self._open(connect)
+
+    def release(self, connection):
+        now = time.monotonic()
+        with self._lock:
+            self._after_fork()
+            opened = self._opened.get(id(connection))
+            if opened is not None and len(self._idle) < self.size and now - opened <= self.max_lifetime:
+                self._idle.append((connection, opened, now))
+                return
+        self.discard(connection)
+
+    def fill(self, count, connect):
+        """Open connections until *count* (at most SIZE) are idle. Returns how many were opened."""
+        missing = max(0, min(count, self.size) - self.idle)
+        for _ in range(missing):
+            self.release(self._open(connect))
+        return missing
+
+    def clear(self):
+        with self._lock:
+            idle = [connection for connection, _, _ in self._idle]
+            self._idle.clear()
+        for connection in idle:
+            self.discard(connection)
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_for(alias, settings_dict, check=ping):
+    with _pools_lock:
+        if alias not in _pools:
+            options = {**DEFAULTS, **settings_dict.get('POOL', {})}
+            _pools[alias] = ConnectionPool(options['SIZE'], options['MAX_LIFETIME'], options['PING_AFTER'], check)
+        return _pools[alias]
+
+
+def reset_pools():
+    """Close every idle connection and forget the pools (their settings are read again)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.clear()
+
+
+class PooledDatabaseWrapperMixin:
+    """Takes DatabaseWrapper connections from the alias's pool and gives them back on close."""
+
+    @property
+    def pool(self):
+        return pool_for(self.alias, self.settings_dict, self.ping)
+
+    @staticmethod
+    def ping(connection):
+        return ping(connection)
+
+    def _connect(self, conn_params):
+        return super().get_new_connection(conn_params)
+
+    def get_new_connection(self, conn_params):
+        return self.pool.acquire(lambda: self._connect(conn_params))
+
+    def _reusable(self):
+        if self.in_atomic_block:
+            # Django keeps referring to it until the atomic block exits
+            return False
+        if self.errors_occurred and not self.is_usable():
+            return False
+        if not self.get_autocommit():
+            try:
+                self.connection.rollback()
+            except Exception:
+                return False
+        return True
+
+    def _close(self):
+        if self.connection is None:
+            return
+        if self._reusable():
+            self.pool.release(self.connection)
+        else:
+            self.pool.discard(self.connection)
+
+    def warm_up(self, count):
+        return self.pool.fill(count, lambda: self._connect(self.get_connection_params()))
+
+
+def warm_up():
+    """Open connections when a worker boots, so its first requests do not pay for them.
+
+    Pooled aliases get their POOL WARMUP connections; others open this
+    thread's connection. A database that is down only logs a warning.
+    """
+    for alias in connections:
+        connection = connections[alias]
+        try:
+            if isinstance(connection, PooledDatabaseWrapperMixin):
+                count = {**DEFAULTS, **connection.settings_dict.get('POOL', {})}['WARMUP']
+                connection.warm_up(count)
+            elif alias == DEFAULT_DB_ALIAS:
+                connection.ensure_connection()
+        except Exception as exc:
+            logger.warning("Could not warm up database connections for %r: %s", alias, exc)
@@ -0,0 +1,272 @@
+"""
+Path: bookmyadvocate/main/facets.py
+Facet counts for the search page: how many advocates each specialization,
+fee band and experience level would leave.
+
+Each facet is counted with the other facets' filters applied but not its
+own, so picking a specialization still shows how many advocates the others
+have. All three come from one grouped query: the matching AdvocateSearchIndex
+rows grouped by specialization, fee band and experience band, plus whether
+each group passes the current fee and experience filters. The per-facet sums
+are done on those few dozen rows in Python.
+
+Without a text query, the groups come from AdvocateFacetCount instead: the
+same grouping over every listed advocate, recounted by the
+"search.facet_counts" job after the index changes. That works as long as the
+fee and experience filters fall on band boundaries, which is what the facet
+links set; other filters use the grouped query.
+
+Results are cached for SEARCH_FACET_CACHE_TTL seconds per query and
+filters, so popular searches do not pay for the counting at all. Searches
+near a place have no facets (their radius is only applied in Python).
+"""
+import hashlib
+from collections import Counter
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from .models import AdvocateFacetCount, AdvocateProfile, AdvocateSearchIndex
+from .search import get_backend, tokenize
+
+# Lower bounds (₹) of the fee bands; each runs up to the next
+FEE_BANDS = (0, 500, 1000, 2500, 5000)
+# Lower bounds (years) of the experience bands; offered as "N+ years"
+EXPERIENCE_BANDS = (0, 2, 5, 10, 20)
+
+CACHE_PREFIX = 'search:facets:'
+_CENT = Decimal('0.01')
+
+
+def cache_ttl():
+    return getattr(settings, 'SEARCH_FACET_CACHE_TTL', 60)
+
+
+def band(field_name, bounds):
+    """The index of the band *field_name* falls in, as an SQL expression."""
+    return Case(
+        *[When(**{f'{field_name}__gte': bound}, then=Value(index))
+          for index, bound in reversed(list(enumerate(bounds))) if index],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def fee_band_range(index):
+    """(min_fee, max_fee) filter values selecting fee band *index*; None for no bound."""
+    low = FEE_BANDS[index]
+    high = FEE_BANDS[index + 1] - _CENT if index + 1 < len(FEE_BANDS) else None
+    return (Decimal(low) if low else None), high
+
+
+# -------------------------
+# COUNTS TABLE
+# -------------------------
+def _grouped(queryset, **flags):
+    return (
+        queryset.order_by()
+        .annotate(fee_band=band('consultation_fee', FEE_BANDS),
+                  experience_band=band('experience_years', EXPERIENCE_BANDS), **flags)
+        .values('specialization', 'fee_band', 'experience_band', *flags)
+        .annotate(advocates=Count('pk'))
+        .values_list('specialization', 'fee_band', 'experience_band', *flags, 'advocates')
+    )
+
+
+def recount(*, index_model=AdvocateSearchIndex, count_model=AdvocateFacetCount):
+    """Recount AdvocateFacetCount from the search index. Returns the number of groups.
+
+    The model arguments let migrations pass in their historical models.
+    """
+    rows = list(_grouped(index_model.objects.all()))
+    with transaction.atomic():
+        count_model.objects.all().delete()
+        count_model.objects.bulk_create([
+            count_model(specialization=specialization, fee_band=fee_band, experience_band=experience_band,
+                        advocates=advocates)
+            for specialization, fee_band, experience_band, advocates in rows
+        ])
+    return len(rows)
+
+
+# -------------------------
+# COUNTING
+# -------------------------
+def _fee_q(filters):
+    q = Q()
+    if filters.min_fee is not None:
+        q &= Q(consultation_fee__gte=filters.min_fee)
+    if filters.max_fee is not None:
+        q &= Q(consultation_fee__lte=filters.max_fee)
+    return q
+
+
+def _flag(q):
+    if not q:
+        return Value(1)
+    return Case(When(q, then=Value(1)), default=Value(0), output_field=IntegerField())
+
+
+def _index_rows(tokens, filters):
+    """Grouped query: (specialization, fee band, experience band, fee ok, experience ok, advocates)."""
+    queryset = get_backend().matches(tokens) if tokens else AdvocateSearchIndex.objects.all()
+    experience_q = Q(experience_years__gte=filters.min_experience) if filters.min_experience is not None else Q()
+    return _grouped(queryset, fee_ok=_flag(_fee_q(filters)), experience_ok=_flag(experience_q))
+
+
+def _on_band_boundaries(filters):
+    return (
+        (filters.min_fee is None or filters.min_fee in FEE_BANDS)
+        and (filters.max_fee is None or filters.max_fee + _CENT in FEE_BANDS[1:])
+        and (filters.min_experience is None or filters.min_experience in EXPERIENCE_BANDS)
+    )
+
+
+def _table_rows():
+    return AdvocateFacetCount.objects.values_list('specialization', 'fee_band', 'experience_band', 'advocates')
+
+
+def _flagged(table_rows, filters):
+    """Table rows with the fee and experience flags the grouped query would have computed."""
+    min_fee = filters.min_fee or 0
+    min_experience = filters.min_experience or 0
+    for specialization, fee_band, experience_band, advocates in table_rows:
+        _, high = fee_band_range(fee_band)
+        fee_ok = FEE_BANDS[fee_band] >= min_fee and (
+            filters.max_fee is None or (high is not None and high <= filters.max_fee))
+        experience_ok = EXPERIENCE_BANDS[experience_band] >= min_experience
+        yield specialization, fee_band, experience_band, fee_ok, experience_ok, advocates
+
+
+def tally(rows, filters):
+    """Sum grouped rows into {'total', 'specializations', 'fee_bands', 'experience_bands'} counts."""
+    specializations, fee_bands, experience_bands = Counter(), Counter(), Counter()
+    total = 0
+    for specialization, fee_band, experience_band, fee_ok, experience_ok, advocates in rows:
+        specialization_ok = not filters.specialization or specialization == filters.specialization
+        if fee_ok and experience_ok:
+            specializations[specialization] += advocates
+        if specialization_ok and experience_ok:
+            fee_bands[fee_band] += advocates
+        if specialization_ok and fee_ok:
+            experience_bands[experience_band] += advocates
+            if experience_ok:
+                total += advocates
+    return {
+        'total': total,
+        'specializations': dict(specializations),
+        'fee_bands': dict(fee_bands),
+        'experience_bands': dict(experience_bands),
+    }
+
+
+def _cache_key(tokens, filters):
+    signature = repr((sorted(set(tokens)), filters.specialization, filters.min_fee, filters.max_fee,
+                      filters.min_experience))
+    return CACHE_PREFIX + hashlib.sha1(signature.encode()).hexdigest()
+
+
+def _counted(filters):
+    return filters.origin is None and not filters.near
+
+
+def facet_counts(query, filters):
+    """The SearchFacets for a search, or None for searches near a place."""
+    if not _counted(filters):
+        return None
+    tokens = tokenize(query)
+    key = _cache_key(tokens, filters)
+    counts = cache.get(key)
+    if counts is None:
+        if not tokens and _on_band_boundaries(filters):
+            rows = _flagged(_table_rows(), filters)
+        else:
+            rows = _index_rows(tokens, filters)
+        counts = tally(rows, filters)
+        cache.set(key, counts, cache_ttl())
+    return SearchFacets.build(counts, filters)
+
+
+async def afacet_counts(query, filters):
+    """facet_counts on the async ORM and cache API."""
+    if not _counted(filters):
+        return None
+    tokens = tokenize(query)
+    key = _cache_key(tokens, filters)
+    counts = await cache.aget(key)
+    if counts is None:
+        if not tokens and _on_band_boundaries(filters):
+            rows = _flagged([row async for row in _table_rows()], filters)
+        else:
+            rows = [row async for row in _index_rows(tokens, filters)]
+        counts = tally(rows, filters)
+        await cache.aset(key, counts, cache_ttl())
+    return SearchFacets.build(counts, filters)
+
+
+# -------------------------
+# PRESENTATION
+# -------------------------
+@dataclass
+class FacetValue:
+    label: str
+    count: int
+    selected: bool
+    # Search parameters that select it (None: drop the parameter)
+    params: dict
+    # The query string that toggles it, set by SearchFacets.link()
+    query: str = ''
+
+
+@dataclass
+class SearchFacets:
+    total: int
+    specializations: list = field(default_factory=list)
+    fee_bands: list = field(default_factory=list)
+    experience: list = field(default_factory=list)
+
+    @classmethod
+    def build(cls, counts, filters):
+        fee_counts, experience_counts = counts['fee_bands'], counts['experience_bands']
+        specializations = [
+            FacetValue(label, counts['specializations'].get(value, 0), filters.specialization == value,
+                       {'specialization': value})
+            for value, label in AdvocateProfile.SPECIALIZATION_CHOICES
+            if counts['specializations'].get(value) or filters.specialization == value
+        ]
+        fee_bands = []
+        for index, low in enumerate(FEE_BANDS):
+            min_fee, max_fee = fee_band_range(index)
+            if max_fee is None:
+                label = f'₹{low:,} and above'
+            elif not low:
+                label = f'Under ₹{FEE_BANDS[index + 1]:,}'
+            else:
+                label = f'₹{low:,} – {FEE_BANDS[index + 1] - 1:,}'
+            selected = (filters.min_fee or None) == min_fee and filters.max_fee == max_fee
+            fee_bands.append(FacetValue(label, fee_counts.get(index, 0), selected,
+                                        {'min_fee': min_fee, 'max_fee': max_fee}))
+        experience = [
+            FacetValue(f'{bound}+ years',
+                       sum(count for band_index, count in experience_counts.items() if band_index >= index),
+                       filters.min_experience == bound, {'min_experience': bound})
+            for index, bound in enumerate(EXPERIENCE_BANDS) if index
+        ]
+        return cls(counts['total'], specializations, fee_bands, experience)
+
+    def link(self, params):
+        """Give every value the query string that applies it to *params* (or removes it, if selected)."""
+        for value in self.specializations + self.fee_bands + self.experience:
+            linked = params.copy()
+            linked.pop('cursor', None)
+            for name, param in value.params.items():
+                if value.selected or param is None:
+                    linked.pop(name, None)
+                else:
+                    linked[name] = str(param)
+            value.query = linked.urlencode()
+        return self
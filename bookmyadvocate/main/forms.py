@@ -30,6 +30,19 @@ class AdvocateProfileForm(forms.ModelForm):
         model = AdvocateProfile
         fields = ['specialization','experience_years','location','bio']
 
+class ProfilePictureForm(forms.ModelForm):
+    MAX_SIZE = 10 * 1024 * 1024
+
+    class Meta:
+        model = User
+        fields = ['profile_picture']
+
+    def clean_profile_picture(self):
+        picture = self.cleaned_data['profile_picture']
+        if picture and picture.size > self.MAX_SIZE:
+            raise forms.ValidationError("Profile pictures can be at most 10 MB.")
+        return picture
+
 class BookingForm(forms.ModelForm):
     class Meta:
         model = Booking
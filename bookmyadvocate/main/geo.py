@@ -0,0 +1,281 @@
+"""
+Path: bookmyadvocate/main/geo.py
+Advocate locations: the bundled gazetteer, geohashes and radius searches.
+
+Advocates type their location as free text. On save it is resolved against
+the Locality table, which is loaded from data/gazetteer_in.csv so nothing
+needs the network. The advocate's search index row then carries the
+locality's coordinates and geohash.
+
+A geohash names a cell of a recursive grid. Each extra character narrows
+the cell, and every point inside a cell starts with the cell's hash. A radius
+search therefore takes the few cells that cover the circle and looks them up
+as indexed prefix ranges. Exact distances are computed only for the rows
+found in those cells.
+"""
+import csv
+import math
+import re
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import AdvocateProfile, AdvocateSearchIndex, Locality
+
+GAZETTEER_PATH = Path(__file__).resolve().parent / 'data' / 'gazetteer_in.csv'
+# About 5 m: far finer than the city-level coordinates it encodes
+GEOHASH_LENGTH = 9
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_RADIUS_KM = 25
+MAX_RADIUS_KM = 500
+# A finer cover wastes fewer rows but ORs more ranges together
+MAX_CELLS = 16
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_WORD_RE = re.compile(r'[^\W_]+')
+_PART_RE = re.compile(r'[,;/()]|\s-\s')
+
+
+# -------------------------
+# GEOHASH
+# -------------------------
+def encode(latitude, longitude, length=GEOHASH_LENGTH):
+    """Geohash of a point: bits alternate longitude and latitude halvings, five to a character."""
+    ranges = [[-180.0, 180.0], [-90.0, 90.0]]
+    point = (longitude, latitude)
+    chars = []
+    bit = value = 0
+    while len(chars) < length:
+        axis = bit % 2
+        low, high = ranges[axis]
+        middle = (low + high) / 2
+        value <<= 1
+        if point[axis] >= middle:
+            value |= 1
+            ranges[axis][0] = middle
+        else:
+            ranges[axis][1] = middle
+        bit += 1
+        if bit % 5 == 0:
+            chars.append(_BASE32[value])
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(length):
+    """(latitude, longitude) span in degrees of a cell with a *length* character geohash."""
+    bits = 5 * length
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+    """Great-circle (haversine) distance."""
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(longitude2 - longitude1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _steps(low, high, step):
+    # One sample per cell row (or column) between low and high, both ends included
+    values = []
+    value = low
+    while value < high:
+        values.append(value)
+        value += step
+    values.append(high)
+    return values
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """Geohash prefixes whose cells together cover the circle, at most MAX_CELLS of them.
+
+    The longest prefixes that fit are used, so the cover is as tight as the
+    cell budget allows. Circles crossing the antimeridian are not handled.
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos = math.cos(math.radians(latitude))
+    dlon = 180.0 if cos < 1e-9 else min(180.0, dlat / cos)
+    south, north = max(-90.0, latitude - dlat), min(90.0, latitude + dlat)
+    west, east = max(-180.0, longitude - dlon), min(180.0, longitude + dlon)
+
+    for length in range(GEOHASH_LENGTH, 0, -1):
+        lat_step, lon_step = cell_size(length)
+        if (math.ceil((north - south) / lat_step) + 1) * (math.ceil((east - west) / lon_step) + 1) > MAX_CELLS:
+            continue
+        return sorted({
+            encode(lat, lon, length)
+            for lat in _steps(south, north, lat_step)
+            for lon in _steps(west, east, lon_step)
+        })
+    return sorted(set(_BASE32))
+
+
+def cells_q(cells, field='geohash'):
+    """Rows whose *field* starts with one of *cells*, as index range conditions."""
+    q = Q()
+    for cell in cells:
+        q |= Q(**{f'{field}__gte': cell, f'{field}__lt': cell + '\uffff'})
+    return q
+
+
+# -------------------------
+# GAZETTEER
+# -------------------------
+def normalize(text):
+    return ' '.join(_WORD_RE.findall((text or '').lower()))
+
+
+class Gazetteer:
+    """Localities by normalized name, alias and "name state".
+
+    When two localities share a name, the one loaded first keeps it; "name,
+    state" still finds the other.
+    """
+
+    def __init__(self, localities):
+        self.names = {}
+        self.by_id = {}
+        for locality in localities:
+            self.by_id[locality.pk] = locality
+            names = [locality.name, f"{locality.name} {locality.state}", *locality.aliases.split('|')]
+            for name in map(normalize, names):
+                if name:
+                    self.names.setdefault(name, locality)
+
+    def find(self, text):
+        """The locality a free-text location refers to, or None.
+
+        Tries the whole text, then each comma separated part (the most
+        specific part first, as in "Andheri West, Mumbai"), then runs of up to
+        three words.
+        """
+        whole = normalize(text)
+        if not whole:
+            return None
+        if whole in self.names:
+            return self.names[whole]
+        for part in _PART_RE.split(text):
+            locality = self.names.get(normalize(part))
+            if locality is not None:
+                return locality
+        words = whole.split()
+        for size in (3, 2, 1):
+            for start in range(len(words) - size + 1):
+                locality = self.names.get(' '.join(words[start:start + size]))
+                if locality is not None:
+                    return locality
+        return None
+
+
+_gazetteer = None
+
+
+def gazetteer():
+    """The Locality table, loaded once per process."""
+    global _gazetteer
+    if _gazetteer is None:
+        _gazetteer = Gazetteer(Locality.objects.order_by('pk'))
+    return _gazetteer
+
+
+async def agazetteer():
+    global _gazetteer
+    if _gazetteer is None:
+        _gazetteer = Gazetteer([locality async for locality in Locality.objects.order_by('pk')])
+    return _gazetteer
+
+
+def gazetteer_changed():
+    global _gazetteer
+    _gazetteer = None
+
+
+def location_fields(locality):
+    """AdvocateSearchIndex location columns for *locality* (which may be None)."""
+    if locality is None:
+        return {'latitude': None, 'longitude': None, 'geohash': ''}
+    return {
+        'latitude': locality.latitude,
+        'longitude': locality.longitude,
+        'geohash': encode(locality.latitude, locality.longitude),
+    }
+
+
+def index_fields(locality_id):
+    """location_fields for a locality id; the gazetteer is only loaded for a real id."""
+    return location_fields(gazetteer().by_id.get(locality_id) if locality_id else None)
+
+
+# -------------------------
+# LOADING
+# -------------------------
+def read_gazetteer(path=GAZETTEER_PATH):
+    """The localities in a gazetteer CSV (name, state, latitude, longitude, aliases)."""
+    with open(path, newline='', encoding='utf-8') as file:
+        return [
+            {
+                'name': row['name'].strip(),
+                'state': row['state'].strip(),
+                'aliases': (row.get('aliases') or '').strip(),
+                'latitude': float(row['latitude']),
+                'longitude': float(row['longitude']),
+            }
+            for row in csv.DictReader(file)
+        ]
+
+
+def load_gazetteer(path=GAZETTEER_PATH, *, locality_model=Locality):
+    """Add or update the localities in *path*. Returns (created, updated).
+
+    The model argument lets migrations pass in their historical model.
+    """
+    existing = {(locality.name, locality.state): locality for locality in locality_model.objects.all()}
+    created, updated = [], []
+    for fields in read_gazetteer(path):
+        locality = existing.get((fields['name'], fields['state']))
+        if locality is None:
+            created.append(locality_model(**fields))
+        elif any(getattr(locality, name) != value for name, value in fields.items()):
+            for name, value in fields.items():
+                setattr(locality, name, value)
+            updated.append(locality)
+
+    with transaction.atomic():
+        locality_model.objects.bulk_create(created)
+        locality_model.objects.bulk_update(updated, ['aliases', 'latitude', 'longitude'])
+    gazetteer_changed()
+    return len(created), len(updated)
+
+
+def relink_profiles(batch_size=500, *, profile_model=AdvocateProfile, locality_model=Locality,
+                    index_model=AdvocateSearchIndex):
+    """Resolve every advocate's location again, updating the search index to match.
+
+    Returns the number of advocates whose locality changed.
+    """
+    places = Gazetteer(locality_model.objects.order_by('pk'))
+    profiles = profile_model.objects.order_by('pk').only('pk', 'user_id', 'location', 'locality_id')
+    changed = 0
+    last_pk = 0
+    while batch := list(profiles.filter(pk__gt=last_pk)[:batch_size]):
+        last_pk = batch[-1].pk
+        moved = {}
+        for profile in batch:
+            locality = places.find(profile.location)
+            locality_id = locality.pk if locality is not None else None
+            if locality_id != profile.locality_id:
+                profile.locality_id = locality_id
+                moved[profile.user_id] = locality
+
+        rows = list(index_model.objects.filter(user_id__in=moved))
+        for row in rows:
+            for name, value in location_fields(moved[row.user_id]).items():
+                setattr(row, name, value)
+        with transaction.atomic():
+            profile_model.objects.bulk_update([profile for profile in batch if profile.user_id in moved],
+                                              ['locality'])
+            index_model.objects.bulk_update(rows, ['latitude', 'longitude', 'geohash'])
+        changed += len(moved)
+    return changed
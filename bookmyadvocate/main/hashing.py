@@ -0,0 +1,96 @@
+"""
+Path: bookmyadvocate/main/hashing.py
+Password hashing off the event loop.
+
+PBKDF2 is the most CPU-heavy thing a request can do. Async views hand it to a
+small, bounded thread pool (hashlib releases the GIL, so the threads really run
+in parallel) and never block the event loop. When more than
+PASSWORD_HASHING_MAX_PENDING hashes are waiting, new ones are refused with
+HashingBusy so a login storm sheds load instead of starving every other view.
+"""
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_executor = None
+_pending = 0
+_completed = 0
+_rejected = 0
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def worker_count():
+    return settings.PASSWORD_HASHING_WORKERS
+
+
+def max_pending():
+    return settings.PASSWORD_HASHING_MAX_PENDING
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=worker_count(), thread_name_prefix='password-hashing')
+        return _executor
+
+
+def stats():
+    """Queue depth and totals for monitoring."""
+    with _lock:
+        return {
+            'workers': worker_count(),
+            'pending': _pending,
+            'queued': max(0, _pending - worker_count()),
+            'completed': _completed,
+            'rejected': _rejected,
+        }
+
+
+async def run(func, *args):
+    """Run a hashing function on the pool, or raise HashingBusy if it is full."""
+    global _pending, _completed, _rejected
+    with _lock:
+        if _pending >= max_pending():
+            _rejected += 1
+            logger.warning("Password hashing queue full (%d pending), rejecting request", _pending)
+            raise HashingBusy()
+        _pending += 1
+    succeeded = False
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(_get_executor(), functools.partial(func, *args))
+        succeeded = True
+        return result
+    finally:
+        with _lock:
+            _pending -= 1
+            # Failed hashes are not "completed"
+            _completed += succeeded
+
+
+def _verify(password, encoded):
+    """check_password that reports whether the stored hash needs upgrading."""
+    outdated = []
+    valid = check_password(password, encoded, setter=lambda raw: outdated.append(True))
+    return valid, bool(outdated)
+
+
+async def averify(password, encoded):
+    """Return (password is valid, stored hash should be re-made)."""
+    return await run(_verify, password, encoded)
+
+
+async def ahash(password):
+    return await run(make_password, password)
@@ -0,0 +1,177 @@
+"""
+Path: bookmyadvocate/main/ical.py
+iCalendar (RFC 5545) feed of a user's consultations, for calendar apps to
+subscribe to.
+
+Every user has a secret calendar_token; the feed URL carries it, so calendar
+apps can poll without signing in. The token is checked against the database
+on every poll, so a reset revokes the old URL in every process at once. An
+advocate's feed lists the bookings made with them, a client's the bookings
+they made, from CALENDAR_FEED_HISTORY_DAYS ago onwards, rejected and cancelled
+ones left out.
+
+Calendar apps poll every few minutes and nearly always find nothing new. So
+the feed's validators (a weak ETag and Last-Modified) come from one
+aggregate query, the number of listed bookings and their latest updated_at,
+and an unchanged poll is answered 304 from that and the token lookup alone.
+Otherwise events are streamed from a server-side cursor (iterator() or
+aiterator(), matching the WSGI or ASGI handler), so memory stays flat however
+many bookings there are.
+
+Booking times carry no time zone, so events use floating local times.
+"""
+import datetime
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Booking
+
+PRODUCT_ID = '-//BookMyAdvocate//Consultations//EN'
+UID_DOMAIN = 'bookmyadvocate.in'
+# Bumped whenever the event format changes, so cached feeds are not kept
+FEED_VERSION = 1
+# Bookings are for a slot, whose length is not recorded with them
+CONSULTATION_MINUTES = 30
+LISTED_STATUSES = ('pending', 'accepted', 'completed')
+STREAM_CHUNK_SIZE = 500
+MAX_LINE_OCTETS = 75
+
+
+def history_days():
+    return getattr(settings, 'CALENDAR_FEED_HISTORY_DAYS', 90)
+
+
+def bookings_for(user):
+    """The user's listed bookings, with the other party's name."""
+    own, other = ('advocate', 'client') if user.role == 'advocate' else ('client', 'advocate')
+    since = timezone.now().date() - datetime.timedelta(days=history_days())
+    return (
+        Booking.objects.filter(**{own: user}, date__gte=since, status__in=LISTED_STATUSES)
+        .select_related(other)
+        .only('date', 'time', 'purpose', 'status', 'meeting_link', 'updated_at',
+              f'{other}__username', f'{other}__first_name', f'{other}__last_name')
+        .order_by('date', 'time', 'pk')
+    )
+
+
+# -------------------------
+# VALIDATORS
+# -------------------------
+def _aware(value):
+    # Stored naive, in the default time zone
+    return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+
+def _epoch(value):
+    return _aware(value).timestamp()
+
+
+def _validators(summary):
+    latest = summary['latest']
+    last_modified = int(_epoch(latest)) if latest is not None else None
+    stamp = int(_epoch(latest) * 1_000_000) if latest is not None else 0
+    return f'W/"{FEED_VERSION}-{summary["count"]}-{stamp}"', last_modified
+
+
+def validators(bookings):
+    """(ETag, Last-Modified timestamp or None) of the feed of *bookings*, in one query."""
+    return _validators(bookings.order_by().aggregate(count=Count('pk'), latest=Max('updated_at')))
+
+
+async def avalidators(bookings):
+    return _validators(await bookings.order_by().aaggregate(count=Count('pk'), latest=Max('updated_at')))
+
+
+# -------------------------
+# SERIALIZING
+# -------------------------
+def escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold(line):
+    """*line* with CRLF, folded to at most 75 octets per line as RFC 5545 asks."""
+    lines, current, size = [], [], 0
+    for char in line:
+        octets = len(char.encode())
+        if size + octets > MAX_LINE_OCTETS:
+            lines.append(''.join(current))
+            # Continuation lines start with a space, which counts
+            current, size = [' '], 1
+        current.append(char)
+        size += octets
+    lines.append(''.join(current))
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def _utc(value):
+    return _aware(value).astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def event(booking, user, url):
+    other = booking.client if user.role == 'advocate' else booking.advocate
+    start = datetime.datetime.combine(booking.date, booking.time)
+    end = start + datetime.timedelta(minutes=CONSULTATION_MINUTES)
+    description = booking.purpose
+    if booking.meeting_link:
+        description += f"\n\nMeeting link: {booking.meeting_link}"
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:booking-{booking.pk}@{UID_DOMAIN}',
+        f'DTSTAMP:{_utc(booking.updated_at)}',
+        f'LAST-MODIFIED:{_utc(booking.updated_at)}',
+        f'DTSTART:{start:%Y%m%dT%H%M%S}',
+        f'DTEND:{end:%Y%m%dT%H%M%S}',
+        f'SUMMARY:{escape(f"Consultation with {other.get_full_name() or other.username}")}',
+        f'DESCRIPTION:{escape(description)}',
+        f'STATUS:{"TENTATIVE" if booking.status == "pending" else "CONFIRMED"}',
+        f'URL:{url}',
+        'END:VEVENT',
+    ]
+    return ''.join(fold(line) for line in lines)
+
+
+def header():
+    return ''.join(fold(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODUCT_ID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        'X-WR-CALNAME:BookMyAdvocate consultations',
+        # How often clients that honour it should poll
+        'X-PUBLISHED-TTL:PT15M',
+        'REFRESH-INTERVAL;VALUE=DURATION:PT15M',
+    ))
+
+
+FOOTER = 'END:VCALENDAR\r\n'
+
+
+def _booking_url(request):
+    # One reverse() for the whole feed
+    placeholder = 999999999
+    template = request.build_absolute_uri(reverse('booking_detail', args=[placeholder]))
+    return lambda booking: template.replace(str(placeholder), str(booking.pk))
+
+
+def stream(request, user, bookings):
+    """The feed as a generator of text chunks, one per event."""
+    url = _booking_url(request)
+    yield header()
+    for booking in bookings.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        yield event(booking, user, url(booking))
+    yield FOOTER
+
+
+async def astream(request, user, bookings):
+    """stream() for the ASGI handler, on the async ORM."""
+    url = _booking_url(request)
+    yield header()
+    async for booking in bookings.aiterator(chunk_size=STREAM_CHUNK_SIZE):
+        yield event(booking, user, url(booking))
+    yield FOOTER
@@ -0,0 +1,182 @@
+"""
+Path: bookmyadvocate/main/jobs.py
+A durable background job queue kept in the database (no broker needed).
+
+Views enqueue side effects with enqueue(), inside the transaction of the
+change that caused them, so the job is committed exactly when the change is.
+``manage.py run_jobs`` claims due jobs, runs their handlers and records the
+outcome.
+
+- A handler registered with ``batch=True`` receives the payloads of every due
+  job of its kind at once, so it can coalesce them into a few queries.
+- A handler and the "done" mark commit in one transaction. A database-only
+  handler therefore takes effect exactly once; anything else it does (email)
+  is at least once.
+- Failed jobs are retried with capped exponential backoff until their
+  handler's max_attempts, then kept as failed. A failed batch is run again
+  one job at a time, so one bad payload cannot hold back the others.
+- A claimed job holds a lease (JOBS_LEASE seconds). If its worker dies, the
+  job becomes due again when the lease runs out.
+- An idempotency key makes enqueueing a no-op while a job with that key
+  exists.
+"""
+import datetime
+import logging
+import random
+import traceback
+from dataclasses import dataclass
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# -------------------------
+# HANDLERS
+# -------------------------
+@dataclass
+class Handler:
+    func: object
+    batch: bool
+    max_attempts: int
+
+
+HANDLERS = {}
+
+
+def handler(kind, batch=False, max_attempts=None):
+    """Register the function that runs jobs of *kind*.
+
+    It is called with the job's payload, or with a list of payloads if
+    *batch* is true.
+    """
+    def register(func):
+        HANDLERS[kind] = Handler(func, batch, max_attempts or _setting('JOBS_MAX_ATTEMPTS', 5))
+        return func
+    return register
+
+
+# -------------------------
+# ENQUEUEING
+# -------------------------
+def enqueue(*jobs):
+    """Save unsaved Job instances in one INSERT, skipping any whose key is taken."""
+    Job.objects.bulk_create(jobs, ignore_conflicts=True)
+
+
+# -------------------------
+# RUNNING
+# -------------------------
+def backoff(attempts):
+    """Seconds to wait before retrying after failed attempt number *attempts*."""
+    delay = min(_setting('JOBS_MAX_RETRY_DELAY', 3600), _setting('JOBS_RETRY_DELAY', 10) * 2 ** (attempts - 1))
+    # Jitter, so jobs that failed together do not all retry together
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim(limit):
+    """Lease up to *limit* due jobs to this worker, oldest first."""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status__in=[QUEUED, RUNNING], run_after__lte=now)
+            .order_by('run_after', 'pk')[:limit]
+        )
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=RUNNING,
+            run_after=now + datetime.timedelta(seconds=_setting('JOBS_LEASE', 300)),
+            attempts=F('attempts') + 1,
+        )
+    for job in jobs:
+        job.status = RUNNING
+        job.attempts += 1
+    return jobs
+
+
+def _attempt(jobs, spec):
+    # The handler and the done mark commit together; returns the error, if any
+    try:
+        with transaction.atomic():
+            if spec.batch:
+                spec.func([job.payload for job in jobs])
+            else:
+                spec.func(jobs[0].payload)
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status=DONE, finished_at=timezone.now(), last_error='',
+            )
+        return None
+    except Exception:
+        return traceback.format_exc()
+
+
+def _run(jobs, spec):
+    """Run *jobs* in one handler call and record the outcome. Returns how many succeeded."""
+    error = _attempt(jobs, spec)
+    if error is None:
+        return len(jobs)
+    if len(jobs) > 1:
+        # One bad payload must not hold back the rest of its batch
+        return sum(_run([job], spec) for job in jobs)
+    _failed(jobs, error, spec.max_attempts)
+    return 0
+
+
+def _failed(jobs, error, max_attempts):
+    now = timezone.now()
+    for job in jobs:
+        job.last_error = error
+        if job.attempts >= max_attempts:
+            job.status = FAILED
+            job.finished_at = now
+            logger.error("Job %s failed for good after %d attempts", job, job.attempts)
+        else:
+            job.status = QUEUED
+            job.run_after = now + datetime.timedelta(seconds=backoff(job.attempts))
+            logger.warning("Job %s failed (attempt %d), retrying", job, job.attempts)
+    Job.objects.bulk_update(jobs, ['status', 'run_after', 'last_error', 'finished_at'])
+
+
+def run_claimed(jobs):
+    """Run leased jobs, each kind's batch together. Returns the number that succeeded."""
+    succeeded = 0
+    for kind, group in groupby(sorted(jobs, key=lambda job: job.kind), key=lambda job: job.kind):
+        group = list(group)
+        spec = HANDLERS.get(kind)
+        if spec is None:
+            _failed(group, f"No handler registered for {kind!r}", max_attempts=0)
+            continue
+        for batch in [group] if spec.batch else [[job] for job in group]:
+            succeeded += _run(batch, spec)
+    return succeeded
+
+
+def work_off(batch_size=100, max_jobs=None):
+    """Run due jobs until none are left (or *max_jobs* were claimed). Returns the number claimed."""
+    claimed = 0
+    while max_jobs is None or claimed < max_jobs:
+        jobs = claim(batch_size if max_jobs is None else min(batch_size, max_jobs - claimed))
+        if not jobs:
+            break
+        run_claimed(jobs)
+        claimed += len(jobs)
+    return claimed
+
+
+def purge(older_than=None):
+    """Delete done jobs finished more than *older_than* ago, freeing their keys. Returns how many."""
+    older_than = older_than or datetime.timedelta(days=_setting('JOBS_KEEP_DAYS', 7))
+    deleted, _ = Job.objects.filter(status=DONE, finished_at__lt=timezone.now() - older_than).delete()
+    return deleted
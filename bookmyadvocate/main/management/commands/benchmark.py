@@ -0,0 +1,131 @@
+"""
+Path: bookmyadvocate/main/management/commands/benchmark.py
+"""
+import json
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from main import benchmark, dbpool
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic SQLite dataset, request every view and check query budgets and latency "
+        "against the stored baseline (the database is BOOKMYADVOCATE_BENCHMARK_DB, default in /tmp)"
+    )
+
+    def add_arguments(self, parser):
+        defaults = benchmark.Dataset()
+        for name, value in asdict(defaults).items():
+            parser.add_argument(f'--{name}', type=int, default=value)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--views', nargs='*', help="Only these URL names")
+        parser.add_argument('--reuse', action='store_true',
+                            help="Keep the database if it was seeded with the same dataset")
+        parser.add_argument('--baseline', default=str(benchmark.BASELINE_PATH))
+        parser.add_argument('--update-baseline', action='store_true')
+        parser.add_argument('--tolerance', type=float, default=1.5,
+                            help="Allowed p95 slowdown over the baseline")
+        parser.add_argument('--compare-handlers', action='store_true',
+                            help="Instead: concurrent throughput of the async read views under ASGI vs WSGI")
+        parser.add_argument('--requests', type=int, default=200, help="Per view and handler, with --compare-handlers")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--compare-connections', action='store_true',
+                            help="Instead: per-request connect overhead, reconnecting vs persistent vs pooled")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The benchmark only runs against its own SQLite database.")
+        dataset = benchmark.Dataset(**{name: options[name] for name in asdict(benchmark.Dataset())})
+        self.prepare(Path(connection.settings_dict['NAME']), dataset, options['reuse'])
+
+        # The test client needs what the test runner sets up (ALLOWED_HOSTS, locmem email...)
+        setup_test_environment(debug=False)
+        try:
+            if options['compare_handlers']:
+                return self.compare_handlers(options)
+            if options['compare_connections']:
+                return self.compare_connections(options)
+            with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+                results = benchmark.run(options['iterations'], options['warmup'], options['views'])
+        finally:
+            teardown_test_environment()
+
+        self.stdout.write(f"{'view':<28}{'queries':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for result in results:
+            self.stdout.write(
+                f"{result.url_name:<28}{f'{result.queries}/{result.budget}':>12}{result.p50_ms:>10.2f}"
+                f"{result.p95_ms:>10.2f}{result.p99_ms:>10.2f}{result.max_ms:>10.2f}"
+            )
+
+        baseline = benchmark.load_baseline(options['baseline'])
+        if baseline is not None and baseline['dataset'] != asdict(dataset):
+            self.stdout.write(self.style.WARNING("Baseline was recorded on another dataset; latency not checked"))
+        failures = benchmark.check(results, baseline, dataset, tolerance=options['tolerance'])
+
+        if options['update_baseline']:
+            if any(result.errors for result in results):
+                raise CommandError("Not updating the baseline while views fail.")
+            benchmark.save_baseline(results, dataset, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            failures = [failure for failure in failures if ' baseline ' not in failure]
+
+        for failure in failures:
+            self.stderr.write(failure)
+        if failures:
+            raise CommandError(f"{len(failures)} benchmark check(s) failed")
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} views within budget"))
+
+    def compare_handlers(self, options):
+        results = benchmark.compare_handlers(
+            options['requests'], options['concurrency'], options['views'] or benchmark.HANDLER_VIEWS,
+        )
+        self.stdout.write(f"{'view':<28}{'handler':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for result in results:
+            self.stdout.write(
+                f"{result['url_name']:<28}{result['handler']:>8}{result['throughput']:>10.1f}"
+                f"{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+            )
+
+    def compare_connections(self, options):
+        results = benchmark.compare_connections(options['requests'], options['views'] or benchmark.CONNECTION_VIEWS)
+        self.stdout.write(f"{'view':<28}{'mode':>12}{'p50 ms':>10}{'connects/req':>14}{'connect ms/req':>16}")
+        for result in results:
+            self.stdout.write(
+                f"{result['url_name']:<28}{result['mode']:>12}{result['p50_ms']:>10.2f}"
+                f"{result['connects']:>14.3f}{result['connect_ms']:>16.3f}"
+            )
+
+    def prepare(self, database, dataset, reuse):
+        marker = Path(f'{database}.json')
+        if reuse and database.exists() and marker.exists() and json.loads(marker.read_text()) == asdict(dataset):
+            self.stdout.write(f"Reusing {database}")
+            return
+
+        connection.close()
+        # Pooled connections would otherwise keep the deleted file open
+        dbpool.reset_pools()
+        database.unlink(missing_ok=True)
+        marker.unlink(missing_ok=True)
+        call_command('migrate', verbosity=0)
+        with connection.cursor() as cursor:
+            # Throwaway database: durability is not worth paying for while seeding
+            cursor.execute('PRAGMA journal_mode=MEMORY')
+            cursor.execute('PRAGMA synchronous=OFF')
+
+        started = time.monotonic()
+        self.stdout.write(f"Seeding {database}: {asdict(dataset)}")
+        benchmark.seed(dataset)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        marker.write_text(json.dumps(asdict(dataset)))
+        self.stdout.write(f"Seeded in {time.monotonic() - started:.1f}s")
@@ -0,0 +1,63 @@
+"""
+Path: bookmyadvocate/main/management/commands/import_advocates.py
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.onboarding import FORMATS, RosterError, import_roster, read_checkpoint
+
+
+class Command(BaseCommand):
+    help = (
+        "Import advocates from a CSV or JSON Lines roster. Columns: bar_council_number, email "
+        "(required), first_name, last_name, phone, password, specialization, experience_years, "
+        "location, bio, consultation_fee. Advocates without a password get an unusable one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('roster')
+        parser.add_argument('--format', choices=FORMATS, help="Default: from the file extension")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Password hashing processes (default: one per CPU)")
+        parser.add_argument('--checkpoint', help="Progress file (default: <roster>.progress)")
+        parser.add_argument('--restart', action='store_true',
+                            help="Ignore an existing checkpoint and start from the first row")
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint'] or f"{options['roster']}.progress"
+        started = time.monotonic()
+        reported = 0
+
+        def progress(stats):
+            nonlocal reported
+            for number, error in stats.errors[reported:]:
+                self.stderr.write(f"Row {number}: {error}")
+            reported = len(stats.errors)
+            rate = stats.rows / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f"Row {stats.last_row}: {stats.created} created, {stats.duplicates} duplicates, "
+                f"{stats.invalid} invalid ({rate:.0f} rows/s)"
+            )
+
+        try:
+            done = 0 if options['restart'] else read_checkpoint(checkpoint, options['roster'])
+            if done:
+                self.stdout.write(f"Resuming after row {done}")
+            stats = import_roster(
+                options['roster'],
+                fmt=options['format'],
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                checkpoint=checkpoint,
+                resume=not options['restart'],
+                progress=progress,
+            )
+        except (OSError, RosterError) as error:
+            raise CommandError(error)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats.created} advocates ({stats.duplicates} duplicates, {stats.invalid} invalid) "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
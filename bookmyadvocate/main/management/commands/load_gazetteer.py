@@ -0,0 +1,24 @@
+"""
+Path: bookmyadvocate/main/management/commands/load_gazetteer.py
+"""
+from django.core.management.base import BaseCommand
+
+from main import geo
+
+
+class Command(BaseCommand):
+    help = (
+        "Add or update localities from a gazetteer CSV (default: the bundled Indian one) and resolve every "
+        "advocate's location again. Restart the app servers afterwards: each caches the gazetteer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=str(geo.GAZETTEER_PATH))
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        created, updated = geo.load_gazetteer(options['file'])
+        relinked = geo.relink_profiles(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{created} localities added, {updated} updated; {relinked} advocates moved to another locality"
+        ))
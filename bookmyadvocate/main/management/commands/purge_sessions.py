@@ -0,0 +1,18 @@
+"""
+Path: bookmyadvocate/main/management/commands/purge_sessions.py
+"""
+from django.core.management.base import BaseCommand
+
+from main.sessions import purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = "Delete expired sessions in small batches (a lock-friendly clearsessions)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.0, help="Seconds to wait between batches")
+
+    def handle(self, *args, **options):
+        purged = purge_expired_sessions(batch_size=options['batch_size'], pause=options['pause'])
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} expired sessions"))
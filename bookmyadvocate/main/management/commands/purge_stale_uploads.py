@@ -0,0 +1,19 @@
+"""
+Path: bookmyadvocate/main/management/commands/purge_stale_uploads.py
+"""
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from main.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads that have made no progress for a while"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=48)
+
+    def handle(self, *args, **options):
+        purged = purge_stale_uploads(datetime.timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} stale uploads"))
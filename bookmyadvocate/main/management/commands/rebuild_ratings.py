@@ -0,0 +1,17 @@
+"""
+Path: bookmyadvocate/main/management/commands/rebuild_ratings.py
+"""
+from django.core.management.base import BaseCommand
+
+from main.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute advocate rating counters from Review to repair drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        repaired = rebuild_ratings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Repaired {repaired} advocate profiles"))
@@ -0,0 +1,19 @@
+"""
+Path: bookmyadvocate/main/management/commands/rebuild_search_index.py
+"""
+from django.core.management.base import BaseCommand
+
+from main.facets import recount
+from main.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the advocate search index (and its facet counts) from User and AdvocateProfile"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index(batch_size=options['batch_size'])
+        recount()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} advocates"))
@@ -0,0 +1,20 @@
+"""
+Path: bookmyadvocate/main/management/commands/regenerate_thumbnails.py
+"""
+from django.core.management.base import BaseCommand
+
+from main.thumbnails import regenerate
+
+
+class Command(BaseCommand):
+    help = "Generate the resized variants of every profile picture"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--missing', action='store_true', help="Only pictures that have no variants yet")
+
+    def handle(self, *args, **options):
+        generated, unreadable = regenerate(batch_size=options['batch_size'], missing_only=options['missing'])
+        if unreadable:
+            self.stderr.write(self.style.WARNING(f"{unreadable} pictures could not be read"))
+        self.stdout.write(self.style.SUCCESS(f"Generated thumbnails for {generated} profile pictures"))
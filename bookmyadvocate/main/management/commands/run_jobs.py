@@ -0,0 +1,36 @@
+"""
+Path: bookmyadvocate/main/management/commands/run_jobs.py
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs from the database queue. Several workers can share a MySQL or PostgreSQL "
+        "database; run a single one on SQLite."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when no job is due")
+        parser.add_argument('--batch-size', type=int, default=100, help="Jobs claimed at a time")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when the queue is empty")
+
+    def handle(self, *args, **options):
+        last_purge = 0.0
+        while True:
+            close_old_connections()
+            claimed = jobs.work_off(options['batch_size'])
+            if claimed:
+                self.stdout.write(f"Ran {claimed} jobs")
+            if time.monotonic() - last_purge > 3600:
+                jobs.purge()
+                last_purge = time.monotonic()
+            if options['once']:
+                return
+            if not claimed:
+                time.sleep(options['sleep'])
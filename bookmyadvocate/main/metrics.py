@@ -0,0 +1,324 @@
+"""
+Path: bookmyadvocate/main/metrics.py
+Per-view request metrics in Prometheus text format.
+
+metrics_middleware times every request and labels it with the URL name it
+resolved to. While a request runs, a context variable collects its SQL query
+count and time (from a database execute wrapper installed on every
+connection) and its template render time (from the DjangoTemplates backend
+below). Context variables follow the request into sync_to_async threads, so
+async views are measured too.
+
+Each process keeps its numbers in memory. With METRICS_DIR set, it also writes
+them to its own file there at most every METRICS_FLUSH_INTERVAL seconds, and
+the metrics view adds up the files of all processes, so any worker can answer
+a scrape for the whole server. Clear METRICS_DIR when deploying.
+"""
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+from django.utils.decorators import sync_and_async_middleware
+
+from . import hashing
+
+PREFIX = 'bookmyadvocate'
+# Seconds; Prometheus' default buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+HELP = {
+    'request_duration_seconds': ('histogram', "Request latency by URL name"),
+    'responses_total': ('counter', "Responses by URL name and status code"),
+    'db_queries_total': ('counter', "SQL queries run while handling requests"),
+    'db_query_seconds_total': ('counter', "Time spent in SQL queries"),
+    'template_render_seconds': ('histogram', "Template render time per request (includes lazy queries)"),
+    'password_hashing_completed_total': ('counter', "Password hashes computed on the hashing pool"),
+    'password_hashing_rejected_total': ('counter', "Password hashes refused because the pool was full"),
+    'password_hashing_pending': ('gauge', "Password hashes running or waiting on the hashing pool"),
+    'password_hashing_queued': ('gauge', "Password hashes waiting for a free hashing thread"),
+}
+
+
+# -------------------------
+# REGISTRY
+# -------------------------
+class Registry:
+    """Counters and histograms keyed by (metric name, label pairs).
+
+    Gauges are read when a snapshot is taken rather than kept here.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.counters = defaultdict(float)
+            # Per-bucket (not cumulative) counts, then sum and count
+            self.histograms = defaultdict(lambda: [0] * len(BUCKETS) + [0.0, 0])
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[name, labels] += value
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            histogram = self.histograms[name, labels]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self.counters.items()]
+            histograms = [[name, list(labels), list(values)] for (name, labels), values in self.histograms.items()]
+        stats = hashing.stats()
+        counters.append(['password_hashing_completed_total', [], stats['completed']])
+        counters.append(['password_hashing_rejected_total', [], stats['rejected']])
+        gauges = [
+            ['password_hashing_pending', [], stats['pending']],
+            ['password_hashing_queued', [], stats['queued']],
+        ]
+        return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+
+registry = Registry()
+_process_key = f'{os.getpid()}-{time.time_ns()}'
+_last_flush = 0.0
+
+
+def _forked():
+    # A forked worker must not report its parent's requests as its own
+    global _process_key, _last_flush
+    registry.lock = threading.Lock()
+    registry.clear()
+    _process_key = f'{os.getpid()}-{time.time_ns()}'
+    _last_flush = 0.0
+
+
+os.register_at_fork(after_in_child=_forked)
+
+
+# -------------------------
+# MULTI-PROCESS AGGREGATION
+# -------------------------
+def metrics_dir():
+    directory = getattr(settings, 'METRICS_DIR', None)
+    return Path(directory) if directory else None
+
+
+def flush(force=False):
+    """Write this process's metrics to METRICS_DIR (at most every METRICS_FLUSH_INTERVAL seconds)."""
+    global _last_flush
+    directory = metrics_dir()
+    now = time.monotonic()
+    if directory is None or (not force and now - _last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)):
+        return
+    _last_flush = now
+    directory.mkdir(parents=True, exist_ok=True)
+    temporary = directory / f'.{_process_key}.tmp'
+    temporary.write_text(json.dumps(registry.snapshot()))
+    os.replace(temporary, directory / f'{_process_key}.json')
+
+
+atexit.register(flush, force=True)
+
+
+def collect():
+    """Snapshots of every process (just this one without METRICS_DIR)."""
+    directory = metrics_dir()
+    if directory is None:
+        return [registry.snapshot()]
+    flush(force=True)
+    snapshots = []
+    for path in directory.glob('*.json'):
+        try:
+            snapshots.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs, extra=()):
+    pairs = [*pairs, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(snapshots):
+    """Sum process snapshots and render them in the Prometheus text format.
+
+    Gauges are added up too: the server's queue depth is the sum of its processes'.
+    """
+    counters = defaultdict(float)
+    histograms = defaultdict(lambda: [0] * len(BUCKETS) + [0.0, 0])
+    for snapshot in snapshots:
+        # Files written before gauges were exported have none
+        for name, labels, value in [*snapshot['counters'], *snapshot.get('gauges', ())]:
+            counters[name, tuple(map(tuple, labels))] += value
+        for name, labels, values in snapshot['histograms']:
+            merged = histograms[name, tuple(map(tuple, labels))]
+            for i, value in enumerate(values):
+                merged[i] += value
+
+    lines = []
+    for name, (kind, description) in HELP.items():
+        lines += [f'# HELP {PREFIX}_{name} {description}', f'# TYPE {PREFIX}_{name} {kind}']
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{PREFIX}_{name}{_labels(labels)} {_number(value)}')
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, values):
+                cumulative += count
+                lines.append(f'{PREFIX}_{name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{PREFIX}_{name}_bucket{_labels(labels, [("le", "+Inf")])} {values[-1]}')
+            lines.append(f'{PREFIX}_{name}_sum{_labels(labels)} {_number(values[-2])}')
+            lines.append(f'{PREFIX}_{name}_count{_labels(labels)} {values[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+# -------------------------
+# REQUEST INSTRUMENTATION
+# -------------------------
+class RequestStats:
+    __slots__ = ('queries', 'query_seconds', 'template_seconds', 'templates')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+        self.templates = 0
+
+
+_current = contextvars.ContextVar('metrics_request_stats', default=None)
+
+
+def _time_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - started
+
+
+def _instrument(connection):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    _instrument(connection)
+
+
+def _start():
+    # Connections opened before this module was imported have no wrapper yet
+    for connection in connections.all(initialized_only=True):
+        _instrument(connection)
+    return _current.set(RequestStats()), time.perf_counter()
+
+
+def _finish(request, token, started, status):
+    elapsed = time.perf_counter() - started
+    stats = _current.get()
+    _current.reset(token)
+
+    match = getattr(request, 'resolver_match', None)
+    # Unresolved paths share one label so that random 404s cannot blow up the series count
+    view = ('view', match.view_name if match else 'unmatched')
+    method = ('method', request.method if request.method in METHODS else 'other')
+    registry.observe('request_duration_seconds', (method, view), elapsed)
+    registry.inc('responses_total', (('status', status), view))
+    if stats.queries:
+        registry.inc('db_queries_total', (view,), stats.queries)
+        registry.inc('db_query_seconds_total', (view,), stats.query_seconds)
+    if stats.templates:
+        registry.observe('template_render_seconds', (view,), stats.template_seconds)
+    flush()
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token, started = _start()
+            status = 500
+            try:
+                response = await get_response(request)
+                status = response.status_code
+                return response
+            finally:
+                _finish(request, token, started, status)
+    else:
+        def middleware(request):
+            token, started = _start()
+            status = 500
+            try:
+                response = get_response(request)
+                status = response.status_code
+                return response
+            finally:
+                _finish(request, token, started, status)
+    return middleware
+
+
+# -------------------------
+# TEMPLATE BACKEND (times render())
+# -------------------------
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.templates += 1
+            stats.template_seconds += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The stock Django backend, with render time recorded for metrics."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def add_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            'ALTER TABLE main_advocatesearchindex ADD FULLTEXT INDEX main_search_document_ft (document)'
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE main_advocatesearchindex DROP INDEX main_search_document_ft')
+
+
+def backfill_index(apps, schema_editor):
+    from main.search import rebuild_index
+
+    rebuild_index(
+        user_model=apps.get_model('main', 'User'),
+        index_model=apps.get_model('main', 'AdvocateSearchIndex'),
+        term_model=apps.get_model('main', 'AdvocateSearchTerm'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_remove_advocateprofile_bar_council_number_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdvocateSearchIndex',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('document', models.TextField(blank=True)),
+                ('specialization', models.CharField(blank=True, max_length=150)),
+                ('experience_years', models.PositiveIntegerField(default=0)),
+                ('consultation_fee', models.DecimalField(decimal_places=2, default=500.0, max_digits=10)),
+                ('rating', models.DecimalField(decimal_places=2, default=0.0, max_digits=3)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['specialization', 'consultation_fee'], name='main_search_spec_fee_idx'), models.Index(fields=['consultation_fee'], name='main_search_fee_idx'), models.Index(fields=['experience_years'], name='main_search_experience_idx'), models.Index(fields=['rating', 'user'], name='main_search_rating_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AdvocateSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('advocate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'advocate', 'weight'], name='main_search_term_lookup_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='advocatesearchterm',
+            constraint=models.UniqueConstraint(fields=('advocate', 'term'), name='main_search_term_unique'),
+        ),
+        migrations.RunPython(add_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(backfill_index, migrations.RunPython.noop),
+    ]
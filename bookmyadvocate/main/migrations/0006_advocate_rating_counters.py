@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:06
+
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    from main.ratings import rebuild_ratings
+
+    rebuild_ratings(
+        profile_model=apps.get_model('main', 'AdvocateProfile'),
+        review_model=apps.get_model('main', 'Review'),
+        index_model=apps.get_model('main', 'AdvocateSearchIndex'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_booking_client_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advocateprofile',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='advocateprofile',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
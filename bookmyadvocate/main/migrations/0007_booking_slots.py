@@ -0,0 +1,63 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def claim_existing_slots(apps, schema_editor):
+    Booking = apps.get_model('main', 'Booking')
+    BookingSlot = apps.get_model('main', 'BookingSlot')
+    live = Booking.objects.exclude(status__in=['rejected', 'cancelled']).order_by('created_at', 'id')
+    # Existing double bookings keep their first claim only
+    BookingSlot.objects.bulk_create(
+        (
+            BookingSlot(booking_id=booking.id, advocate_id=booking.advocate_id, date=booking.date, time=booking.time)
+            for booking in live.iterator()
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_advocate_rating_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('advocate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('booking', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='slot', to='main.booking')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AdvocateAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('slot_minutes', models.PositiveSmallIntegerField(default=30)),
+                ('advocate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['weekday', 'start_time'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bookingslot',
+            constraint=models.UniqueConstraint(fields=('advocate', 'date', 'time'), name='main_booking_slot_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='advocateavailability',
+            index=models.Index(fields=['advocate', 'weekday'], name='main_availability_day_idx'),
+        ),
+        migrations.RunPython(claim_existing_slots, migrations.RunPython.noop),
+    ]
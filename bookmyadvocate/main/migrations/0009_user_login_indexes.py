@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_chunked_document_uploads'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'email'], name='main_user_role_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'bar_council_number'], name='main_user_role_bcn_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_user_login_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['client', 'created_at'], name='main_booking_client_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['advocate', 'created_at'], name='main_booking_advocate_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['advocate', 'status', 'created_at'], name='main_booking_adv_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['advocate', 'date', 'time'], name='main_booking_adv_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['booking', 'uploaded_at'], name='main_document_booking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['advocate', 'created_at'], name='main_review_advocate_new_idx'),
+        ),
+    ]
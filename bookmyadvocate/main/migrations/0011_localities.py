@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def load_localities(apps, schema_editor):
+    from main.geo import load_gazetteer, relink_profiles
+
+    Locality = apps.get_model('main', 'Locality')
+    load_gazetteer(locality_model=Locality)
+    relink_profiles(
+        profile_model=apps.get_model('main', 'AdvocateProfile'),
+        locality_model=Locality,
+        index_model=apps.get_model('main', 'AdvocateSearchIndex'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Locality',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('state', models.CharField(max_length=100)),
+                ('aliases', models.CharField(blank=True, max_length=255)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+            ],
+            options={
+                'verbose_name_plural': 'localities',
+            },
+        ),
+        migrations.AddField(
+            model_name='advocatesearchindex',
+            name='geohash',
+            field=models.CharField(blank=True, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='advocatesearchindex',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='advocatesearchindex',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='advocatesearchindex',
+            index=models.Index(fields=['geohash', 'latitude', 'longitude'], name='main_search_geohash_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='locality',
+            constraint=models.UniqueConstraint(fields=('name', 'state'), name='main_locality_unique'),
+        ),
+        migrations.AddField(
+            model_name='advocateprofile',
+            name='locality',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='advocates', to='main.locality'),
+        ),
+        migrations.RunPython(load_localities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:39
+
+from django.db import migrations, models
+
+
+def backfill_histogram(apps, schema_editor):
+    from main.ratings import rebuild_ratings
+
+    rebuild_ratings(
+        profile_model=apps.get_model('main', 'AdvocateProfile'),
+        review_model=apps.get_model('main', 'Review'),
+        index_model=apps.get_model('main', 'AdvocateSearchIndex'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_localities'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advocateprofile',
+            name='stars_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='advocateprofile',
+            name='stars_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='advocateprofile',
+            name='stars_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='advocateprofile',
+            name='stars_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='advocateprofile',
+            name='stars_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_histogram, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:43
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def count_cases(apps, schema_editor):
+    # total_cases was never maintained before the cases.count job
+    Booking = apps.get_model('main', 'Booking')
+    AdvocateProfile = apps.get_model('main', 'AdvocateProfile')
+    counts = (
+        Booking.objects.filter(status='completed')
+        .values('advocate_id').annotate(cases=models.Count('id')).values_list('advocate_id', 'cases')
+    )
+    for advocate_id, cases in counts.iterator():
+        AdvocateProfile.objects.filter(user_id=advocate_id).update(total_cases=cases)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_review_histogram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=100)),
+                ('payload', models.JSONField(default=dict)),
+                ('key', models.CharField(blank=True, max_length=200, null=True, unique=True)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='main_job_due_idx')],
+            },
+        ),
+        migrations.RunPython(count_cases, migrations.RunPython.noop),
+    ]
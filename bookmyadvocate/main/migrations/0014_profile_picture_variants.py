@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:49
+
+from django.db import migrations, models
+
+
+def queue_thumbnails(apps, schema_editor):
+    # Existing pictures get their variants from the job worker, like new uploads
+    User = apps.get_model('main', 'User')
+    Job = apps.get_model('main', 'Job')
+    pictures = User.objects.exclude(profile_picture='').exclude(profile_picture=None).values_list('pk', 'profile_picture')
+    Job.objects.bulk_create(
+        (Job(kind='thumbnails.generate', payload={'user_id': pk}, key=f'thumbnails:{pk}:{name}')
+         for pk, name in pictures.iterator()),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='profile_picture_variants',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(queue_thumbnails, migrations.RunPython.noop),
+    ]
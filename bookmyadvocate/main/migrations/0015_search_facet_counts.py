@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:13
+
+from django.db import migrations, models
+
+
+def count_facets(apps, schema_editor):
+    from main.facets import recount
+
+    recount(
+        index_model=apps.get_model('main', 'AdvocateSearchIndex'),
+        count_model=apps.get_model('main', 'AdvocateFacetCount'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_profile_picture_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdvocateFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('specialization', models.CharField(blank=True, max_length=150)),
+                ('fee_band', models.PositiveSmallIntegerField()),
+                ('experience_band', models.PositiveSmallIntegerField()),
+                ('advocates', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='advocatefacetcount',
+            constraint=models.UniqueConstraint(fields=('specialization', 'fee_band', 'experience_band'), name='main_facet_count_unique'),
+        ),
+        migrations.RunPython(count_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:31
+
+from django.db import migrations, models
+
+import main.models
+
+
+def issue_tokens(apps, schema_editor):
+    # One token per user: the callable default only runs once for AddField
+    User = apps.get_model('main', 'User')
+    users = list(User.objects.filter(calendar_token=None).only('pk'))
+    for user in users:
+        user.calendar_token = main.models.new_calendar_token()
+    User.objects.bulk_update(users, ['calendar_token'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_search_facet_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='calendar_token',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(issue_tokens, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='user',
+            name='calendar_token',
+            field=models.CharField(default=main.models.new_calendar_token, editable=False, max_length=64, unique=True),
+        ),
+    ]
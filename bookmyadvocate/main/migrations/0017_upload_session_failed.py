@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_calendar_feed_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='failed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -2,10 +2,18 @@
 Path: bookmyadvocate/main/models.py
 FIXED: Bar Council Number as unique identifier for advocates
 """
+import secrets
+import uuid
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils import timezone
 
+
+def new_calendar_token():
+    return secrets.token_urlsafe(32)
+
+
 class User(AbstractUser):
     ROLE_CHOICES = (
         ('client', 'Client'),
@@ -15,14 +23,45 @@ class User(AbstractUser):
     is_active_advocate = models.BooleanField(default=False)
     phone = models.CharField(max_length=15, blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profiles/', blank=True, null=True)
+    # The picture whose resized variants are stored (see main/thumbnails.py)
+    profile_picture_variants = models.CharField(max_length=100, blank=True, editable=False)
     
     # ADDED: Bar Council Number for advocates (unique identifier)
     bar_council_number = models.CharField(max_length=100, blank=True, null=True, unique=True)
 
+    # Secret part of the booking calendar feed URL (see main/ical.py)
+    calendar_token = models.CharField(max_length=64, unique=True, default=new_calendar_token, editable=False)
+
+    class Meta(AbstractUser.Meta):
+        # Login looks users up by role plus email or Bar Council Number
+        indexes = [
+            models.Index(fields=['role', 'email'], name='main_user_role_email_idx'),
+            models.Index(fields=['role', 'bar_council_number'], name='main_user_role_bcn_idx'),
+        ]
+
     def __str__(self):
         return f"{self.username} ({self.role})"
 
 
+class Locality(models.Model):
+    """A city or locality of the bundled gazetteer (see main/geo.py)."""
+    name = models.CharField(max_length=100)
+    state = models.CharField(max_length=100)
+    # Other names it goes by, separated by "|"
+    aliases = models.CharField(max_length=255, blank=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    class Meta:
+        verbose_name_plural = 'localities'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'state'], name='main_locality_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.name}, {self.state}"
+
+
 class AdvocateProfile(models.Model):
     SPECIALIZATION_CHOICES = [
         ('criminal', 'Criminal Law'),
@@ -40,15 +79,98 @@ class AdvocateProfile(models.Model):
     specialization = models.CharField(max_length=150, choices=SPECIALIZATION_CHOICES, blank=True)
     experience_years = models.PositiveIntegerField(default=0)
     location = models.CharField(max_length=150, blank=True)
+    # Resolved from location whenever it is saved
+    locality = models.ForeignKey(Locality, on_delete=models.SET_NULL, null=True, blank=True, related_name='advocates')
     bio = models.TextField(blank=True)
     consultation_fee = models.DecimalField(max_digits=10, decimal_places=2, default=500.00)
+    # Average of rating_sum / rating_count, kept current by main/ratings.py
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    # Number of reviews giving each star rating, for the histogram on the profile page
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
     total_cases = models.PositiveIntegerField(default=0)
     
+    @property
+    def rating_histogram(self):
+        """(stars, reviews, percent of all reviews), from 5 stars down to 1."""
+        histogram = []
+        for stars in range(5, 0, -1):
+            count = getattr(self, f'stars_{stars}')
+            histogram.append((stars, count, round(100 * count / self.rating_count) if self.rating_count else 0))
+        return histogram
+
     def __str__(self):
         return f"{self.user.username} - {self.get_specialization_display()}"
 
 
+class AdvocateSearchIndex(models.Model):
+    """Denormalized search row for an active advocate (see main/search.py)."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='search_index')
+    document = models.TextField(blank=True)
+    specialization = models.CharField(max_length=150, blank=True)
+    experience_years = models.PositiveIntegerField(default=0)
+    consultation_fee = models.DecimalField(max_digits=10, decimal_places=2, default=500.00)
+    rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    # Coordinates of the advocate's locality; blank geohash when it is unknown
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['specialization', 'consultation_fee'], name='main_search_spec_fee_idx'),
+            models.Index(fields=['consultation_fee'], name='main_search_fee_idx'),
+            models.Index(fields=['experience_years'], name='main_search_experience_idx'),
+            models.Index(fields=['rating', 'user'], name='main_search_rating_idx'),
+            # Covers radius searches: geohash prefix ranges, then distances from the coordinates
+            models.Index(fields=['geohash', 'latitude', 'longitude'], name='main_search_geohash_idx'),
+        ]
+
+    def __str__(self):
+        return f"Search index for {self.user_id}"
+
+
+class AdvocateSearchTerm(models.Model):
+    """One weighted token of an advocate's search document (inverted index)."""
+    term = models.CharField(max_length=64)
+    advocate = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['advocate', 'term'], name='main_search_term_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['term', 'advocate', 'weight'], name='main_search_term_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.advocate_id} ({self.weight})"
+
+
+class AdvocateFacetCount(models.Model):
+    """Listed advocates per (specialization, fee band, experience band), for search facets (see main/facets.py)."""
+    specialization = models.CharField(max_length=150, blank=True)
+    fee_band = models.PositiveSmallIntegerField()
+    experience_band = models.PositiveSmallIntegerField()
+    advocates = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['specialization', 'fee_band', 'experience_band'],
+                                    name='main_facet_count_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.specialization}/{self.fee_band}/{self.experience_band}: {self.advocates}"
+
+
 class AdvocateRegistrationPayment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     razorpay_order_id = models.CharField(max_length=200, null=True, blank=True)
@@ -62,6 +184,21 @@ class AdvocateRegistrationPayment(models.Model):
         return f"{self.user.username} - {self.payment_status}"
 
 
+class BookingQuerySet(models.QuerySet):
+    def status_counts(self, **extra):
+        """Total and per-status booking counts, in a single aggregate query.
+
+        Each keyword argument adds one more count, of the bookings matching
+        the given Q object.
+        """
+        conditions = {status: models.Q(status=status) for status, _ in Booking.STATUS}
+        conditions.update(extra)
+        return self.aggregate(
+            total=models.Count('id'),
+            **{name: models.Count('id', filter=condition) for name, condition in conditions.items()},
+        )
+
+
 class Booking(models.Model):
     STATUS = [
         ('pending', 'Pending'),
@@ -82,21 +219,119 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = BookingQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        # One index per dashboard access path; keyset pages sort by (created_at, id)
+        indexes = [
+            models.Index(fields=['client', 'date', 'time'], name='main_booking_client_date_idx'),
+            models.Index(fields=['client', 'created_at'], name='main_booking_client_new_idx'),
+            models.Index(fields=['advocate', 'created_at'], name='main_booking_advocate_new_idx'),
+            models.Index(fields=['advocate', 'status', 'created_at'], name='main_booking_adv_status_idx'),
+            models.Index(fields=['advocate', 'date', 'time'], name='main_booking_adv_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.client.username} -> {self.advocate.username} on {self.date}"
 
 
+class AdvocateAvailability(models.Model):
+    """A block of weekly working hours, split into bookable slots."""
+    WEEKDAYS = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+    
+    advocate = models.ForeignKey(User, on_delete=models.CASCADE, related_name='availability')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAYS)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=30)
+    
+    class Meta:
+        ordering = ['weekday', 'start_time']
+        indexes = [
+            models.Index(fields=['advocate', 'weekday'], name='main_availability_day_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.advocate.username} {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
+
+class BookingSlot(models.Model):
+    """Claims an advocate's date/time for one live booking.
+
+    The unique constraint is what stops double-booking: two concurrent
+    requests for the same slot cannot both insert their claim.
+    """
+    booking = models.OneToOneField(Booking, on_delete=models.CASCADE, related_name='slot')
+    advocate = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    time = models.TimeField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['advocate', 'date', 'time'], name='main_booking_slot_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.advocate_id} {self.date} {self.time}"
+
+
+class DocumentBlob(models.Model):
+    """Stored file content, addressed by its digest and shared by every Document with the same bytes."""
+    address = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(upload_to='blobs/')
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.address} ({self.size} bytes)"
+
+
+class UploadSession(models.Model):
+    """A chunked document upload in progress (see main/uploads.py)."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='upload_sessions')
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    # Hex SHA-256 of every chunk received so far, in order
+    chunk_digests = models.TextField(blank=True)
+    # Its partial file was lost: it cannot be resumed and must start over
+    failed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.filename} {self.received}/{self.size}"
+
+
 class Document(models.Model):
     booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='documents')
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    # New uploads point file at their blob's storage path
     file = models.FileField(upload_to='documents/')
+    blob = models.ForeignKey(DocumentBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='documents')
+    filename = models.CharField(max_length=255, blank=True)
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['booking', 'uploaded_at'], name='main_document_booking_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.title} - {self.booking}"
 
@@ -109,5 +344,40 @@ class Review(models.Model):
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['advocate', 'created_at'], name='main_review_advocate_new_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.client.username} rated {self.advocate.username} - {self.rating}/5"
+
+
+class Job(models.Model):
+    """A unit of background work, run by ``manage.py run_jobs`` (see main/jobs.py)."""
+    STATUS = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # Enqueueing with a key that is already here (until done jobs are purged) does nothing
+    key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # When a queued job is due; for a running one, when its worker's lease runs out
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='main_job_due_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.client.username} rated {self.advocate.username} - {self.rating}/5"
\ No newline at end of file
+        return f"{self.kind} #{self.pk} ({self.status})"
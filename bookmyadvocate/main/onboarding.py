@@ -0,0 +1,311 @@
+"""
+Path: bookmyadvocate/main/onboarding.py
+Bulk import of advocate rosters (CSV or JSON Lines).
+
+Rows are read as a stream and handled in batches. Each batch is checked for
+duplicates (username, Bar Council Number or email, both within the roster and
+against existing users, ignoring case as MySQL's unique indexes do) with one
+query; duplicates are reported and skipped. Its passwords are hashed on a
+process pool while the previous batch is being written, and its users,
+profiles and search index entries are inserted with bulk_create in a single
+transaction.
+
+After every committed batch the number of roster rows handled is written to a
+checkpoint file, so an interrupted import picks up where it stopped. Re-running
+without the checkpoint is safe too: rows already imported count as duplicates.
+"""
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from . import geo, search, showcase, tasks
+from .models import AdvocateProfile, User
+
+FORMATS = ('csv', 'jsonl')
+SPECIALIZATIONS = dict(AdvocateProfile.SPECIALIZATION_CHOICES)
+
+
+class RosterError(ValueError):
+    pass
+
+
+@dataclass
+class ImportStats:
+    resumed_from: int = 0
+    last_row: int = 0
+    rows: int = 0
+    created: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    errors: list = field(default_factory=list)
+
+
+# -------------------------
+# READING
+# -------------------------
+def roster_format(path, fmt=None):
+    fmt = fmt or Path(path).suffix.lstrip('.').lower()
+    if fmt == 'json':
+        fmt = 'jsonl'
+    if fmt not in FORMATS:
+        raise RosterError(f"Unknown roster format {fmt!r}; use one of {', '.join(FORMATS)}.")
+    return fmt
+
+
+def read_roster(path, fmt=None):
+    """Yield (row number, row) pairs; row is None for lines that are not JSON objects."""
+    fmt = roster_format(path, fmt)
+    with open(path, newline='', encoding='utf-8-sig') as roster:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(roster), start=1):
+                yield number, row
+            return
+        for number, line in enumerate(roster, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else None
+
+
+def _text(row, name, max_length=None):
+    value = row.get(name)
+    value = '' if value is None else str(value).strip()
+    if max_length and len(value) > max_length:
+        raise RosterError(f"{name} is longer than {max_length} characters")
+    return value
+
+
+def clean_row(row):
+    """Return (user fields, raw password or None, profile fields) for one roster row."""
+    if row is None:
+        raise RosterError("not a JSON object")
+
+    bar_council_number = _text(row, 'bar_council_number', 100)
+    email = _text(row, 'email', 254)
+    if not bar_council_number or not email:
+        raise RosterError("bar_council_number and email are required")
+    try:
+        validate_email(email)
+    except ValidationError:
+        raise RosterError(f"invalid email {email!r}")
+
+    specialization = _text(row, 'specialization').lower()
+    if specialization and specialization not in SPECIALIZATIONS:
+        raise RosterError(f"unknown specialization {specialization!r}")
+    try:
+        experience_years = int(_text(row, 'experience_years') or 0)
+        consultation_fee = Decimal(_text(row, 'consultation_fee') or '500.00')
+    except (ValueError, InvalidOperation):
+        raise RosterError("experience_years and consultation_fee must be numbers")
+    if experience_years < 0 or not 0 <= consultation_fee < Decimal('1e8'):
+        raise RosterError("experience_years and consultation_fee must not be negative")
+
+    user = {
+        'username': bar_council_number,
+        'bar_council_number': bar_council_number,
+        'email': User.objects.normalize_email(email),
+        'first_name': _text(row, 'first_name', 150),
+        'last_name': _text(row, 'last_name', 150),
+        'phone': _text(row, 'phone', 15),
+    }
+    profile = {
+        'specialization': specialization,
+        'experience_years': experience_years,
+        'location': _text(row, 'location', 150),
+        'bio': _text(row, 'bio'),
+        'consultation_fee': consultation_fee.quantize(Decimal('0.01')),
+    }
+    return user, _text(row, 'password') or None, profile
+
+
+# -------------------------
+# CHECKPOINTS
+# -------------------------
+def _fingerprint(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def read_checkpoint(checkpoint, path):
+    """Rows already imported from *path*, or 0 if the checkpoint is missing or for another file."""
+    try:
+        saved = json.loads(Path(checkpoint).read_text())
+    except (OSError, ValueError):
+        return 0
+    if saved.get('roster') != _fingerprint(path):
+        return 0
+    return saved.get('rows', 0)
+
+
+def write_checkpoint(checkpoint, path, rows):
+    temporary = Path(f'{checkpoint}.tmp')
+    temporary.write_text(json.dumps({'roster': _fingerprint(path), 'rows': rows}))
+    os.replace(temporary, checkpoint)
+
+
+# -------------------------
+# IMPORTING
+# -------------------------
+def _init_worker():
+    # Spawned (non-forked) workers start without Django configured
+    django.setup()
+
+
+@dataclass
+class _Batch:
+    last_row: int
+    users: list
+    profiles: list
+    hashes: object
+
+
+# Compared lower-cased: a username differing only in case still collides in MySQL
+UNIQUE_FIELDS = ('username', 'bar_council_number', 'email')
+
+
+def _keys(user):
+    return {user[name].lower() for name in UNIQUE_FIELDS}
+
+
+def _existing(keys):
+    """The lower-cased usernames, Bar Council Numbers and emails among *keys* already taken."""
+    if connection.vendor == 'mysql':
+        # Its collations already ignore case, and plain lookups keep to the indexes
+        users, lookups = User.objects.all(), UNIQUE_FIELDS
+    else:
+        lookups = [f'{name}_lower' for name in UNIQUE_FIELDS]
+        users = User.objects.alias(**{lookup: Lower(name) for lookup, name in zip(lookups, UNIQUE_FIELDS)})
+    q = Q()
+    for lookup in lookups:
+        q |= Q(**{f'{lookup}__in': keys})
+    return {value.lower() for row in users.filter(q).values_list(*UNIQUE_FIELDS) for value in row if value}
+
+
+def _prepare(rows, stats, seen, hash_passwords):
+    """Validate and de-duplicate a batch and start hashing its passwords."""
+    cleaned = []
+    for number, row in rows:
+        try:
+            cleaned.append((number, *clean_row(row)))
+        except RosterError as error:
+            stats.invalid += 1
+            stats.errors.append((number, str(error)))
+
+    taken = _existing(set().union(*(_keys(user) for _, user, _, _ in cleaned)))
+    users, passwords, profiles = [], [], []
+    for number, user, password, profile in cleaned:
+        keys = _keys(user)
+        if keys & taken or keys & seen:
+            stats.duplicates += 1
+            where = 'an existing user' if keys & taken else 'an earlier row'
+            stats.errors.append((number, f"{user['bar_council_number']} or {user['email']} is taken by {where}"))
+            continue
+        seen.update(keys)
+        users.append(user)
+        passwords.append(password)
+        profiles.append(profile)
+
+    return _Batch(rows[-1][0], users, profiles, hash_passwords(passwords))
+
+
+def _insert(batch):
+    users = [
+        User(role='advocate', is_active=True, is_active_advocate=True, password=password, **fields)
+        for fields, password in zip(batch.users, batch.hashes)
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        # MySQL does not hand back primary keys from bulk inserts
+        ids = dict(
+            User.objects.filter(bar_council_number__in=[user.bar_council_number for user in users])
+            .values_list('bar_council_number', 'id')
+        )
+        # bulk_create skips the signal that resolves locations
+        places = geo.gazetteer()
+        profiles = []
+        for user, fields in zip(users, batch.profiles):
+            user.pk = ids[user.bar_council_number]
+            profiles.append(AdvocateProfile(user=user, locality=places.find(fields['location']), **fields))
+        AdvocateProfile.objects.bulk_create(profiles)
+        search.bulk_index(zip(users, profiles), len(users))
+        tasks.search_index_changed()
+    return len(users)
+
+
+def _batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_roster(path, *, fmt=None, batch_size=1000, workers=None, checkpoint=None, resume=True,
+                  progress=None):
+    """Import the advocates in the roster at *path* and return ImportStats.
+
+    *workers* is the number of hashing processes (default: one per CPU; 0 or 1
+    hashes in this process). With a *checkpoint* path progress is recorded
+    after each batch and, if *resume* is true, rows recorded there as done are
+    skipped. *progress* is called with the stats after each committed batch.
+    """
+    stats = ImportStats()
+    if checkpoint and resume:
+        stats.resumed_from = stats.last_row = read_checkpoint(checkpoint, path)
+    workers = os.cpu_count() if workers is None else workers
+    pool = ProcessPoolExecutor(workers, initializer=_init_worker) if workers > 1 else None
+
+    def hash_passwords(passwords):
+        if pool is None:
+            return [make_password(password) for password in passwords]
+        # Lazy: the results are only collected when the batch is written
+        return pool.map(make_password, passwords, chunksize=max(1, batch_size // (workers * 4)))
+
+    def commit(batch):
+        stats.created += _insert(batch)
+        stats.last_row = batch.last_row
+        if checkpoint:
+            write_checkpoint(checkpoint, path, batch.last_row)
+        if progress:
+            progress(stats)
+
+    seen = set()
+    pending = None
+    try:
+        roster = ((number, row) for number, row in read_roster(path, fmt) if number > stats.resumed_from)
+        for rows in _batches(roster, batch_size):
+            stats.rows += len(rows)
+            batch = _prepare(rows, stats, seen, hash_passwords)
+            # The next batch hashes on the pool while this one is written
+            if pending:
+                commit(pending)
+            pending = batch
+        if pending:
+            commit(pending)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+    if stats.created:
+        showcase.invalidate()
+    if checkpoint:
+        Path(checkpoint).unlink(missing_ok=True)
+    return stats
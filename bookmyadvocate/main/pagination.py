@@ -0,0 +1,130 @@
+"""
+Path: bookmyadvocate/main/pagination.py
+Keyset (cursor) pagination.
+
+Instead of OFFSET, each page remembers the sort key of its last row in an
+opaque cursor and the next page asks for rows strictly after it, so page 500
+costs the same as page 1 as long as the sort key is backed by an index.
+"""
+import base64
+import binascii
+import datetime
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
+
+@dataclass
+class KeysetPage:
+    items: list = field(default_factory=list)
+    next_cursor: str = ''
+
+    @property
+    def has_next(self):
+        return bool(self.next_cursor)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def page_size_from(params, default=DEFAULT_PAGE_SIZE):
+    """Read ``page_size`` from request params, clamped to 1..MAX_PAGE_SIZE."""
+    try:
+        size = int(params.get('page_size', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def _cursor_value(value):
+    # Full precision: DjangoJSONEncoder would cut datetimes to milliseconds
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_cursor_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """Return the cursor's key values, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+
+def _key_value(row, key):
+    if isinstance(row, dict):
+        return row[key]
+    for part in key.split('__'):
+        row = getattr(row, part)
+    return row
+
+
+def after(keys, values):
+    """Rows that sort strictly after *values* when ordering by *keys*.
+
+    Keys use ``order_by`` syntax: ``'-rating'`` is descending, ``'id'`` ascending.
+    """
+    condition = Q()
+    equal = Q()
+    for key, value in zip(keys, values):
+        name = key.lstrip('-')
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def _page_query(queryset, keys, cursor, page_size):
+    queryset = queryset.order_by(*keys)
+    values = decode_cursor(cursor, len(keys))
+    if values is not None:
+        try:
+            queryset = queryset.filter(after(keys, values))
+        except (ValidationError, TypeError, ValueError):
+            pass  # a tampered cursor just starts from the first page
+    return queryset[:page_size + 1]
+
+
+def _page(rows, keys, page_size):
+    if len(rows) <= page_size:
+        return KeysetPage(rows)
+    rows = rows[:page_size]
+    return KeysetPage(rows, encode_cursor([_key_value(rows[-1], key.lstrip('-')) for key in keys]))
+
+
+def keyset_page(queryset, keys, cursor='', page_size=DEFAULT_PAGE_SIZE):
+    """Return one page of *queryset* ordered by *keys* (``order_by`` syntax).
+
+    The last key must be unique (normally the primary key) so the order is total.
+    """
+    return _page(list(_page_query(queryset, keys, cursor, page_size)), keys, page_size)
+
+
+async def akeyset_page(queryset, keys, cursor='', page_size=DEFAULT_PAGE_SIZE):
+    """keyset_page for async views."""
+    rows = [row async for row in _page_query(queryset, keys, cursor, page_size)]
+    return _page(rows, keys, page_size)
@@ -0,0 +1,106 @@
+"""
+Path: bookmyadvocate/main/ratings.py
+Running rating counters on AdvocateProfile.
+
+Each profile keeps rating_sum, rating_count and a star histogram (stars_1 to
+stars_5). Reviews adjust them, through the ratings.apply_review background
+job, with relative UPDATEs (no read-modify-write, so concurrent reviews
+cannot lose each other), and ``rating`` is then derived from the sum and
+count in the database.
+"""
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast
+
+from .models import AdvocateProfile, AdvocateSearchIndex, Review
+
+AVERAGE = Case(
+    When(rating_count=0, then=Value(0)),
+    default=Cast('rating_sum', FloatField()) / F('rating_count'),
+    output_field=DecimalField(max_digits=3, decimal_places=2),
+)
+
+
+STARS = range(1, 6)
+
+
+def star_field(stars):
+    return f'stars_{int(stars)}'
+
+
+def apply_review(advocate_id, added=(), removed=()):
+    """Count reviews rated *added* and uncount reviews rated *removed* (lists of star ratings).
+
+    An edited review is one of each. Returns the advocate's new rating (None
+    if they have no profile). Raises ValueError for a rating outside STARS,
+    which no histogram bucket would count.
+    """
+    invalid = [stars for stars in [*added, *removed] if stars not in STARS]
+    if invalid:
+        raise ValueError(f"Ratings must be {STARS.start} to {STARS.stop - 1} stars, not {invalid}")
+    counters = {
+        'rating_sum': F('rating_sum') + sum(added) - sum(removed),
+        'rating_count': F('rating_count') + len(added) - len(removed),
+    }
+    for stars in STARS:
+        delta = list(added).count(stars) - list(removed).count(stars)
+        if delta:
+            counters[star_field(stars)] = F(star_field(stars)) + delta
+
+    with transaction.atomic():
+        profiles = AdvocateProfile.objects.filter(user_id=advocate_id)
+        # Two statements: MySQL would read the already-updated counters inside a
+        # single UPDATE, other databases the old ones
+        profiles.update(**counters)
+        profiles.update(rating=AVERAGE)
+        rating = profiles.values_list('rating', flat=True).first()
+        AdvocateSearchIndex.objects.filter(user_id=advocate_id).update(rating=rating)
+    return rating
+
+
+def rebuild_ratings(batch_size=500, *, profile_model=AdvocateProfile, review_model=Review,
+                    index_model=AdvocateSearchIndex):
+    """Recompute every profile's counters from Review, in batches.
+
+    Returns the number of profiles whose counters had drifted. The model
+    arguments let migrations pass in their historical models.
+    """
+    # Historical models in migrations before 0012 have no histogram
+    fields = ['rating_sum', 'rating_count']
+    if hasattr(profile_model, star_field(1)):
+        fields += [star_field(stars) for stars in STARS]
+    repaired = 0
+    last_pk = 0
+    while True:
+        batch = list(profile_model.objects.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not batch:
+            return repaired
+
+        totals = {
+            row['advocate_id']: row
+            for row in review_model.objects.filter(advocate_id__in=[profile.user_id for profile in batch])
+            .values('advocate_id')
+            .annotate(
+                rating_sum=Sum('rating'),
+                rating_count=Count('id'),
+                **{star_field(stars): Count('id', filter=Q(rating=stars)) for stars in STARS},
+            )
+        }
+        drifted = []
+        for profile in batch:
+            row = totals.get(profile.user_id, {})
+            counts = [row.get(field) or 0 for field in fields]
+            if [getattr(profile, field) for field in fields] != counts:
+                for field, count in zip(fields, counts):
+                    setattr(profile, field, count)
+                drifted.append(profile)
+
+        with transaction.atomic():
+            profile_model.objects.bulk_update(drifted, fields)
+            profile_model.objects.filter(pk__in=[profile.pk for profile in drifted]).update(rating=AVERAGE)
+            index_model.objects.filter(user_id__in=[profile.user_id for profile in drifted]).update(
+                rating=Subquery(profile_model.objects.filter(user_id=OuterRef('user_id')).values('rating')[:1]),
+            )
+
+        repaired += len(drifted)
+        last_pk = batch[-1].pk
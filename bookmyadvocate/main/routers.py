@@ -0,0 +1,211 @@
+"""
+Path: bookmyadvocate/main/routers.py
+Read replicas for the public, read-mostly pages.
+
+Views decorated with @replica_reads (home, search, advocate profiles) send
+their queries to one of the DATABASE_REPLICAS aliases, picked once per
+request. Everything else, and every write wherever it happens, goes to the
+primary ('default').
+
+Replicas trail the primary, so a client who has just booked or reviewed
+could otherwise not see it on the next page. A request that writes sets the
+PIN_COOKIE, which keeps that browser's reads on the primary for
+DATABASE_REPLICA_MAX_LAG seconds. Replicas reporting more lag than that
+(checked every DATABASE_REPLICA_CHECK_INTERVAL seconds per process) are
+skipped until they catch up; with none left, reads go to the primary.
+Within a request, reads also stay on the primary once it has written or
+inside a transaction.
+"""
+import functools
+import logging
+import math
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'primary_until'
+
+
+def _replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def _max_lag():
+    return getattr(settings, 'DATABASE_REPLICA_MAX_LAG', 5)
+
+
+# -------------------------
+# REPLICA LAG
+# -------------------------
+def replica_lag(alias):
+    """Seconds the replica *alias* trails the primary by; None when it is not replicating."""
+    connection = connections[alias]
+    if connection.vendor != 'mysql':
+        # A local SQLite copy has nothing to fall behind
+        return 0
+    with connection.cursor() as cursor:
+        for statement, column in (('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+                                  ('SHOW SLAVE STATUS', 'Seconds_Behind_Master')):
+            try:
+                cursor.execute(statement)
+            except DatabaseError:
+                # SHOW REPLICA STATUS is MySQL 8.0.22+
+                continue
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return row[[column_info[0] for column_info in cursor.description].index(column)]
+    return None
+
+
+class ReplicaHealth:
+    """Per-process verdicts on which replicas are close enough behind to read from."""
+
+    def __init__(self):
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def usable(self, alias):
+        interval = getattr(settings, 'DATABASE_REPLICA_CHECK_INTERVAL', 5)
+        with self._lock:
+            checked = self._checked.get(alias)
+        if checked is not None and time.monotonic() - checked[0] < interval:
+            return checked[1]
+        usable = self._probe(alias)
+        with self._lock:
+            self._checked[alias] = (time.monotonic(), usable)
+        return usable
+
+    @staticmethod
+    def _probe(alias):
+        try:
+            lag = replica_lag(alias)
+        except DatabaseError as exc:
+            logger.warning("Replica %r is unreachable: %s", alias, exc)
+            return False
+        if lag is None or lag > _max_lag():
+            logger.warning("Replica %r is %s behind; reading from the primary", alias,
+                           'not replicating' if lag is None else f'{lag}s')
+            return False
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._checked.clear()
+
+
+health = ReplicaHealth()
+
+
+# -------------------------
+# ROUTING
+# -------------------------
+class RequestRouting:
+    def __init__(self, pinned):
+        # Wrote recently (the cookie): every read goes to the primary
+        self.pinned = pinned
+        self.replica_reads = False
+        self.replica = None
+        self.wrote = False
+
+
+# Shared by the request's middleware, view and the threads its queries run in
+_routing = ContextVar('database_routing', default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or not routing.replica_reads or routing.pinned or routing.wrote:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        if routing.replica is None:
+            candidates = [alias for alias in _replicas() if health.usable(alias)]
+            routing.replica = random.choice(candidates) if candidates else DEFAULT_DB_ALIAS
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+        # Explicitly: left to Django, saving an instance read from a replica would write there
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def replica_reads(view):
+    """Let *view*'s queries go to a replica, unless its request is pinned to the primary."""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            routing = _routing.get()
+            if routing is None:
+                return await view(request, *args, **kwargs)
+            routing.replica_reads = True
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                routing.replica_reads = False
+    else:
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            routing = _routing.get()
+            if routing is None:
+                return view(request, *args, **kwargs)
+            routing.replica_reads = True
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                routing.replica_reads = False
+    return wrapper
+
+
+def _pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def _pin(routing, response):
+    if routing.wrote and _replicas():
+        window = _max_lag()
+        response.set_cookie(PIN_COOKIE, str(math.ceil(time.time() + window)), max_age=window,
+                            httponly=True, samesite='Lax')
+    return response
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    # Outside SessionMiddleware, so that saving the session counts as a write
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            routing = RequestRouting(_pinned(request))
+            token = _routing.set(routing)
+            try:
+                return _pin(routing, await get_response(request))
+            finally:
+                _routing.reset(token)
+    else:
+        def middleware(request):
+            routing = RequestRouting(_pinned(request))
+            token = _routing.set(routing)
+            try:
+                return _pin(routing, get_response(request))
+            finally:
+                _routing.reset(token)
+    return middleware
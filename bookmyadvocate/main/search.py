@@ -0,0 +1,462 @@
+"""
+Path: bookmyadvocate/main/search.py
+Advocate search index - building, maintaining and querying it.
+
+Every active advocate has one AdvocateSearchIndex row (filter columns plus a
+flat text document) and a set of weighted AdvocateSearchTerm rows (an inverted
+index). Searching never scans the advocate table: the portable backend does an
+indexed prefix-range lookup on the term table, MySQL uses a FULLTEXT index on
+the document column. Searches near a place go through the geohash column
+instead (see main/geo.py) and come nearest first.
+"""
+import bisect
+import re
+from collections import Counter
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Exists, IntegerField, Max, OuterRef, Q, Sum, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from . import geo
+from .models import AdvocateProfile, AdvocateSearchIndex, AdvocateSearchTerm, User
+from .pagination import DEFAULT_PAGE_SIZE, KeysetPage, akeyset_page, decode_cursor, encode_cursor, keyset_page
+
+# How much a token counts for, depending on where it was found
+FIELD_WEIGHTS = {
+    'name': 4,
+    'identity': 3,
+    'specialization': 3,
+    'location': 2,
+    'bio': 1,
+}
+
+STOP_WORDS = {
+    'an', 'and', 'at', 'by', 'for', 'in', 'is', 'of', 'on', 'or', 'the', 'to', 'with',
+    'law', 'lawyer', 'advocate',
+}
+
+MAX_TERM_LENGTH = 64
+
+# Offered by the search form; any radius up to geo.MAX_RADIUS_KM is accepted
+RADIUS_CHOICES = [5, 10, 25, 50, 100]
+
+# Filter values are clamped to what the columns can hold (consultation_fee is
+# DECIMAL(10, 2), experience_years a positive INT), so no value overflows them
+MAX_FEE = Decimal('99999999.99')
+MAX_EXPERIENCE = 2147483647
+
+_TOKEN_RE = re.compile(r'[^\W_]+')
+_SPECIALIZATIONS = dict(AdvocateProfile.SPECIALIZATION_CHOICES)
+
+
+def tokenize(text):
+    """Split text into lowercase search tokens, dropping stop words and single letters."""
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in _TOKEN_RE.findall((text or '').lower())
+        if (len(token) > 1 or token.isdigit()) and token not in STOP_WORDS
+    ]
+
+
+# -------------------------
+# INDEX BUILDING
+# -------------------------
+def build_entry(user, profile):
+    """Return (index field values, {term: weight}) for one advocate."""
+    fields = {
+        'name': f"{user.first_name} {user.last_name}",
+        'identity': f"{user.email or ''} {user.bar_council_number or ''}",
+        'specialization': f"{profile.specialization} {_SPECIALIZATIONS.get(profile.specialization, '')}",
+        'location': profile.location,
+        'bio': profile.bio,
+    }
+
+    terms = Counter()
+    for field, text in fields.items():
+        for token in set(tokenize(text)):
+            terms[token] += FIELD_WEIGHTS[field]
+
+    index = {
+        'document': ' '.join(text.strip() for text in fields.values() if text and text.strip()),
+        'specialization': profile.specialization or '',
+        'experience_years': profile.experience_years or 0,
+        'consultation_fee': profile.consultation_fee,
+        'rating': profile.rating,
+    }
+    # Historical models in migrations before 0011 have no locality
+    if hasattr(profile, 'locality_id'):
+        index.update(geo.index_fields(profile.locality_id))
+    return index, terms
+
+
+def index_advocate(user_id):
+    """Bring the search index for one advocate up to date (or drop it).
+
+    Returns the indexed field values, or None if the advocate is not listed.
+    """
+    user = (
+        User.objects.select_related('advocate_profile')
+        .filter(pk=user_id, role='advocate', is_active_advocate=True)
+        .first()
+    )
+    profile = getattr(user, 'advocate_profile', None)
+
+    with transaction.atomic():
+        AdvocateSearchTerm.objects.filter(advocate_id=user_id).delete()
+        if profile is None:
+            AdvocateSearchIndex.objects.filter(user_id=user_id).delete()
+            return None
+
+        index, terms = build_entry(user, profile)
+        AdvocateSearchIndex.objects.update_or_create(user_id=user_id, defaults=index)
+        AdvocateSearchTerm.objects.bulk_create([
+            AdvocateSearchTerm(advocate_id=user_id, term=term, weight=weight)
+            for term, weight in terms.items()
+        ])
+    return index
+
+
+def rebuild_index(batch_size=500, *, user_model=User, index_model=AdvocateSearchIndex,
+                  term_model=AdvocateSearchTerm):
+    """Rebuild the whole index in batches. Returns the number of advocates indexed.
+
+    The model arguments let migrations pass in their historical models.
+    """
+    term_model.objects.all().delete()
+    index_model.objects.all().delete()
+
+    advocates = (
+        user_model.objects.filter(role='advocate', is_active_advocate=True, advocate_profile__isnull=False)
+        .select_related('advocate_profile')
+        .order_by('pk')
+    )
+    indexed = 0
+    last_pk = 0
+    while True:
+        batch = list(advocates.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return indexed
+
+        with transaction.atomic():
+            bulk_index(((user, user.advocate_profile) for user in batch), batch_size,
+                       index_model=index_model, term_model=term_model)
+
+        indexed += len(batch)
+        last_pk = batch[-1].pk
+
+
+def bulk_index(advocates, batch_size=500, *, index_model=AdvocateSearchIndex, term_model=AdvocateSearchTerm):
+    """Insert index rows for (user, profile) pairs that are not indexed yet."""
+    index_rows, term_rows = [], []
+    for user, profile in advocates:
+        index, terms = build_entry(user, profile)
+        index_rows.append(index_model(user_id=user.pk, **index))
+        term_rows.extend(
+            term_model(advocate_id=user.pk, term=term, weight=weight)
+            for term, weight in terms.items()
+        )
+    index_model.objects.bulk_create(index_rows, batch_size=batch_size)
+    term_model.objects.bulk_create(term_rows, batch_size=batch_size)
+
+
+# -------------------------
+# QUERYING
+# -------------------------
+def _decimal(value, limit):
+    try:
+        number = Decimal(value) if value not in (None, '') else None
+    except InvalidOperation:
+        return None
+    # NaN and the infinities compare oddly and cannot be stored
+    if number is None or not number.is_finite():
+        return None
+    return max(Decimal(0), min(number, limit)).quantize(Decimal('0.01'))
+
+
+def _int(value, low, high):
+    try:
+        number = int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+    return None if number is None else max(low, min(number, high))
+
+
+def _float(value, limit):
+    try:
+        number = float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+    return number if number is not None and -limit <= number <= limit else None
+
+
+@dataclass
+class SearchFilters:
+    specialization: str = ''
+    min_fee: Decimal = None
+    max_fee: Decimal = None
+    min_experience: int = None
+    # A place name from the gazetteer, or explicit coordinates, to search around
+    near: str = ''
+    latitude: float = None
+    longitude: float = None
+    radius_km: int = geo.DEFAULT_RADIUS_KM
+
+    @classmethod
+    def from_params(cls, params):
+        specialization = params.get('specialization', '')
+        radius = _int(params.get('radius'), 1, geo.MAX_RADIUS_KM)
+        return cls(
+            specialization=specialization if specialization in _SPECIALIZATIONS else '',
+            min_fee=_decimal(params.get('min_fee'), MAX_FEE),
+            max_fee=_decimal(params.get('max_fee'), MAX_FEE),
+            min_experience=_int(params.get('min_experience'), 0, MAX_EXPERIENCE),
+            near=params.get('near', '').strip(),
+            latitude=_float(params.get('lat'), 90),
+            longitude=_float(params.get('lng'), 180),
+            radius_km=geo.DEFAULT_RADIUS_KM if radius is None else radius,
+        )
+
+    @property
+    def origin(self):
+        """(latitude, longitude) to search around, or None."""
+        if self.latitude is None or self.longitude is None:
+            return None
+        return self.latitude, self.longitude
+
+    def locate(self, gazetteer):
+        """Search around the ``near`` place as found in *gazetteer* (a place wins over coordinates).
+
+        A place the gazetteer does not know leaves no origin at all.
+        """
+        if self.near:
+            locality = gazetteer.find(self.near)
+            self.latitude = locality and locality.latitude
+            self.longitude = locality and locality.longitude
+        return self.origin
+
+    def as_q(self, prefix=''):
+        """Filter on AdvocateSearchIndex columns, reached through *prefix*."""
+        q = Q()
+        if self.specialization:
+            q &= Q(**{f'{prefix}specialization': self.specialization})
+        if self.min_fee is not None:
+            q &= Q(**{f'{prefix}consultation_fee__gte': self.min_fee})
+        if self.max_fee is not None:
+            q &= Q(**{f'{prefix}consultation_fee__lte': self.max_fee})
+        if self.min_experience is not None:
+            q &= Q(**{f'{prefix}experience_years__gte': self.min_experience})
+        return q
+
+
+class SearchBackend:
+    """Turns tokens and filters into ranked rows.
+
+    Both methods return ``(queryset, keys)``: the unordered rows and the
+    ``order_by`` keys they rank on, ending with the advocate id. Paging is done
+    by keyset on those keys (see main/pagination.py).
+    """
+
+    def rank(self, tokens, filters):
+        raise NotImplementedError
+
+    def matches(self, tokens):
+        """The AdvocateSearchIndex rows rank() would find for *tokens*, unfiltered and unranked."""
+        raise NotImplementedError
+
+    def browse(self, filters):
+        queryset = (
+            AdvocateSearchIndex.objects.filter(filters.as_q())
+            .select_related('user__advocate_profile')
+        )
+        return queryset, ('-rating', '-user_id')
+
+
+def _prefix_q(token):
+    return Q(term__gte=token, term__lt=token + '\uffff')
+
+
+class TermIndexBackend(SearchBackend):
+    """Prefix-range lookups on the inverted term index. Works on any database."""
+
+    def rank(self, tokens, filters):
+        matched = Q()
+        hits = []
+        for token in tokens:
+            token_q = _prefix_q(token)
+            matched |= token_q
+            hits.append(Max(Case(When(token_q, then=Value(1)), default=Value(0), output_field=IntegerField())))
+
+        queryset = (
+            AdvocateSearchTerm.objects.filter(matched)
+            .filter(filters.as_q('advocate__search_index__'))
+            .values('advocate_id')
+            .annotate(
+                hits=sum(hits[1:], hits[0]),
+                score=Sum('weight'),
+                rating=Max('advocate__search_index__rating'),
+            )
+        )
+        return queryset, ('-hits', '-score', '-rating', '-advocate_id')
+
+    def matches(self, tokens):
+        matched = Q()
+        for token in tokens:
+            matched |= _prefix_q(token)
+        return AdvocateSearchIndex.objects.filter(
+            Exists(AdvocateSearchTerm.objects.filter(matched, advocate_id=OuterRef('user_id'))),
+        )
+
+
+class MySQLFullTextBackend(SearchBackend):
+    """MATCH ... AGAINST on the FULLTEXT index of AdvocateSearchIndex.document."""
+
+    @staticmethod
+    def _match(tokens):
+        return RawSQL(
+            'MATCH (document) AGAINST (%s IN BOOLEAN MODE)',
+            (' '.join(f'{token}*' for token in tokens),),
+        )
+
+    def rank(self, tokens, filters):
+        queryset = (
+            AdvocateSearchIndex.objects.filter(filters.as_q())
+            .annotate(score=self._match(tokens))
+            .filter(score__gt=0)
+            .values('user_id', 'score', 'rating')
+        )
+        return queryset, ('-score', '-rating', '-user_id')
+
+    def matches(self, tokens):
+        return AdvocateSearchIndex.objects.alias(score=self._match(tokens)).filter(score__gt=0)
+
+
+def get_backend():
+    return import_string(getattr(settings, 'ADVOCATE_SEARCH_BACKEND', 'main.search.TermIndexBackend'))()
+
+
+def _search(query, filters):
+    """Return (tokens, queryset, keys) for a search; no tokens means browsing."""
+    tokens = tokenize(query)
+    if not tokens:
+        return tokens, *get_backend().browse(filters)
+    return tokens, *get_backend().rank(tokens, filters)
+
+
+def _advocates(page, tokens, keys, users=None):
+    """Replace the index rows on *page* with their advocates, scored."""
+    if not tokens:
+        page.items = [row.user for row in page.items]
+        for user in page.items:
+            user.search_score = 0
+        return page
+
+    id_key = keys[-1].lstrip('-')
+    advocates = []
+    for row in page.items:
+        user = users.get(row[id_key])
+        if user is not None:
+            user.search_score = row['score']
+            advocates.append(user)
+    page.items = advocates
+    return page
+
+
+def _ranked_ids(page, keys):
+    id_key = keys[-1].lstrip('-')
+    return [row[id_key] for row in page.items]
+
+
+def _nearby(tokens, filters):
+    """(user_id, latitude, longitude) of the advocates in the geohash cells around the origin."""
+    latitude, longitude = filters.origin
+    queryset = AdvocateSearchIndex.objects.filter(
+        filters.as_q(), geo.cells_q(geo.covering_cells(latitude, longitude, filters.radius_km)),
+    )
+    # Every token has to match, ranking is by distance alone
+    for token in tokens:
+        queryset = queryset.filter(Exists(AdvocateSearchTerm.objects.filter(
+            advocate_id=OuterRef('user_id'), term__gte=token, term__lt=token + '\uffff',
+        )))
+    return queryset.values_list('user_id', 'latitude', 'longitude')
+
+
+def _nearest(rows, filters, cursor, page_size):
+    """Keep the *rows* inside the radius and page them by (distance, id)."""
+    latitude, longitude = filters.origin
+    ranked = sorted(
+        (distance, user_id) for user_id, row_latitude, row_longitude in rows
+        if (distance := geo.distance_km(latitude, longitude, row_latitude, row_longitude)) <= filters.radius_km
+    )
+    values = decode_cursor(cursor, 2)
+    if values is not None:
+        try:
+            ranked = ranked[bisect.bisect_right(ranked, (float(values[0]), int(values[1]))):]
+        except (TypeError, ValueError):
+            pass  # a tampered cursor just starts from the first page
+    if len(ranked) <= page_size:
+        return KeysetPage(ranked)
+    return KeysetPage(ranked[:page_size], encode_cursor(ranked[page_size - 1]))
+
+
+def _located(page, users):
+    """Replace the (distance, id) keys on *page* with their advocates."""
+    advocates = []
+    for distance, user_id in page.items:
+        user = users.get(user_id)
+        if user is not None:
+            user.search_score = 0
+            user.distance_km = distance
+            advocates.append(user)
+    page.items = advocates
+    return page
+
+
+def find_advocates(query='', filters=None, cursor='', page_size=DEFAULT_PAGE_SIZE):
+    """Return one KeysetPage of active advocates matching *query* and *filters*.
+
+    Advocates come best match first (highest rating first when there is no
+    query), each with its profile loaded and a ``search_score``. Browsing is a
+    single query; a text search adds one query to load the ranked advocates.
+
+    When the filters have an origin, only advocates within its radius match,
+    nearest first, each with a ``distance_km``: one query for the candidates
+    in the covering geohash cells, one to load the page's advocates.
+    """
+    filters = filters or SearchFilters()
+    if filters.near:
+        filters.locate(geo.gazetteer())
+    if filters.origin is not None:
+        page = _nearest(_nearby(tokenize(query), filters), filters, cursor, page_size)
+        return _located(page, User.objects.select_related('advocate_profile').in_bulk([pk for _, pk in page]))
+
+    tokens, queryset, keys = _search(query, filters)
+    page = keyset_page(queryset, keys, cursor, page_size)
+    users = None
+    if tokens:
+        users = User.objects.select_related('advocate_profile').in_bulk(_ranked_ids(page, keys))
+    return _advocates(page, tokens, keys, users)
+
+
+async def afind_advocates(query='', filters=None, cursor='', page_size=DEFAULT_PAGE_SIZE):
+    """find_advocates on the async ORM."""
+    filters = filters or SearchFilters()
+    if filters.near:
+        filters.locate(await geo.agazetteer())
+    if filters.origin is not None:
+        page = _nearest([row async for row in _nearby(tokenize(query), filters)], filters, cursor, page_size)
+        users = User.objects.select_related('advocate_profile').filter(pk__in=[pk for _, pk in page])
+        return _located(page, {user.pk: user async for user in users})
+
+    tokens, queryset, keys = _search(query, filters)
+    page = await akeyset_page(queryset, keys, cursor, page_size)
+    users = None
+    if tokens:
+        users = {
+            user.pk: user
+            async for user in User.objects.select_related('advocate_profile').filter(pk__in=_ranked_ids(page, keys))
+        }
+    return _advocates(page, tokens, keys, users)
@@ -0,0 +1,26 @@
+"""
+Path: bookmyadvocate/main/sessions.py
+Expired session cleanup that never holds long locks on django_session.
+
+Django's clearsessions deletes every expired row in one statement, which on
+a large table is one long transaction. Here each batch is found through the
+expire_date index and deleted by primary key in its own short transaction,
+with an optional pause between batches for replicas and other writers.
+"""
+import time
+
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+
+def purge_expired_sessions(batch_size=1000, pause=0.0):
+    """Delete sessions that expired before now. Returns how many."""
+    now = timezone.now()
+    expired = Session.objects.filter(expire_date__lt=now).order_by('expire_date')
+    deleted = 0
+    while keys := list(expired.values_list('session_key', flat=True)[:batch_size]):
+        deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+        if len(keys) < batch_size:
+            break
+        time.sleep(pause)
+    return deleted
@@ -0,0 +1,130 @@
+"""
+Path: bookmyadvocate/main/showcase.py
+Cached "top advocates" showcase for the home page.
+
+The entry is plain data (no model instances) so a cache hit needs no
+database access. It goes stale in two ways: its soft TTL runs out, or a
+relevant change bumps the generation counter. Either way only the request
+that wins the rebuild lock queries the database; everyone else keeps
+serving the stale entry until the new one is in. That rebuild reads the
+primary database even on replica-routed requests (main/routers.py), so a
+lagging replica's view is never cached for a whole TTL.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import AdvocateSearchIndex
+
+SHOWCASE_KEY = 'home:showcase'
+GENERATION_KEY = 'home:showcase:generation'
+LOCK_KEY = 'home:showcase:lock'
+SHOWCASE_SIZE = 6
+LOCK_TIMEOUT = 30
+
+
+def showcase_ttl():
+    return getattr(settings, 'HOME_SHOWCASE_TTL', 300)
+
+
+def _showcase_rows(using=None):
+    return (
+        AdvocateSearchIndex.objects.using(using).select_related('user__advocate_profile')
+        .order_by('-rating', '-user_id')[:SHOWCASE_SIZE]
+    )
+
+
+def _card(row):
+    return {
+        'id': row.user_id,
+        'username': row.user.username,
+        'specialization': row.user.advocate_profile.get_specialization_display(),
+        'location': row.user.advocate_profile.location,
+        'experience_years': row.user.advocate_profile.experience_years,
+        'rating': row.rating,
+    }
+
+
+def build_showcase(using=None):
+    return [_card(row) for row in _showcase_rows(using)]
+
+
+async def abuild_showcase(using=None):
+    return [_card(row) async for row in _showcase_rows(using)]
+
+
+def _fresh(entry, generation):
+    return entry and entry['generation'] == generation and entry['expires'] > time.time()
+
+
+def _entry(advocates, generation):
+    return {'advocates': advocates, 'generation': generation, 'expires': time.time() + showcase_ttl()}
+
+
+def get_showcase():
+    """Return the showcase advocates as a list of dicts."""
+    cached = cache.get_many([SHOWCASE_KEY, GENERATION_KEY])
+    entry = cached.get(SHOWCASE_KEY)
+    generation = cached.get(GENERATION_KEY, 0)
+    if _fresh(entry, generation):
+        return entry['advocates']
+
+    if not cache.add(LOCK_KEY, 1, LOCK_TIMEOUT):
+        # Someone else is rebuilding; a stale showcase is fine meanwhile
+        if entry:
+            return entry['advocates']
+        return build_showcase()
+
+    try:
+        advocates = build_showcase(DEFAULT_DB_ALIAS)
+        cache.set(SHOWCASE_KEY, _entry(advocates, generation), showcase_ttl() * 2)
+        return advocates
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+async def aget_showcase():
+    """get_showcase for async views (async cache API and ORM)."""
+    cached = await cache.aget_many([SHOWCASE_KEY, GENERATION_KEY])
+    entry = cached.get(SHOWCASE_KEY)
+    generation = cached.get(GENERATION_KEY, 0)
+    if _fresh(entry, generation):
+        return entry['advocates']
+
+    if not await cache.aadd(LOCK_KEY, 1, LOCK_TIMEOUT):
+        if entry:
+            return entry['advocates']
+        return await abuild_showcase()
+
+    try:
+        advocates = await abuild_showcase(DEFAULT_DB_ALIAS)
+        await cache.aset(SHOWCASE_KEY, _entry(advocates, generation), showcase_ttl() * 2)
+        return advocates
+    finally:
+        await cache.adelete(LOCK_KEY)
+
+
+def invalidate():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def advocate_changed(advocate_id, rating=None):
+    """Invalidate the showcase if *advocate_id*'s change could alter it.
+
+    That is when the advocate is on it, or the showcase is not full, or
+    their (new) rating is high enough to get on it. Without a rating,
+    only advocates already shown count.
+    """
+    entry = cache.get(SHOWCASE_KEY)
+    if entry is None:
+        return
+    shown = entry['advocates']
+    if any(advocate['id'] == advocate_id for advocate in shown):
+        invalidate()
+    elif rating is not None and (len(shown) < SHOWCASE_SIZE or rating >= shown[-1]['rating']):
+        invalidate()
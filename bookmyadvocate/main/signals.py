@@ -0,0 +1,93 @@
+"""
+Path: bookmyadvocate/main/signals.py
+Keeps derived data (search index and its facet counts, home showcase,
+resolved localities) in step with model saves, evicts changed users from the signed-in user cache,
+and queues the rating counter updates for reviews and the thumbnails of new
+profile pictures.
+"""
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from . import geo, search, showcase, tasks, usercache
+from .models import AdvocateProfile, Locality, Review, User
+
+# User fields that end up in the search index
+INDEXED_USER_FIELDS = {'first_name', 'last_name', 'email', 'bar_council_number', 'role', 'is_active_advocate'}
+
+
+@receiver(pre_save, sender=AdvocateProfile)
+def resolve_profile_locality(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Saves that name their fields must include 'locality' next to 'location'
+    if raw or (update_fields is not None and 'location' not in update_fields):
+        return
+    instance.locality = geo.gazetteer().find(instance.location) if instance.location else None
+
+
+@receiver(post_save, sender=Locality)
+@receiver(post_delete, sender=Locality)
+def forget_gazetteer(sender, **kwargs):
+    geo.gazetteer_changed()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    usercache.users.forget(instance.pk)
+
+
+@receiver(post_save, sender=AdvocateProfile)
+@receiver(post_delete, sender=AdvocateProfile)
+def forget_cached_profile(sender, instance, **kwargs):
+    usercache.users.forget(instance.user_id)
+
+
+@receiver(post_save, sender=AdvocateProfile)
+@receiver(post_delete, sender=AdvocateProfile)
+def reindex_advocate_profile(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index = search.index_advocate(instance.user_id)
+    tasks.search_index_changed()
+    showcase.advocate_changed(instance.user_id, index and index['rating'])
+
+
+@receiver(post_save, sender=User)
+def reindex_advocate_user(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.role != 'advocate':
+        return
+    if update_fields is not None and not INDEXED_USER_FIELDS.intersection(update_fields):
+        return
+    index = search.index_advocate(instance.pk)
+    tasks.search_index_changed()
+    showcase.advocate_changed(instance.pk, index and index['rating'])
+
+
+@receiver(post_save, sender=User)
+def queue_profile_thumbnails(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'profile_picture' not in update_fields):
+        return
+    if (instance.profile_picture.name or '') != instance.profile_picture_variants:
+        tasks.profile_picture_changed(instance)
+
+
+@receiver(post_init, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    instance._saved_rating = instance.rating if instance.pk else None
+
+
+@receiver(post_save, sender=Review)
+def count_saved_review(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    rating = int(instance.rating)
+    if created:
+        tasks.review_changed(instance.advocate_id, added=rating)
+    elif instance._saved_rating is not None and rating != int(instance._saved_rating):
+        tasks.review_changed(instance.advocate_id, added=rating, removed=int(instance._saved_rating))
+    instance._saved_rating = rating
+
+
+@receiver(post_delete, sender=Review)
+def uncount_deleted_review(sender, instance, **kwargs):
+    rating = instance._saved_rating if instance._saved_rating is not None else instance.rating
+    tasks.review_changed(instance.advocate_id, removed=int(rating))
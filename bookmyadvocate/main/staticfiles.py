@@ -0,0 +1,194 @@
+"""
+Path: bookmyadvocate/main/staticfiles.py
+Fingerprinted, precompressed static files and the middleware that serves them.
+
+``collectstatic`` with CompressedManifestStaticFilesStorage writes every file
+under a content-hashed name (base.css -> base.3f2a9c1e0b4d.css), as Django's
+ManifestStaticFilesStorage does. It then writes a gzip twin (.gz) next to
+each text file, and a brotli twin (.br) when the optional ``brotli`` package
+is installed. Compression happens once, at deploy time, at the highest
+level, never per request.
+
+static_files_middleware answers STATIC_URL requests from STATIC_ROOT with
+the smallest variant the client accepts. Hashed names change whenever their
+content does, so they are sent as immutable for a year; anything else gets a
+short max-age and Last-Modified revalidation. With DEBUG on, or before
+collectstatic has run, it steps aside for runserver's own static handling.
+"""
+import gzip
+import mimetypes
+import os
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.http import http_date, parse_http_date_safe
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico'}
+# Not worth a second file (or the client's decompression) below these
+MIN_SIZE = 256
+MIN_SAVING = 0.05
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=60'
+
+
+def _compressors():
+    if brotli is not None:
+        yield 'br', '.br', lambda data: brotli.compress(data, quality=11)
+    yield 'gzip', '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+
+
+ENCODINGS = [(encoding, suffix) for encoding, suffix, _ in _compressors()]
+
+
+# -------------------------
+# COLLECTSTATIC
+# -------------------------
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Hashed names only exist once the manifest is saved, at the very end
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if Path(name).suffix.lower() in COMPRESSIBLE:
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as file:
+            data = file.read()
+        for _, suffix, compress in _compressors():
+            compressed_name = name + suffix
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            if len(data) < MIN_SIZE:
+                continue
+            compressed = compress(data)
+            if len(compressed) <= len(data) * (1 - MIN_SAVING):
+                self._save(compressed_name, ContentFile(compressed))
+
+
+# -------------------------
+# SERVING
+# -------------------------
+class StaticFile:
+    def __init__(self, path, immutable):
+        stat = path.stat()
+        self.path = path
+        self.immutable = immutable
+        self.last_modified = int(stat.st_mtime)
+        self.content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in ('application/javascript',
+                                                                          'application/json'):
+            self.content_type += '; charset=utf-8'
+        # Preferred (smallest) first
+        self.variants = [
+            (encoding, Path(f'{path}{suffix}'))
+            for encoding, suffix in ENCODINGS if Path(f'{path}{suffix}').is_file()
+        ]
+
+
+def _accepted(header):
+    """Content codings the client accepts (q > 0), from an Accept-Encoding header."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = params.strip().partition('q=')[2]
+        try:
+            if quality and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFiles:
+    """The collected files under *root* by URL path, found once and kept in memory."""
+
+    def __init__(self, root, url, hashed_names):
+        self.files = {}
+        root = Path(root)
+        if not root.is_dir():
+            return
+        compressed = tuple(suffix for _, suffix in ENCODINGS)
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(compressed) and Path(directory, filename[:filename.rfind('.')]).is_file():
+                    continue
+                path = Path(directory, filename)
+                name = path.relative_to(root).as_posix()
+                self.files[url + name] = StaticFile(path, name in hashed_names)
+
+    def respond(self, request):
+        file = self.files.get(request.path)
+        if file is None or request.method not in ('GET', 'HEAD'):
+            return None
+        if not file.immutable:
+            since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+            if since is not None and file.last_modified <= since:
+                return HttpResponseNotModified()
+
+        accepted = _accepted(request.headers.get('Accept-Encoding', ''))
+        encoding, path = next(
+            ((encoding, path) for encoding, path in file.variants if encoding in accepted),
+            (None, file.path),
+        )
+        # Named after the original, or a saved copy of a compressed variant would be called .gz/.br
+        response = FileResponse(open(path, 'rb'), content_type=file.content_type, filename=file.path.name)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if file.variants:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        response.headers['Cache-Control'] = IMMUTABLE if file.immutable else REVALIDATE
+        response.headers['Last-Modified'] = http_date(file.last_modified)
+        return response
+
+
+_static_files = None
+
+
+def static_files():
+    """The StaticFiles of the current STATIC_ROOT, rebuilt when that setting changes."""
+    global _static_files
+    root = settings.STATIC_ROOT
+    if _static_files is None or _static_files[0] != root:
+        hashed_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        _static_files = (root, StaticFiles(root, settings.STATIC_URL, hashed_names) if root else None)
+    return _static_files[1]
+
+
+def _respond(request):
+    if settings.DEBUG or not request.path.startswith(settings.STATIC_URL):
+        return None
+    files = static_files()
+    return files.respond(request) if files is not None else None
+
+
+@sync_and_async_middleware
+def static_files_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            response = _respond(request)
+            if response is None:
+                response = await get_response(request)
+            return response
+    else:
+        def middleware(request):
+            response = _respond(request)
+            if response is None:
+                response = get_response(request)
+            return response
+    return middleware
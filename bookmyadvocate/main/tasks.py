@@ -0,0 +1,167 @@
+"""
+Path: bookmyadvocate/main/tasks.py
+Background jobs for the side effects of bookings, reviews, documents,
+profile pictures and search index changes.
+
+Views and signals enqueue these through main/jobs.py and return; the
+``run_jobs`` worker runs them. Every handler here takes a batch, so a burst
+of activity costs a few queries per batch rather than per event.
+"""
+from collections import defaultdict
+
+from django.core.mail import send_mass_mail
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from . import facets, jobs, ratings, showcase, thumbnails
+from .models import AdvocateProfile, Booking, Document, Job, Review
+
+
+# -------------------------
+# ENQUEUEING
+# -------------------------
+def review_changed(advocate_id, added=None, removed=None):
+    """Queue a rating counter update for a created, edited or deleted review."""
+    jobs.enqueue(Job(kind='ratings.apply_review', payload={
+        'advocate_id': advocate_id, 'added': added, 'removed': removed,
+    }))
+
+
+def booking_status_changed(booking, previous_status):
+    """Queue the client's notification (and case count) for a saved status change."""
+    if booking.status == previous_status:
+        # A resubmitted form must not mail the client twice
+        return
+    queued = [Job(
+        kind='notify.booking_status',
+        payload={'booking_id': booking.pk, 'status': booking.status},
+        # One per transition: going back to an earlier status mails again
+        key=f'booking-status:{booking.pk}:{booking.status}:{booking.updated_at.isoformat()}',
+    )]
+    if 'completed' in (booking.status, previous_status):
+        queued.append(Job(kind='cases.count', payload={'advocate_id': booking.advocate_id}))
+    jobs.enqueue(*queued)
+
+
+def review_added(review):
+    jobs.enqueue(Job(kind='notify.review', payload={'review_id': review.pk}, key=f'review:{review.pk}'))
+
+
+def document_added(document):
+    jobs.enqueue(Job(kind='notify.document', payload={'document_id': document.pk}, key=f'document:{document.pk}'))
+
+
+def search_index_changed():
+    """Queue a recount of the search facet counts table."""
+    jobs.enqueue(Job(kind='search.facet_counts'))
+
+
+def profile_picture_changed(user):
+    # No idempotency key: a finished job's key would swallow the next request
+    # for the same picture, and refresh() does nothing when the variants match
+    jobs.enqueue(Job(kind='thumbnails.generate', payload={'user_id': user.pk}))
+
+
+# -------------------------
+# COUNTERS
+# -------------------------
+@jobs.handler('ratings.apply_review', batch=True)
+def apply_reviews(payloads):
+    """Fold every queued review change into one counter update per advocate."""
+    changes = defaultdict(lambda: ([], []))
+    for payload in payloads:
+        added, removed = changes[payload['advocate_id']]
+        if payload['added'] is not None:
+            added.append(payload['added'])
+        if payload['removed'] is not None:
+            removed.append(payload['removed'])
+    for advocate_id, (added, removed) in changes.items():
+        showcase.advocate_changed(advocate_id, ratings.apply_review(advocate_id, added, removed))
+
+
+@jobs.handler('cases.count', batch=True)
+def count_cases(payloads):
+    """Set total_cases (completed consultations) for every advocate in the batch, in two queries."""
+    advocate_ids = {payload['advocate_id'] for payload in payloads}
+    counts = (
+        Booking.objects.filter(advocate_id__in=advocate_ids, status='completed')
+        .values('advocate_id').annotate(cases=Count('id')).values_list('advocate_id', 'cases')
+    )
+    AdvocateProfile.objects.filter(user_id__in=advocate_ids).update(total_cases=Case(
+        *[When(user_id=advocate_id, then=Value(cases)) for advocate_id, cases in counts],
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
+
+
+@jobs.handler('search.facet_counts', batch=True)
+def recount_facets(payloads):
+    # However many changes queued it, one recount covers them all
+    facets.recount()
+
+
+# -------------------------
+# NOTIFICATIONS (one SMTP connection per batch)
+# -------------------------
+def _send(messages):
+    # (subject, body, sender, [recipient]); users without an email address are skipped
+    send_mass_mail([message for message in messages if all(message[3])], fail_silently=False)
+
+
+@jobs.handler('notify.booking_status', batch=True)
+def notify_booking_status(payloads):
+    bookings = Booking.objects.select_related('client', 'advocate').in_bulk(
+        [payload['booking_id'] for payload in payloads]
+    )
+    messages = []
+    for payload in payloads:
+        booking = bookings.get(payload['booking_id'])
+        if booking is None:
+            continue
+        status = dict(Booking.STATUS).get(payload['status'], payload['status']).lower()
+        body = (f"Your consultation with {booking.advocate.get_full_name() or booking.advocate.username} "
+                f"on {booking.date:%d %b %Y} at {booking.time:%H:%M} has been {status}.")
+        if payload['status'] == 'accepted' and booking.meeting_link:
+            body += f"\n\nMeeting link: {booking.meeting_link}"
+        messages.append((f"Consultation {status}", body, None, [booking.client.email]))
+    _send(messages)
+
+
+@jobs.handler('notify.review', batch=True)
+def notify_review(payloads):
+    reviews = Review.objects.select_related('client', 'advocate').filter(
+        pk__in=[payload['review_id'] for payload in payloads]
+    )
+    _send([
+        (f"New {review.rating}-star review",
+         f"{review.client.get_full_name() or review.client.username} reviewed your consultation:\n\n"
+         f"{review.comment or '(no comment)'}",
+         None, [review.advocate.email])
+        for review in reviews
+    ])
+
+
+@jobs.handler('notify.document', batch=True)
+def notify_document(payloads):
+    documents = Document.objects.select_related('booking__client', 'booking__advocate', 'uploaded_by').filter(
+        pk__in=[payload['document_id'] for payload in payloads]
+    )
+    messages = []
+    for document in documents:
+        booking = document.booking
+        # Whoever did not upload it
+        recipient = booking.advocate if document.uploaded_by_id == booking.client_id else booking.client
+        messages.append((
+            f"New document: {document.title}",
+            f"{document.uploaded_by.get_full_name() or document.uploaded_by.username} shared "
+            f"\"{document.title}\" on your consultation of {booking.date:%d %b %Y}.",
+            None, [recipient.email],
+        ))
+    _send(messages)
+
+
+# -------------------------
+# THUMBNAILS
+# -------------------------
+@jobs.handler('thumbnails.generate')
+def generate_thumbnails(payload):
+    thumbnails.refresh(payload['user_id'])
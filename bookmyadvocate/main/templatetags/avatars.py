@@ -0,0 +1,31 @@
+"""
+Path: bookmyadvocate/main/templatetags/avatars.py
+{% avatar user 96 %} renders a user's profile picture thumbnail, or nothing
+while they have none ready. Use it as {% avatar user 96 as picture %} to fall
+back to a placeholder. The browser picks the variant (WebP first, JPEG
+otherwise) that suits the display size and pixel density from the srcset.
+"""
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from main import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar(user, size=64, css_class='rounded-circle'):
+    name = user.profile_picture.name if user.profile_picture else ''
+    if not name or name != user.profile_picture_variants:
+        return ''
+    (preferred, preferred_type, _), *_, (fallback, _, _) = thumbnails.FORMATS
+    return format_html(
+        '<picture><source type="{}" srcset="{}" sizes="{}px">'
+        '<img src="{}" srcset="{}" sizes="{}px" width="{}" height="{}" alt="{}" class="{}" '
+        'loading="lazy" decoding="async"></picture>',
+        preferred_type, thumbnails.srcset(name, preferred), size,
+        default_storage.url(thumbnails.variant_name(name, thumbnails.fitting_size(size), fallback)),
+        thumbnails.srcset(name, fallback), size, size, size,
+        user.get_full_name() or user.username, css_class,
+    )
@@ -1,3 +1,1557 @@
-from django.test import TestCase
+import datetime
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.signals import user_login_failed
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.utils import ConnectionHandler
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    availability, benchmark, dbpool, facets, geo, hashing, ical, jobs, metrics, onboarding, ratings, routers,
+    search, showcase, staticfiles, thumbnails, uploads, usercache, views,
+)
+from .pagination import after
+from .models import (
+    AdvocateAvailability, AdvocateFacetCount, AdvocateProfile, AdvocateSearchIndex, AdvocateSearchTerm, Booking, BookingSlot,
+    Document, DocumentBlob, Job, Locality, Review, UploadSession, User, new_calendar_token,
+)
+
+
+def make_advocate(bar_council_number, **profile_fields):
+    user = User.objects.create_user(
+        username=bar_council_number,
+        email=f"{bar_council_number.lower()}@example.com",
+        password='secret',
+        role='advocate',
+        bar_council_number=bar_council_number,
+        is_active_advocate=True,
+    )
+    AdvocateProfile.objects.create(user=user, **profile_fields)
+    return user
+
+
+def make_client(email):
+    return User.objects.create_user(username=email, email=email, password='secret', role='client')
+
+
+def make_bookings(client, advocate, count, status='pending', date=datetime.date(2030, 1, 1)):
+    return Booking.objects.bulk_create([
+        Booking(client=client, advocate=advocate, date=date, time=datetime.time(10, 0),
+                purpose=f'Consultation {i}', status=status)
+        for i in range(count)
+    ])
+
+
+def count_queries(client, url, data=None):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, data)
+    assert response.status_code == 200, response.status_code
+    return len(queries), response
+
+
+class AdvocateSearchTests(TestCase):
+    def setUp(self):
+        self.mumbai = make_advocate(
+            'MAH-1', location='Mumbai, Maharashtra', specialization='criminal',
+            experience_years=12, consultation_fee=Decimal('2000'), bio='Bail and trial work',
+        )
+        self.pune = make_advocate(
+            'MAH-2', location='Pune', specialization='family',
+            experience_years=3, consultation_fee=Decimal('800'), bio='Divorce matters, also Mumbai',
+        )
+
+    def ids(self, advocates):
+        return [advocate.pk for advocate in advocates]
+
+    def test_profile_save_keeps_index_current(self):
+        profile = self.pune.advocate_profile
+        profile.location = 'Nagpur'
+        profile.save()
+
+        self.assertEqual(self.ids(search.find_advocates('nagpur')), [self.pune.pk])
+        self.assertEqual(self.ids(search.find_advocates('pune')), [])
+
+    def test_ranks_location_above_bio_mention(self):
+        self.assertEqual(self.ids(search.find_advocates('mumbai')), [self.mumbai.pk, self.pune.pk])
+
+    def test_prefix_and_specialization_label_match(self):
+        self.assertEqual(self.ids(search.find_advocates('crimin')), [self.mumbai.pk])
+        self.assertEqual(self.ids(search.find_advocates('divorce')), [self.pune.pk])
+
+    def test_filters(self):
+        filters = search.SearchFilters.from_params({'min_fee': '1000', 'min_experience': '5'})
+        self.assertEqual(self.ids(search.find_advocates('mumbai', filters)), [self.mumbai.pk])
+
+        filters = search.SearchFilters.from_params({'specialization': 'family', 'max_fee': 'junk'})
+        self.assertEqual(self.ids(search.find_advocates('', filters)), [self.pune.pk])
+
+    def test_non_finite_fees_are_ignored(self):
+        for value in ('NaN', 'sNaN', 'Infinity', '-Infinity'):
+            filters = search.SearchFilters.from_params({'min_fee': value, 'max_fee': value})
+            self.assertEqual((filters.min_fee, filters.max_fee), (None, None))
+            response = self.client.get(reverse('search_advocates'), {'min_fee': value, 'max_fee': value})
+            self.assertEqual(response.status_code, 200)
+
+    def test_out_of_range_filters_are_clamped(self):
+        huge = '9' * 20
+        filters = search.SearchFilters.from_params({'min_fee': '-5', 'max_fee': huge, 'min_experience': huge})
+        self.assertEqual(filters.min_fee, 0)
+        self.assertEqual(filters.max_fee, search.MAX_FEE)
+        self.assertEqual(filters.min_experience, search.MAX_EXPERIENCE)
+        self.assertEqual(search.SearchFilters.from_params({'min_experience': '-3'}).min_experience, 0)
+        response = self.client.get(reverse('search_advocates'), {'min_experience': huge, 'max_fee': huge})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ids(search.find_advocates('', filters)), [])
+
+    def test_deactivated_advocate_is_dropped(self):
+        self.mumbai.is_active_advocate = False
+        self.mumbai.save()
+
+        self.assertFalse(AdvocateSearchIndex.objects.filter(user=self.mumbai).exists())
+        self.assertFalse(AdvocateSearchTerm.objects.filter(advocate=self.mumbai).exists())
+        self.assertEqual(self.ids(search.find_advocates('mumbai')), [self.pune.pk])
+
+    def test_rebuild_index(self):
+        AdvocateSearchIndex.objects.all().delete()
+        AdvocateSearchTerm.objects.all().delete()
+
+        self.assertEqual(search.rebuild_index(batch_size=1), 2)
+        self.assertEqual(self.ids(search.find_advocates('MAH-2')), [self.pune.pk, self.mumbai.pk])
+
+    def test_search_view(self):
+        response = self.client.get(reverse('search_advocates'), {'q': 'pune', 'specialization': 'family'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ids(response.context['advocates']), [self.pune.pk])
+        self.assertContains(response, 'Family Law')
+
+
+class SearchFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.mumbai = make_advocate('FC-1', location='Mumbai', specialization='criminal',
+                                    experience_years=12, consultation_fee=Decimal('2000'))
+        make_advocate('FC-2', location='Pune', specialization='family', experience_years=3,
+                      consultation_fee=Decimal('800'), bio='Also Mumbai')
+        self.delhi = make_advocate('FC-3', location='Delhi', specialization='criminal', experience_years=1,
+                                   consultation_fee=Decimal('300'))
+        # The queued recounts fill the counts table
+        jobs.work_off()
+
+    def counts(self, values):
+        return {value.label: value.count for value in values}
+
+    def test_each_facet_ignores_its_own_filter(self):
+        result = facets.facet_counts('', search.SearchFilters.from_params({'specialization': 'criminal'}))
+
+        self.assertEqual(result.total, 2)
+        self.assertEqual(self.counts(result.specializations), {'Criminal Law': 2, 'Family Law': 1})
+        self.assertEqual(self.counts(result.fee_bands), {
+            'Under ₹500': 1, '₹500 – 999': 0, '₹1,000 – 2,499': 1, '₹2,500 – 4,999': 0, '₹5,000 and above': 0,
+        })
+        self.assertEqual(self.counts(result.experience), {
+            '2+ years': 1, '5+ years': 1, '10+ years': 1, '20+ years': 0,
+        })
+
+    def test_text_search_is_one_grouped_query_then_cached(self):
+        with self.assertNumQueries(1):
+            result = facets.facet_counts('mumbai', search.SearchFilters())
+        self.assertEqual(self.counts(result.specializations), {'Criminal Law': 1, 'Family Law': 1})
+        with self.assertNumQueries(0):
+            facets.facet_counts('Mumbai', search.SearchFilters())
+
+    def test_counts_table_agrees_with_grouped_query(self):
+        for params in ({}, {'specialization': 'family'}, {'min_fee': '1000', 'max_fee': '2499.99'},
+                       {'min_fee': '500', 'min_experience': '2'}):
+            filters = search.SearchFilters.from_params(params)
+            with CaptureQueriesContext(connection) as queries:
+                from_table = facets.tally(facets._flagged(facets._table_rows(), filters), filters)
+            self.assertIn('main_advocatefacetcount', queries[0]['sql'])
+            self.assertEqual(from_table, facets.tally(facets._index_rows([], filters), filters), params)
+
+    def test_counts_table_follows_index_changes(self):
+        profile = self.delhi.advocate_profile
+        profile.consultation_fee = Decimal('1500')
+        profile.save()
+        self.mumbai.is_active_advocate = False
+        self.mumbai.save()
+        jobs.work_off()
+
+        self.assertEqual(
+            sorted(AdvocateFacetCount.objects.values_list('specialization', 'fee_band', 'advocates')),
+            [('criminal', 2, 1), ('family', 1, 1)],
+        )
+
+    def test_view_links_toggle_facets(self):
+        response = self.client.get(reverse('search_advocates'), {'specialization': 'criminal', 'cursor': 'x'})
+        result = response.context['facets']
+        criminal, family = result.specializations
+        self.assertTrue(criminal.selected)
+        self.assertEqual(criminal.query, '')
+        self.assertEqual(family.query, 'specialization=family')
+        self.assertEqual(result.fee_bands[1].query, 'specialization=criminal&min_fee=500&max_fee=999.99')
+        self.assertContains(response, '2 advocates')
+
+        response = self.client.get(reverse('search_advocates'), {'near': 'Nowhere'})
+        self.assertIsNone(response.context['facets'])
+
+
+class SearchPaginationTests(TestCase):
+    def setUp(self):
+        self.advocates = [
+            make_advocate(f'KA-{i}', location='Bengaluru', rating=Decimal(i % 3))
+            for i in range(7)
+        ]
+
+    def walk(self, query, page_size):
+        seen, cursor = [], ''
+        while True:
+            page = search.find_advocates(query, cursor=cursor, page_size=page_size)
+            seen.extend(advocate.pk for advocate in page)
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_browse_pages_by_rating_then_id(self):
+        expected = [
+            advocate.pk for advocate in
+            sorted(self.advocates, key=lambda a: (a.advocate_profile.rating, a.pk), reverse=True)
+        ]
+        self.assertEqual(self.walk('', page_size=3), expected)
+
+    def test_ranked_pages_cover_every_match_once(self):
+        seen = self.walk('bengaluru', page_size=2)
+        self.assertCountEqual(seen, [advocate.pk for advocate in self.advocates])
+
+    def test_browse_is_one_query_at_any_depth(self):
+        first = search.find_advocates(page_size=2)
+        with self.assertNumQueries(1):
+            page = search.find_advocates(cursor=first.next_cursor, page_size=2)
+            [advocate.advocate_profile.location for advocate in page]
+
+    def test_bad_cursor_starts_over(self):
+        page = search.find_advocates(cursor='not-a-cursor', page_size=50)
+        self.assertEqual(len(page), 7)
+
+    def test_view_caps_page_size(self):
+        for i in range(50):
+            make_advocate(f'TN-{i}')
+        # The page, and the facet counts
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('search_advocates'), {'page_size': 1000})
+        self.assertEqual(len(response.context['advocates']), 50)
+        self.assertIsNotNone(response.context['next_params'])
+
+
+class NearbySearchTests(TestCase):
+    def setUp(self):
+        self.mumbai = make_advocate('GEO-1', location='Andheri West, Mumbai', specialization='criminal')
+        self.thane = make_advocate('GEO-2', location='Thane', specialization='family')
+        self.vashi = make_advocate('GEO-3', location='Vashi', specialization='criminal')
+        self.pune = make_advocate('GEO-4', location='Poona', specialization='criminal')
+        self.nowhere = make_advocate('GEO-5', location='Atlantis', specialization='criminal')
+
+    def ids(self, advocates):
+        return [advocate.pk for advocate in advocates]
+
+    def near(self, query='', page_size=20, cursor='', **params):
+        filters = search.SearchFilters.from_params(params)
+        return search.find_advocates(query, filters, cursor=cursor, page_size=page_size)
+
+    def test_geohash(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geo.encode(-25.382708, -49.265506, 5), '6gkzw')
+
+    def test_covering_cells_contain_every_point_in_the_circle(self):
+        latitude, longitude, radius = 19.0760, 72.8777, 40
+        cells = geo.covering_cells(latitude, longitude, radius)
+        self.assertLessEqual(len(cells), geo.MAX_CELLS)
+        for bearing in range(0, 360, 15):
+            for km in (0, radius / 2, radius * 0.99):
+                point_latitude = latitude + km / 111.2 * math.cos(math.radians(bearing))
+                point_longitude = longitude + km / 111.2 * math.sin(math.radians(bearing)) / math.cos(math.radians(latitude))
+                self.assertLessEqual(geo.distance_km(latitude, longitude, point_latitude, point_longitude), radius)
+                point = geo.encode(point_latitude, point_longitude)
+                self.assertTrue(any(point.startswith(cell) for cell in cells), (bearing, km))
+
+    def test_gazetteer_resolves_free_text(self):
+        places = geo.gazetteer()
+        self.assertEqual(places.find('Andheri West, Mumbai').name, 'Mumbai')
+        self.assertEqual(places.find('bangalore').name, 'Bengaluru')
+        self.assertEqual(places.find('Aurangabad').state, 'Maharashtra')
+        self.assertEqual(places.find('Aurangabad, Bihar').state, 'Bihar')
+        self.assertEqual(places.find('Sector 17, Chandigarh (UT)').name, 'Chandigarh')
+        self.assertIsNone(places.find('Atlantis'))
+
+    def test_profile_save_resolves_locality_into_index(self):
+        self.assertEqual(self.pune.advocate_profile.locality.name, 'Pune')
+        self.assertIsNone(self.nowhere.advocate_profile.locality)
+        self.assertEqual(AdvocateSearchIndex.objects.get(user=self.nowhere).geohash, '')
+
+        profile = self.nowhere.advocate_profile
+        profile.location = 'Bombay'
+        profile.save()
+        index = AdvocateSearchIndex.objects.get(user=self.nowhere)
+        self.assertEqual(profile.locality.name, 'Mumbai')
+        self.assertEqual(index.geohash, geo.encode(index.latitude, index.longitude))
+
+    def test_nearest_first_within_radius(self):
+        page = self.near(near='Mumbai')
+        self.assertEqual(self.ids(page), [self.mumbai.pk, self.vashi.pk, self.thane.pk])
+        self.assertEqual(page.items[0].distance_km, 0)
+        self.assertLess(page.items[-1].distance_km, 25)
+
+        self.assertEqual(self.ids(self.near(near='Mumbai', radius='200'))[-1], self.pune.pk)
+        self.assertEqual(self.ids(self.near(lat='18.52', lng='73.86', radius='10')), [self.pune.pk])
+
+    def test_text_and_filters_narrow_a_nearby_search(self):
+        self.assertEqual(self.ids(self.near('criminal', near='Mumbai')), [self.mumbai.pk, self.vashi.pk])
+        self.assertEqual(self.ids(self.near(near='Mumbai', specialization='family')), [self.thane.pk])
+
+    def test_pages_by_distance(self):
+        seen, cursor = [], ''
+        while True:
+            page = self.near(near='Mumbai', radius='200', page_size=1, cursor=cursor)
+            seen.extend(self.ids(page))
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, [self.mumbai.pk, self.vashi.pk, self.thane.pk, self.pune.pk])
+
+    def test_two_queries_and_no_full_scan(self):
+        geo.gazetteer()
+        with self.assertNumQueries(2):
+            self.near(near='Mumbai')
+
+        filters = search.SearchFilters.from_params({'near': 'Mumbai'})
+        filters.locate(geo.gazetteer())
+        sql, params = search._nearby([], filters).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('main_search_geohash_idx', plan)
+
+    def test_view(self):
+        response = self.client.get(reverse('search_advocates'), {'near': 'Thane', 'radius': '5'})
+        self.assertEqual(self.ids(response.context['advocates']), [self.thane.pk])
+        self.assertContains(response, 'km away')
+
+        response = self.client.get(reverse('search_advocates'), {'near': 'Atlantis'})
+        self.assertTrue(response.context['unknown_place'])
+        self.assertEqual(len(response.context['advocates']), 5)
+
+    def test_load_gazetteer_command_relinks_profiles(self):
+        # The rolled back locality must not stay in the cached gazetteer
+        self.addCleanup(geo.gazetteer_changed)
+        Locality.objects.create(name='Atlantis', state='Ocean', latitude=0.0, longitude=-30.0)
+        call_command('load_gazetteer', stdout=StringIO())
+        self.nowhere.advocate_profile.refresh_from_db()
+        self.assertEqual(self.nowhere.advocate_profile.locality.name, 'Atlantis')
+        self.assertNotEqual(AdvocateSearchIndex.objects.get(user=self.nowhere).geohash, '')
+
+
+class AdvocateDashboardTests(TestCase):
+    def setUp(self):
+        self.advocate = make_advocate('DL-1')
+        self.customer = make_client('client@example.com')
+        make_bookings(self.customer, self.advocate, 3, status='pending')
+        make_bookings(self.customer, self.advocate, 2, status='completed')
+        self.client.force_login(self.advocate)
+
+    def test_status_counts(self):
+        counts = Booking.objects.filter(advocate=self.advocate).status_counts()
+        self.assertEqual(counts['total'], 5)
+        self.assertEqual(counts['pending'], 3)
+        self.assertEqual(counts['completed'], 2)
+        self.assertEqual(counts['cancelled'], 0)
+
+    def test_status_tab_and_paging(self):
+        url = reverse('advocate_dashboard')
+        response = self.client.get(url, {'status': 'pending', 'page_size': 2})
+        self.assertEqual([b.status for b in response.context['bookings']], ['pending'] * 2)
+        self.assertEqual(response.context['counts']['pending'], 3)
+
+        response = self.client.get(url, {'status': 'pending', 'page_size': 2,
+                                         'cursor': response.context['bookings'].next_cursor})
+        self.assertEqual(len(response.context['bookings']), 1)
+        self.assertFalse(response.context['bookings'].has_next)
+
+    def test_query_count_does_not_grow_with_history(self):
+        url = reverse('advocate_dashboard')
+        self.client.get(url)  # caches the signed-in user
+        before, _ = count_queries(self.client, url)
+        make_bookings(make_client('other@example.com'), self.advocate, 40)
+        after, response = count_queries(self.client, url)
+
+        self.assertEqual(before, after)
+        self.assertContains(response, 'other@example.com')
+
+
+class ClientDashboardTests(TestCase):
+    def setUp(self):
+        self.customer = make_client('client@example.com')
+        self.client.force_login(self.customer)
+
+    def test_sections_split_on_today(self):
+        advocate = make_advocate('GJ-1')
+        make_bookings(self.customer, advocate, 2, date=datetime.date(2030, 1, 1))
+        make_bookings(self.customer, advocate, 1, date=datetime.date(2020, 1, 1))
+        url = reverse('client_dashboard')
+
+        response = self.client.get(url)
+        self.assertEqual(response.context['counts']['upcoming'], 2)
+        self.assertEqual(response.context['counts']['past'], 1)
+        self.assertEqual(len(response.context['bookings']), 2)
+
+        response = self.client.get(url, {'section': 'past'})
+        self.assertEqual([b.date for b in response.context['bookings']], [datetime.date(2020, 1, 1)])
+
+    def test_constant_query_count(self):
+        for i in range(25):
+            make_bookings(self.customer, make_advocate(f'GJ-{i}', specialization='tax'), 1)
+
+        # user (the session comes from the cache), status counts, one page of bookings with advocates and profiles
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('client_dashboard'), {'page_size': 50})
+        self.assertEqual(len(response.context['bookings']), 25)
+        self.assertContains(response, 'Tax Law')
+
+
+class QueryPlanTests(TestCase):
+    """Every hot-path query must be answered from an index, not a table scan or a sort."""
+
+    # "SCAN main_booking" reads the whole table; "SCAN ... USING INDEX" walks
+    # an index in order and stops at the LIMIT, which is fine
+    FULL_SCAN = re.compile(r'\bSCAN \S+$|TEMP B-TREE', re.MULTILINE)
+
+    def assertIndexed(self, queryset):
+        plan = queryset.explain()
+        self.assertIsNone(self.FULL_SCAN.search(plan), f"{queryset.query}\n{plan}")
+
+    def test_hot_paths_use_indexes(self):
+        now = timezone.now()
+        today = now.date()
+        newest = ('-created_at', '-id')
+        bookings = Booking.objects.all()
+        querysets = [
+            # advocate dashboard: counts, all bookings, a status tab, the next page
+            bookings.filter(advocate_id=1).values('status'),
+            bookings.filter(advocate_id=1).select_related('client').order_by(*newest)[:21],
+            bookings.filter(advocate_id=1, status='pending').order_by(*newest)[:21],
+            bookings.filter(after(newest, (now, 5)), advocate_id=1).order_by(*newest)[:21],
+            # client dashboard sections and recent bookings
+            bookings.filter(client_id=1, date__gte=today).select_related('advocate__advocate_profile')
+                    .order_by('date', 'time', 'id')[:21],
+            bookings.filter(client_id=1, date__lt=today).order_by('-date', '-time', '-id')[:21],
+            bookings.filter(client_id=1).order_by(*newest)[:21],
+            # an advocate's day, reviews and booking documents
+            bookings.filter(advocate_id=1, date=today).order_by('time'),
+            Review.objects.filter(advocate_id=1).order_by(*newest)[:21],
+            Document.objects.filter(booking_id=1).order_by('uploaded_at'),
+        ]
+        for queryset in querysets:
+            with self.subTest(sql=str(queryset.query)):
+                self.assertIndexed(queryset)
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        self.advocate = make_advocate('OD-1', location='Cuttack', bio='Land records')
+        self.customer = make_client('client@example.com')
+        booking = make_bookings(self.customer, self.advocate, 1, status='completed')[0]
+        Review.objects.create(advocate=self.advocate, client=self.customer, booking=booking, rating=4,
+                              comment='Sorted out my mutation')
+        jobs.work_off()
+
+    def test_advocate_detail(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('advocate_detail', args=[self.advocate.pk]))
+        self.assertContains(response, 'Sorted out my mutation')
+        self.assertContains(response, 'Cuttack')
+        self.assertEqual(response.context['profile'].rating_histogram[1], (4, 1, 100))
+        self.assertEqual(self.client.get(reverse('advocate_detail', args=[self.customer.pk])).status_code, 404)
+
+    def test_advocate_detail_pages_reviews(self):
+        bookings = make_bookings(self.customer, self.advocate, views.REVIEWS_PAGE_SIZE + 5, status='completed')
+        Review.objects.bulk_create([
+            Review(advocate=self.advocate, client=self.customer, booking=booking, rating=5, comment=f'Review {i}')
+            for i, booking in enumerate(bookings)
+        ])
+        url = reverse('advocate_detail', args=[self.advocate.pk])
+        first = self.client.get(url)
+        self.assertEqual(len(first.context['reviews']), views.REVIEWS_PAGE_SIZE)
+        with self.assertNumQueries(1):
+            second = self.client.get(url, {'cursor': first.context['reviews'].next_cursor})
+        self.assertEqual(len(second.context['reviews']), 6)
+        self.assertFalse(second.context['reviews'].has_next)
+        seen = [review.pk for page in (first, second) for review in page.context['reviews']]
+        self.assertEqual(len(set(seen)), Review.objects.filter(advocate=self.advocate).count())
+
+    def test_advocate_without_reviews(self):
+        quiet = make_advocate('OD-2')
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('advocate_detail', args=[quiet.pk]))
+        self.assertContains(response, 'No reviews yet')
+
+    def test_search_and_home(self):
+        response = self.client.get(reverse('search_advocates'), {'q': 'cuttack'})
+        self.assertEqual(list(response.context['advocates']), [self.advocate])
+        self.assertContains(self.client.get(reverse('home')), reverse('advocate_detail', args=[self.advocate.pk]))
+
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        self.advocate = make_advocate('CF-1')
+        self.customer = make_client('cf@example.com')
+        self.customer.first_name, self.customer.last_name = 'Meera', 'Rao'
+        self.customer.save()
+        self.bookings = make_bookings(self.customer, self.advocate, 3)
+        first = self.bookings[0]
+        first.purpose = 'Property dispute, Noida; ' + 'documents to review ' * 5
+        first.meeting_link = 'https://meet.example.com/cf-1'
+        first.status = 'accepted'
+        first.save()
+        self.bookings[2].status = 'cancelled'
+        self.bookings[2].save()
+        self.url = reverse('booking_calendar', args=[self.advocate.pk, self.advocate.calendar_token])
+
+    def feed(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        return b''.join(response.streaming_content).decode()
+
+    def test_feed_lists_active_bookings(self):
+        with self.assertNumQueries(3):
+            body = self.feed(self.client.get(self.url))
+        first, second, cancelled = self.bookings
+        self.assertIn(f'UID:booking-{first.pk}@', body)
+        self.assertIn(f'UID:booking-{second.pk}@', body)
+        self.assertNotIn(f'UID:booking-{cancelled.pk}@', body)
+        self.assertIn('SUMMARY:Consultation with Meera Rao', body)
+        self.assertIn('DTSTART:20300101T100000', body)
+        self.assertIn('STATUS:CONFIRMED', body)
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n'))
+        self.assertTrue(all(len(line.encode()) <= 75 for line in body.split('\r\n')))
+        # Unfolded, the description is escaped text
+        self.assertIn('DESCRIPTION:Property dispute\\, Noida\\; documents', body.replace('\r\n ', ''))
+        self.assertIn('Meeting link: https://meet.example.com/cf-1', body.replace('\r\n ', ''))
+
+    def test_client_feed(self):
+        url = reverse('booking_calendar', args=[self.customer.pk, self.customer.calendar_token])
+        body = self.feed(self.client.get(url))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+        self.assertIn('SUMMARY:Consultation with CF-1', body)
+
+    def test_unchanged_poll_is_not_modified(self):
+        response = self.client.get(self.url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        self.bookings[1].status = 'accepted'
+        self.bookings[1].save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.feed(response).count('STATUS:CONFIRMED'), 2)
+
+        etag = response['ETag']
+        self.bookings[0].delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_token_is_checked_and_can_be_reset(self):
+        wrong = reverse('booking_calendar', args=[self.advocate.pk, 'x' * 43])
+        self.assertEqual(self.client.get(wrong).status_code, 404)
+
+        self.client.force_login(self.advocate)
+        response = self.client.post(reverse('reset_calendar_token'))
+        self.assertRedirects(response, reverse('advocate_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.advocate.refresh_from_db()
+        url = reverse('booking_calendar', args=[self.advocate.pk, self.advocate.calendar_token])
+        self.assertContains(self.client.get(reverse('advocate_dashboard')), url)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_token_is_read_from_the_database(self):
+        # Reset by another process: this one's cached copy still has the old token
+        usercache.get_user(self.advocate.pk)
+        User.objects.filter(pk=self.advocate.pk).update(calendar_token=new_calendar_token())
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        # Anonymous polls leave the signed-in user cache alone
+        usercache.users.clear()
+        self.client.get(self.url)
+        self.assertIsNone(usercache.users.get(self.advocate.pk))
+
+    async def test_asgi_streams_from_async_iterator(self):
+        response = await self.async_client.get(self.url)
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+
+    def test_fold_keeps_multibyte_characters_whole(self):
+        folded = ical.fold('SUMMARY:' + 'न्याय' * 30)
+        lines = folded.split('\r\n')[:-1]
+        self.assertTrue(all(len(line.encode()) <= 75 for line in lines))
+        self.assertEqual(''.join(line[1:] if i else line for i, line in enumerate(lines)), 'SUMMARY:' + 'न्याय' * 30)
+
+
+class RatingCounterTests(TestCase):
+    def setUp(self):
+        self.advocate = make_advocate('UP-1')
+        customer = make_client('client@example.com')
+        self.bookings = make_bookings(customer, self.advocate, 3, status='completed')
+        self.customer = customer
+
+    def review(self, booking, rating):
+        return Review.objects.create(advocate=self.advocate, client=self.customer, booking=booking, rating=rating)
+
+    def profile(self):
+        # Counters are updated by the ratings.apply_review job
+        jobs.work_off()
+        return AdvocateProfile.objects.get(user=self.advocate)
+
+    def test_create_edit_delete(self):
+        first = self.review(self.bookings[0], '5')
+        self.review(self.bookings[1], 2)
+        profile = self.profile()
+        self.assertEqual((profile.rating_sum, profile.rating_count, profile.rating), (7, 2, Decimal('3.50')))
+        self.assertEqual(AdvocateSearchIndex.objects.get(user=self.advocate).rating, Decimal('3.50'))
+
+        first = Review.objects.get(pk=first.pk)
+        first.rating = 3
+        first.save()
+        self.assertEqual(self.profile().rating, Decimal('2.50'))
+
+        profile = self.profile()
+        self.assertEqual([profile.stars_2, profile.stars_3, profile.stars_5], [1, 1, 0])
+
+        first.delete()
+        profile = self.profile()
+        self.assertEqual((profile.rating_sum, profile.rating_count, profile.rating), (2, 1, Decimal('2.00')))
+        self.assertEqual([count for _, count, _ in profile.rating_histogram], [0, 0, 0, 1, 0])
+
+    def test_profile_edit_does_not_clobber_counters(self):
+        stale = self.profile()
+        self.review(self.bookings[0], 4)
+        stale.location = 'Lucknow'
+        stale.save(update_fields=['location'])
+        self.assertEqual(self.profile().rating_count, 1)
+
+    def test_rebuild_repairs_drift(self):
+        self.review(self.bookings[0], 4)
+        jobs.work_off()
+        AdvocateProfile.objects.filter(user=self.advocate).update(rating_sum=0, rating_count=9, rating=0, stars_1=3)
+
+        call_command('rebuild_ratings', batch_size=1, stdout=StringIO())
+        profile = self.profile()
+        self.assertEqual((profile.rating_sum, profile.rating_count, profile.rating), (4, 1, Decimal('4.00')))
+        self.assertEqual((profile.stars_1, profile.stars_4), (0, 1))
+
+    def test_ratings_outside_one_to_five_are_refused(self):
+        for rating in ('9', '0', 'five', ''):
+            request = RequestFactory().post('/', {'rating': rating, 'comment': 'Great'})
+            request.user, request.session = self.customer, {}
+            request._messages = FallbackStorage(request)
+            response = views.add_review(request, self.bookings[0].pk)
+            self.assertEqual(response.status_code, 302)
+            self.assertIn('1 to 5 stars', str(list(get_messages(request))[0]))
+        self.assertFalse(Review.objects.exists())
+
+        with self.assertRaises(ValueError):
+            ratings.apply_review(self.advocate.pk, added=[9])
+        self.assertEqual(self.profile().rating_count, 0)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.advocate = make_advocate('JQ-1')
+        self.customer = make_client('jq@example.com')
+        # Start from an empty queue (creating the advocate queued facet recounts)
+        Job.objects.all().delete()
+        self.calls = []
+        self.addCleanup(jobs.HANDLERS.pop, 'test.flaky', None)
+
+    def flaky(self, failures):
+        @jobs.handler('test.flaky', batch=True, max_attempts=3)
+        def flaky(payloads):
+            self.calls.append([payload['n'] for payload in payloads])
+            if any(payload['n'] < failures for payload in payloads):
+                raise ValueError("boom")
+
+    def test_status_change_mails_the_client_and_counts_cases(self):
+        booking, = make_bookings(self.customer, self.advocate, 1, status='accepted')
+        self.client.force_login(self.advocate)
+        for _ in range(2):
+            self.client.post(reverse('update_booking_status', args=[booking.pk]), {'status': 'completed'})
+        self.assertEqual(mail.outbox, [])
+
+        jobs.work_off()
+        self.assertEqual([message.to for message in mail.outbox], [['jq@example.com']])
+        self.assertIn("completed", mail.outbox[0].body)
+        self.assertEqual(AdvocateProfile.objects.get(user=self.advocate).total_cases, 1)
+
+    def test_returning_to_a_status_mails_again(self):
+        booking, = make_bookings(self.customer, self.advocate, 1)
+        self.client.force_login(self.advocate)
+        for status in ('accepted', 'rejected', 'accepted'):
+            self.client.post(reverse('update_booking_status', args=[booking.pk]), {'status': status})
+        jobs.work_off()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn("accepted", mail.outbox[2].body)
+
+    def test_review_changes_are_batched_per_advocate(self):
+        bookings = make_bookings(self.customer, self.advocate, 3, status='completed')
+        for booking in bookings:
+            Review.objects.create(advocate=self.advocate, client=self.customer, booking=booking, rating=5)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(jobs.work_off(), 3)
+        counter_updates = [query for query in queries if '"rating_count" = (' in query['sql']]
+        self.assertEqual(len(counter_updates), 1)
+        profile = AdvocateProfile.objects.get(user=self.advocate)
+        self.assertEqual((profile.rating_count, profile.stars_5), (3, 3))
+
+    def test_failure_is_retried_with_backoff_then_kept(self):
+        self.flaky(failures=99)
+        jobs.enqueue(Job(kind='test.flaky', payload={'n': 0}))
+
+        for attempt in range(1, 4):
+            Job.objects.update(run_after=timezone.now())
+            jobs.work_off()
+            job = Job.objects.get()
+            self.assertEqual(job.attempts, attempt)
+        self.assertEqual(job.status, jobs.FAILED)
+        self.assertIn("ValueError: boom", job.last_error)
+
+        jobs.enqueue(Job(kind='test.flaky', payload={'n': 1}))
+        jobs.work_off()
+        job = Job.objects.get(payload__n=1)
+        self.assertEqual(job.status, jobs.QUEUED)
+        self.assertGreater(job.run_after, timezone.now())
+
+    def test_bad_payload_does_not_hold_back_its_batch(self):
+        self.flaky(failures=1)
+        jobs.enqueue(*[Job(kind='test.flaky', payload={'n': n}) for n in range(3)])
+
+        jobs.work_off()
+        self.assertEqual(self.calls, [[0, 1, 2], [0], [1], [2]])
+        self.assertEqual(
+            dict(Job.objects.values_list('payload__n', 'status')),
+            {0: jobs.QUEUED, 1: jobs.DONE, 2: jobs.DONE},
+        )
+
+    def test_idempotency_key(self):
+        for _ in range(2):
+            jobs.enqueue(Job(kind='test.flaky', payload={'n': 1}, key='once'))
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_expired_lease_is_claimed_again(self):
+        self.flaky(failures=0)
+        jobs.enqueue(Job(kind='test.flaky', payload={'n': 1}))
+        self.assertEqual(len(jobs.claim(10)), 1)
+        # The worker died: nothing is due until the lease runs out
+        self.assertEqual(jobs.claim(10), [])
+
+        Job.objects.update(run_after=timezone.now())
+        call_command('run_jobs', once=True, stdout=StringIO())
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (jobs.DONE, 2))
+
+
+class AvailabilityTests(TestCase):
+    monday = datetime.date(2030, 1, 7)
+
+    def setUp(self):
+        self.advocate = make_advocate('WB-1')
+        AdvocateAvailability.objects.create(
+            advocate=self.advocate, weekday=0, start_time=datetime.time(10), end_time=datetime.time(11, 30),
+            slot_minutes=30,
+        )
+        self.customer = make_client('client@example.com')
+
+    def book(self, time, **fields):
+        return availability.book_slot(self.customer, self.advocate, self.monday, time, purpose='Advice', **fields)
+
+    def test_free_slots_skip_booked_and_off_days(self):
+        self.book(datetime.time(10, 30))
+        slots = availability.free_slots([self.advocate.pk], self.monday, days=2)[self.advocate.pk]
+
+        self.assertEqual(slots[self.monday], [datetime.time(10), datetime.time(11)])
+        self.assertEqual(slots[self.monday + datetime.timedelta(days=1)], [])
+
+    def test_slot_cannot_be_booked_twice(self):
+        self.book(datetime.time(10))
+        with self.assertRaises(availability.SlotUnavailable):
+            self.book(datetime.time(10))
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_time_outside_working_hours_is_rejected(self):
+        with self.assertRaises(availability.SlotUnavailable):
+            self.book(datetime.time(10, 15))
+
+    def test_cancelling_releases_the_slot(self):
+        booking = self.book(datetime.time(10))
+        self.client.force_login(self.advocate)
+        self.client.post(reverse('update_booking_status', args=[booking.pk]), {'status': 'cancelled'})
+
+        self.assertFalse(BookingSlot.objects.exists())
+        self.book(datetime.time(10))
+
+    def test_reaccepting_reclaims_the_slot(self):
+        booking = self.book(datetime.time(10))
+        url = reverse('update_booking_status', args=[booking.pk])
+        self.client.force_login(self.advocate)
+        self.client.post(url, {'status': 'cancelled'})
+        self.client.post(url, {'status': 'accepted'})
+        self.assertEqual(BookingSlot.objects.get().booking, booking)
+        with self.assertRaises(availability.SlotUnavailable):
+            self.book(datetime.time(10))
+
+        # Taken by someone else meanwhile: the booking stays cancelled
+        self.client.post(url, {'status': 'cancelled'})
+        other = self.book(datetime.time(10))
+        response = self.client.post(url, {'status': 'accepted'}, follow=True)
+        self.assertContains(response, 'booked by someone else')
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'cancelled')
+        self.assertEqual(BookingSlot.objects.get().booking, other)
+
+    def test_bulk_endpoint_is_two_queries(self):
+        others = [make_advocate(f'WB-{i}') for i in range(2, 6)]
+        ids = ','.join(str(a.pk) for a in [self.advocate] + others)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('advocate_availability'),
+                                       {'advocates': ids, 'start': '2030-01-07', 'days': 7})
+        slots = response.json()['slots']
+        self.assertEqual(list(slots), [str(self.advocate.pk)])
+        self.assertEqual(slots[str(self.advocate.pk)]['2030-01-07'], ['10:00', '10:30', '11:00'])
+
+    def test_book_view(self):
+        self.client.force_login(self.customer)
+        url = reverse('book_consultation', args=[self.advocate.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.client.post(url, {'slot': '2030-01-07 11:00', 'purpose': 'Lease review'})
+        response = self.client.post(url, {'slot': '2030-01-07 11:00', 'purpose': 'Lease review'}, follow=True)
+
+        self.assertEqual(Booking.objects.get().time, datetime.time(11))
+        self.assertContains(response, 'just been booked')
+
+    def test_impossible_dates_are_rejected(self):
+        self.client.force_login(self.customer)
+        url = reverse('book_consultation', args=[self.advocate.pk])
+        response = self.client.post(url, {'date': '2031-02-30', 'time': '10:00', 'purpose': 'Advice'}, follow=True)
+        self.assertContains(response, 'Please choose a date')
+        response = self.client.post(url, {'slot': '2030-01-07 25:00', 'purpose': 'Advice'}, follow=True)
+        self.assertContains(response, 'Please choose a date')
+        self.assertFalse(Booking.objects.exists())
+
+        response = self.client.get(reverse('advocate_availability'),
+                                   {'advocates': self.advocate.pk, 'start': '2026-02-30'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings_override = override_settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.advocate = make_advocate('KL-1')
+        self.customer = make_client('client@example.com')
+        self.booking = make_bookings(self.customer, self.advocate, 1)[0]
+        self.client.force_login(self.customer)
+        self.content = bytes(range(256)) * 9000  # a little over two chunks
+
+    def upload(self, content, title='Sale deed', fail_after=None):
+        state = self.client.post(reverse('start_document_upload', args=[self.booking.pk]), {
+            'filename': 'deed.pdf', 'size': len(content), 'title': title,
+        }).json()
+        chunks = [content[i:i + uploads.CHUNK_SIZE] for i in range(0, len(content), uploads.CHUNK_SIZE)]
+        for index, chunk in enumerate(chunks[:fail_after]):
+            self.client.post(
+                reverse('upload_document_chunk', args=[state['upload_id'], index]), chunk,
+                content_type='application/octet-stream', HTTP_X_CHUNK_SHA256=hashlib.sha256(chunk).hexdigest(),
+            )
+        return state['upload_id'], chunks
+
+    def complete(self, upload_id):
+        return self.client.post(reverse('complete_document_upload', args=[upload_id]))
+
+    def test_upload_resume_and_dedup(self):
+        upload_id, chunks = self.upload(self.content, fail_after=1)
+        status = self.client.get(reverse('document_upload_status', args=[upload_id])).json()
+        self.assertEqual(status['next_chunk'], 1)
+        self.assertEqual(self.complete(upload_id).status_code, 409)
+
+        for index in range(1, len(chunks)):
+            self.client.post(reverse('upload_document_chunk', args=[upload_id, index]), chunks[index],
+                             content_type='application/octet-stream')
+        self.assertEqual(self.complete(upload_id).status_code, 200)
+
+        document = Document.objects.get()
+        with document.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertEqual(document.filename, 'deed.pdf')
+        self.assertFalse(UploadSession.objects.exists())
+
+        # Same bytes through the one-shot form share the blob
+        self.client.post(reverse('upload_document', args=[self.booking.pk]), {
+            'title': 'Copy', 'file': SimpleUploadedFile('copy.pdf', self.content),
+        })
+        self.assertEqual(Document.objects.count(), 2)
+        self.assertEqual(DocumentBlob.objects.count(), 1)
+
+    def test_out_of_order_and_corrupt_chunks_are_rejected(self):
+        upload_id, chunks = self.upload(self.content, fail_after=0)
+        response = self.client.post(reverse('upload_document_chunk', args=[upload_id, 1]), chunks[1],
+                                    content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 409)
+
+        response = self.client.post(reverse('upload_document_chunk', args=[upload_id, 0]), chunks[0],
+                                    content_type='application/octet-stream', HTTP_X_CHUNK_SHA256='0' * 64)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(UploadSession.objects.get().received, 0)
+
+    def test_other_users_cannot_touch_an_upload(self):
+        upload_id, _ = self.upload(self.content, fail_after=0)
+        self.client.force_login(make_client('intruder@example.com'))
+        self.assertEqual(self.client.get(reverse('document_upload_status', args=[upload_id])).status_code, 404)
+
+    def test_lost_partial_file_fails_the_upload(self):
+        upload_id, chunks = self.upload(self.content, fail_after=1)
+        uploads.partial_path(UploadSession.objects.get()).unlink()
+
+        response = self.client.post(reverse('upload_document_chunk', args=[upload_id, 1]), chunks[1],
+                                    content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('start the upload again', response.json()['error'])
+        self.assertTrue(self.client.get(reverse('document_upload_status', args=[upload_id])).json()['failed'])
+        self.assertEqual(self.complete(upload_id).status_code, 409)
+
+        upload_id, _ = self.upload(self.content)
+        uploads.partial_path(UploadSession.objects.get(pk=upload_id)).unlink()
+        self.assertEqual(self.complete(upload_id).status_code, 409)
+        self.assertTrue(UploadSession.objects.get(pk=upload_id).failed)
+        self.assertFalse(Document.objects.exists())
+
+
+def make_picture(size=(1200, 800), name='photo.png'):
+    buffer = BytesIO()
+    Image.new('RGBA', size, (200, 40, 40, 128)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ProfileThumbnailTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings_override = override_settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.advocate = make_advocate('TH-1')
+
+    def upload(self, picture):
+        self.client.force_login(self.advocate)
+        self.client.post(reverse('edit_advocate_profile'), {
+            'specialization': 'civil', 'experience_years': 3, 'consultation_fee': 500,
+            'profile_picture': picture,
+        })
+        self.advocate.refresh_from_db()
+        return self.advocate.profile_picture.name
+
+    def test_upload_queues_variants_off_the_request(self):
+        name = self.upload(make_picture())
+        self.assertEqual(self.advocate.profile_picture_variants, '')
+        self.assertNotIn('<picture>', self.client.get(reverse('advocate_detail', args=[self.advocate.pk])).content.decode())
+
+        jobs.work_off()
+        for size in thumbnails.SIZES:
+            for extension, _, _ in thumbnails.FORMATS:
+                with Image.open(Path(self.media) / thumbnails.variant_name(name, size, extension)) as image:
+                    self.assertEqual(image.size, (size, size))
+        html = self.client.get(reverse('advocate_detail', args=[self.advocate.pk])).content.decode()
+        self.assertIn(f'{thumbnails.variant_name(name, 64, "webp")} 64w', html)
+        self.assertIn(f'src="/media/{thumbnails.variant_name(name, 128, "jpg")}"', html)
+
+    def test_new_picture_replaces_the_old_variants(self):
+        old = self.upload(make_picture())
+        jobs.work_off()
+        new = self.upload(make_picture(name='new.png'))
+        jobs.work_off()
+
+        self.advocate.refresh_from_db()
+        self.assertEqual(self.advocate.profile_picture_variants, new)
+        self.assertFalse(any((Path(self.media) / variant).exists() for variant in thumbnails.variant_names(old)))
+
+    def test_later_edits_keep_the_variants(self):
+        name = self.upload(make_picture())
+        jobs.work_off()
+        self.client.post(reverse('edit_advocate_profile'), {
+            'specialization': 'family', 'experience_years': 4, 'consultation_fee': 600,
+        })
+        jobs.work_off()
+
+        self.advocate.refresh_from_db()
+        self.assertEqual(self.advocate.profile_picture.name, name)
+        self.assertEqual(self.advocate.profile_picture_variants, name)
+
+    def test_variants_are_regenerated_after_a_finished_job(self):
+        name = self.upload(make_picture())
+        jobs.work_off()
+        User.objects.filter(pk=self.advocate.pk).update(profile_picture_variants='')
+        self.advocate.refresh_from_db()
+        self.advocate.save()
+        jobs.work_off()
+
+        self.advocate.refresh_from_db()
+        self.assertEqual(self.advocate.profile_picture_variants, name)
+
+    def test_invalid_picture_is_rejected(self):
+        self.upload(SimpleUploadedFile('photo.png', b'not an image', content_type='image/png'))
+        self.assertFalse(self.advocate.profile_picture)
+        self.assertEqual(AdvocateProfile.objects.get(user=self.advocate).specialization, '')
+
+    def test_regenerate_command(self):
+        name = self.upload(make_picture())
+        Job.objects.all().delete()
+        call_command('regenerate_thumbnails', missing=True, stdout=StringIO())
+
+        self.advocate.refresh_from_db()
+        self.assertEqual(self.advocate.profile_picture_variants, name)
+        self.assertTrue((Path(self.media) / thumbnails.variant_name(name, 256, 'webp')).exists())
+
+
+class HomeShowcaseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.advocates = [make_advocate(f'OR-{i}', rating=Decimal(i)) for i in range(1, 5)]
+
+    def shown(self):
+        return [advocate['id'] for advocate in showcase.get_showcase()]
+
+    def test_cache_hit_needs_no_queries(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'OR-4')
+
+    def test_relevant_changes_invalidate(self):
+        self.assertEqual(self.shown()[0], self.advocates[-1].pk)
+
+        newcomer = make_advocate('OR-9', rating=Decimal('4.50'))
+        self.assertEqual(self.shown()[0], newcomer.pk)
+
+        newcomer.is_active_advocate = False
+        newcomer.save()
+        self.assertNotIn(newcomer.pk, self.shown())
+
+    def test_irrelevant_change_keeps_entry(self):
+        for i in range(5, 8):
+            make_advocate(f'OR-{i}', rating=Decimal(i - 3))
+        self.shown()
+        generation = cache.get(showcase.GENERATION_KEY)
+
+        make_advocate('OR-LOW', rating=Decimal('0.50'))
+        self.assertEqual(cache.get(showcase.GENERATION_KEY), generation)
+
+    def test_stale_entry_served_while_rebuild_is_locked(self):
+        before = self.shown()
+        showcase.invalidate()
+        cache.add(showcase.LOCK_KEY, 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.shown(), before)
+
+
+class RoleCredentialBackendTests(TestCase):
+    def setUp(self):
+        self.advocate = make_advocate('AP-1')
+        self.customer = make_client('client@example.com')
+
+    def test_single_query_per_role(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(role='client', credential='client@example.com', password='secret'),
+                             self.customer)
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(role='advocate', credential='AP-1', password='secret'), self.advocate)
+
+    def test_role_must_match(self):
+        self.assertIsNone(authenticate(role='advocate', credential='client@example.com', password='secret'))
+        self.assertIsNone(authenticate(role='client', credential='client@example.com', password='wrong'))
+
+    def test_unknown_account_still_hashes(self):
+        with mock.patch('django.contrib.auth.base_user.make_password', wraps=make_password) as hasher:
+            self.assertIsNone(authenticate(role='client', credential='nobody@example.com', password='secret'))
+        hasher.assert_called_once_with('secret')
+
+    def test_login_view_hides_whether_account_exists(self):
+        url = reverse('login')
+        unknown = self.client.post(url, {'role': 'client', 'credential': 'nobody@example.com', 'password': 'x'})
+        wrong = self.client.post(url, {'role': 'client', 'credential': 'client@example.com', 'password': 'x'})
+        self.assertEqual(
+            [str(m) for m in unknown.context['messages']], [str(m) for m in wrong.context['messages']],
+        )
+
+        response = self.client.post(url, {'role': 'advocate', 'credential': 'AP-1', 'password': 'secret'})
+        self.assertRedirects(response, reverse('advocate_dashboard'))
+
+    def test_failed_login_sends_signal(self):
+        failures = []
+
+        def receiver(sender, credentials, request, **kwargs):
+            failures.append(credentials)
+
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+        self.client.post(reverse('login'), {'role': 'client', 'credential': 'client@example.com', 'password': 'x'})
+        self.client.post(reverse('login'), {'role': 'advocate', 'credential': 'AP-1', 'password': 'secret'})
+
+        self.assertEqual(failures, [{'role': 'client', 'credential': 'client@example.com', 'password': '*' * 20}])
+
+
+class SignedInUserCacheTests(TestCase):
+    def setUp(self):
+        self.advocate = make_advocate('UC-1', specialization='tax')
+        self.client.force_login(self.advocate)
+        self.url = reverse('edit_advocate_profile')
+        self.client.get(self.url)
+
+    def test_signed_in_pages_skip_session_and_user_queries(self):
+        # The profile comes with the cached user
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['user'].advocate_profile.specialization, 'tax')
+
+    def test_instances_are_not_shared(self):
+        first, second = usercache.get_user(self.advocate.pk), usercache.get_user(self.advocate.pk)
+        self.assertIsNot(first, second)
+        self.assertIsNot(first.advocate_profile, second.advocate_profile)
+        first.first_name = 'Changed'
+        self.assertEqual(usercache.get_user(self.advocate.pk).first_name, '')
+
+    def test_saves_evict(self):
+        self.client.post(self.url, {'specialization': 'civil', 'experience_years': 3, 'consultation_fee': 500})
+        self.assertEqual(usercache.get_user(self.advocate.pk).advocate_profile.specialization, 'civil')
+
+        self.advocate.set_password('changed')
+        self.advocate.save()
+        # The old session's auth hash no longer matches
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    @override_settings(AUTH_USER_CACHE_TTL=0)
+    def test_entries_expire(self):
+        User.objects.filter(pk=self.advocate.pk).update(first_name='Elsewhere')
+        self.assertEqual(usercache.get_user(self.advocate.pk).first_name, 'Elsewhere')
+
+    def test_purge_expired_sessions(self):
+        Session.objects.bulk_create([
+            Session(session_key=f'old{i}', session_data='', expire_date=timezone.now() - datetime.timedelta(days=1))
+            for i in range(5)
+        ])
+        call_command('purge_sessions', batch_size=2, stdout=StringIO())
+        self.assertEqual(Session.objects.count(), 1)
+
+
+class AsyncAuthViewTests(TestCase):
+    def test_register_advocate_then_login(self):
+        response = self.client.post(reverse('register_advocate'), {
+            'username': 'Asha', 'email': 'asha@example.com', 'bar_council_number': 'HR-7', 'password': 'pw',
+        })
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        user = User.objects.get(bar_council_number='HR-7')
+        self.assertTrue(user.is_active_advocate)
+        self.assertTrue(AdvocateProfile.objects.filter(user=user).exists())
+
+        response = self.client.post(reverse('register_advocate'), {
+            'username': 'Other', 'email': 'other@example.com', 'bar_council_number': 'HR-7', 'password': 'pw',
+        })
+        self.assertContains(response, 'Bar Council Number already registered')
+
+        response = self.client.post(reverse('login'), {'role': 'advocate', 'credential': 'HR-7', 'password': 'pw'})
+        self.assertRedirects(response, reverse('advocate_dashboard'))
+
+    def test_register_client(self):
+        self.client.post(reverse('register_client'), {
+            'username': 'Ravi', 'email': 'ravi@example.com', 'password': 'pw',
+        })
+        user = User.objects.get(email='ravi@example.com')
+        self.assertTrue(user.check_password('pw'))
+        self.assertEqual(user.role, 'client')
+
+    @override_settings(PASSWORD_HASHING_MAX_PENDING=0)
+    def test_saturated_pool_sheds_load(self):
+        make_client('client@example.com')
+        rejected = hashing.stats()['rejected']
+
+        response = self.client.post(reverse('login'), {
+            'role': 'client', 'credential': 'client@example.com', 'password': 'secret',
+        })
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertEqual(hashing.stats()['rejected'], rejected + 1)
+
+    async def test_failed_hash_is_not_counted_as_completed(self):
+        completed = hashing.stats()['completed']
+        with self.assertRaises(ValueError):
+            await hashing.run(int, 'not a number')
+        self.assertEqual(hashing.stats()['completed'], completed)
+        await hashing.run(int, '3')
+        self.assertEqual(hashing.stats()['completed'], completed + 1)
+
+
+class AdvocateImportTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def roster(self, name, text):
+        path = f'{self.directory}/{name}'
+        with open(path, 'w') as roster:
+            roster.write(text)
+        return path
+
+    def test_csv_import(self):
+        make_advocate('KA-1')
+        path = self.roster('roster.csv', (
+            "bar_council_number,email,first_name,password,specialization,location,experience_years\n"
+            "KA-2,two@example.com,Asha,pw,Tax,Bengaluru,7\n"
+            "KA-3,three@example.com,Bala,,civil,Mysuru,\n"
+            "KA-1,new@example.com,Dup,,,,\n"
+            "KA-4,two@example.com,Dup,,,,\n"
+            "KA-5,not-an-email,Bad,,,,\n"
+        ))
+        out, err = StringIO(), StringIO()
+        call_command('import_advocates', path, workers=2, stdout=out, stderr=err)
+
+        self.assertIn("Imported 2 advocates (2 duplicates, 1 invalid)", out.getvalue())
+        self.assertIn("Row 5: invalid email", err.getvalue())
+        self.assertEqual(authenticate(role='advocate', credential='KA-2', password='pw').first_name, 'Asha')
+        self.assertFalse(User.objects.get(bar_council_number='KA-3').has_usable_password())
+        profile = AdvocateProfile.objects.get(user__bar_council_number='KA-2')
+        self.assertEqual((profile.specialization, profile.experience_years), ('tax', 7))
+        self.assertEqual(list(search.find_advocates('bengaluru')), [profile.user])
+
+    def test_duplicates_ignore_case_and_include_usernames(self):
+        User.objects.create_user(username='ka-9', email='someone@example.com', role='client')
+        make_advocate('KA-1')
+        path = self.roster('roster.jsonl', (
+            '{"bar_council_number": "KA-9", "email": "nine@example.com"}\n'
+            '{"bar_council_number": "ka-1", "email": "one@example.com"}\n'
+            '{"bar_council_number": "KA-2", "email": "two@example.com"}\n'
+            '{"bar_council_number": "ka-2", "email": "other@example.com"}\n'
+            '{"bar_council_number": "KA-3", "email": "TWO@example.com"}\n'
+        ))
+        stats = onboarding.import_roster(path, workers=1)
+
+        self.assertEqual((stats.created, stats.duplicates), (1, 4))
+        self.assertEqual([number for number, _ in stats.errors], [1, 2, 4, 5])
+        self.assertIn('existing user', stats.errors[0][1])
+        self.assertIn('earlier row', stats.errors[2][1])
+        self.assertEqual(User.objects.get(email='two@example.com').bar_council_number, 'KA-2')
+
+    def test_resume_after_failure(self):
+        path = self.roster('roster.jsonl', ''.join(
+            f'{{"bar_council_number": "TN-{i}", "email": "tn{i}@example.com"}}\n' for i in range(5)
+        ))
+        checkpoint = f'{path}.progress'
+        insert = onboarding._insert
+        calls = []
+
+        def flaky_insert(batch):
+            calls.append(batch)
+            if len(calls) == 3:
+                raise RuntimeError("connection lost")
+            return insert(batch)
+
+        with mock.patch.object(onboarding, '_insert', flaky_insert):
+            with self.assertRaises(RuntimeError):
+                onboarding.import_roster(path, batch_size=2, workers=1, checkpoint=checkpoint)
+        self.assertEqual(onboarding.read_checkpoint(checkpoint, path), 4)
+        self.assertEqual(User.objects.filter(role='advocate').count(), 4)
+
+        stats = onboarding.import_roster(path, batch_size=2, workers=1, checkpoint=checkpoint)
+        self.assertEqual((stats.resumed_from, stats.rows, stats.created), (4, 1, 1))
+        self.assertEqual(User.objects.filter(role='advocate').count(), 5)
+        self.assertFalse(Path(checkpoint).exists())
+
+
+class BenchmarkTests(TestCase):
+    def test_every_view_within_query_budget(self):
+        benchmark.seed(benchmark.Dataset(advocates=3, clients=4, bookings=90, reviews=5, documents=3))
+        self.assertEqual(Booking.objects.count(), 90)
+        self.assertEqual(Review.objects.count(), 5)
+
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            results = benchmark.run(iterations=1, warmup=1)
+        self.assertEqual(benchmark.check(results), [])
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+
+    def scrape(self, **headers):
+        response = self.client.get(reverse('metrics'), **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_latency_sql_and_templates_per_view(self):
+        self.client.force_login(make_client('client@example.com'))
+        self.client.get(reverse('client_dashboard'))
+        self.client.get('/no/such/page/')
+
+        text = self.scrape()
+        self.assertIn('bookmyadvocate_request_duration_seconds_count{method="GET",view="client_dashboard"} 1\n', text)
+        self.assertIn('bookmyadvocate_request_duration_seconds_bucket{method="GET",view="client_dashboard",le="+Inf"} 1\n',
+                      text)
+        self.assertIn('bookmyadvocate_db_queries_total{view="client_dashboard"} 3.0\n', text)
+        self.assertIn('bookmyadvocate_template_render_seconds_count{view="client_dashboard"} 1\n', text)
+        self.assertIn('bookmyadvocate_responses_total{status="404",view="unmatched"} 1.0\n', text)
+
+    def test_async_views_are_measured(self):
+        make_client('client@example.com')
+        self.client.post(reverse('login'), {'role': 'client', 'credential': 'client@example.com', 'password': 'secret'})
+        text = self.scrape()
+        self.assertIn('bookmyadvocate_responses_total{status="302",view="login"} 1.0\n', text)
+        self.assertRegex(text, r'bookmyadvocate_db_queries_total\{view="login"\} [1-9]')
+        self.assertIn('# TYPE bookmyadvocate_password_hashing_pending gauge\n', text)
+        self.assertIn('bookmyadvocate_password_hashing_pending 0.0\n', text)
+        self.assertIn('bookmyadvocate_password_hashing_queued 0.0\n', text)
+
+    def test_processes_are_added_up(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        other = {
+            'counters': [['responses_total', [['status', 200], ['view', 'home']], 2]],
+            'histograms': [],
+        }
+        Path(directory, '1-1.json').write_text(json.dumps(other))
+
+        with override_settings(METRICS_DIR=directory):
+            self.client.get(reverse('home'))
+            text = self.scrape()
+        self.assertIn('bookmyadvocate_responses_total{status="200",view="home"} 3.0\n', text)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_required_when_configured(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.scrape(HTTP_AUTHORIZATION='Bearer s3cret')
+
+
+class StaticFilesTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(STATIC_ROOT=self.root, STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'main.staticfiles.CompressedManifestStaticFilesStorage'},
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.url = staticfiles_storage.url('main/css/base.css')
+
+    def test_pages_link_the_hashed_stylesheet(self):
+        self.assertRegex(self.url, r'^/static/main/css/base\.[0-9a-f]{12}\.css$')
+        html = self.client.get(reverse('login')).content.decode()
+        self.assertIn(f'href="{self.url}"', html)
+        self.assertNotIn('<style>\n        :root', html)
+
+    def test_precompressed_and_immutable(self):
+        original = Path(self.root, 'main/css/base.css').read_bytes()
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        body = b''.join(response.streaming_content)
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], staticfiles.IMMUTABLE)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertLess(len(body), len(original) / 2)
+        self.assertEqual(gzip.decompress(body), original)
+        self.assertEqual(response['Content-Disposition'], f'inline; filename="{Path(self.url).name}"')
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b''.join(response.streaming_content), original)
+
+    def test_unhashed_name_is_revalidated(self):
+        response = self.client.get('/static/main/css/base.css')
+        self.assertEqual(response['Cache-Control'], staticfiles.REVALIDATE)
+        response = self.client.get('/static/main/css/base.css', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+
+class ConnectionPoolTests(TestCase):
+    engine = 'main.db_backends.sqlite3'
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.addCleanup(dbpool.reset_pools)
+        self.settings = {
+            'ENGINE': self.engine,
+            'NAME': str(Path(directory) / 'pool.sqlite3'),
+            'POOL': {'SIZE': 2, 'MAX_LIFETIME': 60, 'PING_AFTER': 0},
+        }
+
+    def wrapper(self, **pool):
+        settings = ConnectionHandler({'default': {**self.settings, 'POOL': {**self.settings['POOL'], **pool}}})
+        connection = settings['default']
+        # An alias of its own, so the test database's connection is left alone
+        connection.alias = 'pool-test'
+        connection.ensure_connection()
+        self.addCleanup(connection.close)
+        return connection
+
+    def test_closed_connections_are_reused_by_other_threads(self):
+        first = self.wrapper()
+        raw = first.connection
+        first.close()
+
+        second = self.wrapper()
+        self.assertIs(second.connection, raw)
+        self.assertEqual((second.pool.connects, second.pool.idle), (1, 0))
+        with second.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+    def test_size_lifetime_and_dead_connections(self):
+        wrappers = [self.wrapper() for _ in range(3)]
+        for wrapper in wrappers:
+            wrapper.close()
+        self.assertEqual(wrappers[0].pool.idle, 2)
+
+        # The server hung up on an idle connection: it is dropped, not handed out
+        idle = [raw for raw, _, _ in wrappers[0].pool._idle]
+        idle[-1].close()
+        self.assertIs(self.wrapper().connection, idle[0])
+
+        dbpool.reset_pools()
+        expiring = self.wrapper(MAX_LIFETIME=0)
+        expiring.close()
+        self.assertEqual(expiring.pool.idle, 0)
+
+    def test_open_transaction_is_rolled_back_before_reuse(self):
+        connection = self.wrapper()
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE note (text TEXT)')
+        connection.set_autocommit(False)
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO note VALUES ('uncommitted')")
+        connection.close()
+
+        with self.wrapper().cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM note')
+            self.assertEqual(cursor.fetchone(), (0,))
+
+    def test_warm_up_fills_the_pool(self):
+        connection = self.wrapper()
+        connection.close()
+        self.assertEqual(connection.warm_up(5), 1)
+        self.assertEqual((connection.pool.idle, connection.pool.connects), (2, 2))
+
+
+@skipUnless(os.environ.get('BOOKMYADVOCATE_TEST_MYSQL_HOST'), "needs a MySQL-compatible server")
+class MySQLConnectionPoolTests(ConnectionPoolTests):
+    """The same against MySQL, MariaDB or another server speaking their protocol."""
+    engine = 'main.db_backends.mysql'
+
+    def setUp(self):
+        super().setUp()
+        self.settings.update({
+            'NAME': os.environ.get('BOOKMYADVOCATE_TEST_MYSQL_NAME', 'test_bookmyadvocate'),
+            'HOST': os.environ['BOOKMYADVOCATE_TEST_MYSQL_HOST'],
+            'PORT': os.environ.get('BOOKMYADVOCATE_TEST_MYSQL_PORT', '3306'),
+            'USER': os.environ.get('BOOKMYADVOCATE_TEST_MYSQL_USER', 'root'),
+            'PASSWORD': os.environ.get('BOOKMYADVOCATE_TEST_MYSQL_PASSWORD', ''),
+        })
+
+    def test_open_transaction_is_rolled_back_before_reuse(self):
+        connection = self.wrapper()
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE note (text TEXT) ENGINE=InnoDB')
+        connection.set_autocommit(False)
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO note VALUES ('uncommitted')")
+        connection.close()
+
+        with self.wrapper().cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM note')
+            self.assertEqual(cursor.fetchone(), (0,))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_REPLICA_MAX_LAG=5)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Two SQLite databases: nothing replicates, so the replica stays empty."""
+    # TestCase's transaction would keep every read on the primary
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        for state in (cache, usercache.users, routers.health):
+            state.clear()
+        self.advocate = make_advocate('RR-1', specialization='civil')
+        self.detail_url = reverse('advocate_detail', args=[self.advocate.pk])
+        make_client('reader@example.com')
+
+    def test_public_pages_read_from_replica(self):
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+        self.assertNotContains(self.client.get(reverse('search_advocates'), {'q': 'RR-1'}), self.detail_url)
+        # The showcase the home page caches is built from the primary
+        self.assertContains(self.client.get(reverse('home')), self.detail_url)
+        self.assertNotIn(routers.PIN_COOKIE, self.client.cookies)
+
+    def test_writes_pin_reads_to_primary(self):
+        response = self.client.post(reverse('login'), {
+            'role': 'client', 'credential': 'reader@example.com', 'password': 'secret',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        self.assertEqual(self.client.get(self.detail_url).status_code, 200)
+
+        self.client.cookies[routers.PIN_COOKIE] = '0'
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+
+    def test_lagging_replica_is_skipped(self):
+        with mock.patch.object(routers, 'replica_lag', return_value=60):
+            self.assertEqual(self.client.get(self.detail_url).status_code, 200)
+        # The verdict holds until the next check
+        self.assertEqual(self.client.get(self.detail_url).status_code, 200)
+        with override_settings(DATABASE_REPLICA_CHECK_INTERVAL=0):
+            self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+
+    def test_writes_always_go_to_primary(self):
+        replica_copy = User.objects.using('replica').create(username='copy', role='client')
+        self.assertEqual(routers.ReplicaRouter().db_for_write(User, instance=replica_copy), 'default')
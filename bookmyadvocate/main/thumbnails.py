@@ -0,0 +1,154 @@
+"""
+Path: bookmyadvocate/main/thumbnails.py
+Resized profile picture variants, so pages never serve the original upload.
+
+Each picture gets a square thumbnail at every size in SIZES, in every format
+in FORMATS, stored next to it: profiles/photo.jpg gives profiles/photo.64.webp
+and so on. The names depend only on the original's, so the avatar template tag
+builds their URLs without touching storage. User.profile_picture_variants
+records which picture the stored variants belong to; until it matches the
+current picture, pages keep showing the initials placeholder.
+
+Variants are made by the "thumbnails.generate" job (main/tasks.py) after an
+upload, and by ``manage.py regenerate_thumbnails`` (after SIZES or FORMATS
+change, say).
+"""
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import usercache
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+SIZES = (64, 128, 256)
+# (extension, MIME type, Pillow save options); the first is preferred in <picture>
+FORMATS = (
+    ('webp', 'image/webp', {'format': 'WEBP', 'quality': 80, 'method': 6}),
+    ('jpg', 'image/jpeg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+def variant_name(name, size, extension):
+    root, _ = posixpath.splitext(name)
+    return f'{root}.{size}.{extension}'
+
+
+def variant_names(name):
+    return [variant_name(name, size, extension) for size in SIZES for extension, _, _ in FORMATS]
+
+
+def fitting_size(size):
+    """The smallest variant at least *size* pixels wide (the largest if none is)."""
+    return next((candidate for candidate in SIZES if candidate >= size), SIZES[-1])
+
+
+def srcset(name, extension, storage=default_storage):
+    return ', '.join(f'{storage.url(variant_name(name, size, extension))} {size}w' for size in SIZES)
+
+
+def _rgb(image):
+    # JPEG has no alpha channel: flatten transparent pictures onto white
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render(file):
+    """Encode the variants of an image file. Returns {(size, extension): bytes}."""
+    try:
+        with Image.open(file) as image:
+            # Lets the JPEG decoder downscale while decoding (by up to 8x)
+            image.draft('RGB', (SIZES[-1] * 2, SIZES[-1] * 2))
+            image = _rgb(ImageOps.exif_transpose(image))
+    except (UnidentifiedImageError, Image.DecompressionBombError) as exc:
+        raise ThumbnailError(str(exc)) from exc
+
+    encoded = {}
+    # Largest first, each size resampled from the one before: much cheaper than
+    # going back to a multi-megapixel original every time
+    source = image
+    for size in sorted(SIZES, reverse=True):
+        source = ImageOps.fit(source, (size, size), Image.Resampling.LANCZOS)
+        for extension, _, options in FORMATS:
+            buffer = BytesIO()
+            source.save(buffer, **options)
+            encoded[size, extension] = buffer.getvalue()
+    return encoded
+
+
+def delete_variants(name, storage=default_storage):
+    for variant in variant_names(name):
+        storage.delete(variant)
+
+
+def generate(name, storage=default_storage):
+    """Write the variants of the stored picture *name*, replacing any already there."""
+    with storage.open(name) as file:
+        encoded = render(file)
+    for (size, extension), data in encoded.items():
+        variant = variant_name(name, size, extension)
+        # Storage would otherwise save next to the old file under a new name
+        storage.delete(variant)
+        storage.save(variant, ContentFile(data))
+
+
+def refresh(user_id, force=False):
+    """Bring a user's variants in line with their current picture.
+
+    Generates the current picture's variants (again, with *force*), deletes
+    the previous picture's and records the result. Returns False when the
+    picture could not be read (it is then left without variants and pages
+    keep the placeholder).
+    """
+    user = User.objects.filter(pk=user_id).values('profile_picture', 'profile_picture_variants').first()
+    if user is None:
+        return True
+    name, previous = user['profile_picture'] or '', user['profile_picture_variants']
+
+    readable = True
+    if name and (force or name != previous):
+        try:
+            generate(name)
+        except (ThumbnailError, FileNotFoundError) as exc:
+            logger.warning("No thumbnails for %s: %s", name, exc)
+            readable = False
+    if previous and previous != name:
+        delete_variants(previous)
+    # Unless the picture changed again meanwhile (its own job will see to it)
+    User.objects.filter(pk=user_id, profile_picture=user['profile_picture']).update(
+        profile_picture_variants=name if readable else '',
+    )
+    # update() sends no post_save, which would have evicted the user
+    usercache.users.forget(user_id)
+    return readable
+
+
+def regenerate(batch_size=100, missing_only=False):
+    """Generate the variants of every profile picture. Returns (generated, unreadable)."""
+    users = User.objects.exclude(profile_picture='').exclude(profile_picture=None).order_by('pk')
+    if missing_only:
+        users = users.exclude(profile_picture_variants=F('profile_picture'))
+    generated = unreadable = 0
+    last_pk = 0
+    while batch := list(users.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size]):
+        last_pk = batch[-1]
+        for user_id in batch:
+            if refresh(user_id, force=True):
+                generated += 1
+            else:
+                unreadable += 1
+    return generated, unreadable
@@ -0,0 +1,224 @@
+"""
+Path: bookmyadvocate/main/uploads.py
+Chunked, resumable document uploads with content-addressed storage.
+
+Files arrive in fixed CHUNK_SIZE chunks, in order. Each chunk is hashed while
+it is streamed to a partial file on local disk, and its digest is recorded on
+the UploadSession, so an interrupted upload resumes at the next chunk.
+
+Because the chunking is fixed, a file's address - the SHA-256 of its chunk
+digests in order - depends only on its bytes. Identical files uploaded to
+different bookings therefore end up as one DocumentBlob, and completing an
+upload needs no second hashing pass. Memory use is bounded by READ_SIZE.
+
+The partial file lives on one server's disk. If it is gone (purged as stale,
+or the request reached another server) the upload is marked failed and the
+client has to start over.
+"""
+import datetime
+import hashlib
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Document, DocumentBlob, UploadSession
+
+CHUNK_SIZE = 1024 * 1024
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+def max_document_size():
+    return getattr(settings, 'MAX_DOCUMENT_SIZE', 500 * 1024 * 1024)
+
+
+def chunk_count(size):
+    return (size + CHUNK_SIZE - 1) // CHUNK_SIZE
+
+
+def address_of(chunk_digests):
+    """Content address from the concatenated hex digests of a file's chunks."""
+    return hashlib.sha256(bytes.fromhex(chunk_digests)).hexdigest()
+
+
+def blob_name(address):
+    return f'blobs/{address[:2]}/{address[2:4]}/{address}'
+
+
+def partial_path(upload):
+    directory = Path(getattr(settings, 'CHUNKED_UPLOAD_DIR', Path(settings.MEDIA_ROOT) / 'uploads'))
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f'{upload.pk}.part'
+
+
+def _lost(upload_id):
+    # Outside the failed transaction, so the mark sticks
+    UploadSession.objects.filter(pk=upload_id).update(failed=True, updated_at=timezone.now())
+    return UploadError("The partially uploaded file was lost. Please start the upload again.")
+
+
+def _check_not_failed(upload):
+    if upload.failed:
+        raise UploadError("This upload failed. Please start the upload again.")
+
+
+# -------------------------
+# UPLOAD PROTOCOL
+# -------------------------
+def start_upload(booking, user, filename, size, title, description=''):
+    if size < 0 or size > max_document_size():
+        raise UploadError(f"Documents must be at most {max_document_size()} bytes.")
+    upload = UploadSession.objects.create(
+        booking=booking,
+        uploaded_by=user,
+        filename=os.path.basename(filename)[:255],
+        size=size,
+        title=title,
+        description=description,
+    )
+    partial_path(upload).touch()
+    return upload
+
+
+def write_chunk(upload_id, index, stream, expected_digest=''):
+    """Append chunk *index*, read from *stream*, to the upload.
+
+    Chunks must arrive in order. Re-sending a chunk that was already stored is
+    accepted (and ignored) so that clients can safely retry.
+    """
+    try:
+        return _write_chunk(upload_id, index, stream, expected_digest)
+    except FileNotFoundError:
+        raise _lost(upload_id)
+
+
+def _write_chunk(upload_id, index, stream, expected_digest):
+    with transaction.atomic():
+        upload = UploadSession.objects.select_for_update().get(pk=upload_id)
+        _check_not_failed(upload)
+        stored = len(upload.chunk_digests) // 64
+        if index < stored:
+            digest = upload.chunk_digests[index * 64:(index + 1) * 64]
+            if expected_digest and expected_digest.lower() != digest:
+                raise UploadError(f"Chunk {index} was already received with different content.")
+            return upload
+        if index != stored or index >= chunk_count(upload.size):
+            raise UploadError(f"Expected chunk {stored}.")
+
+        expected_size = min(CHUNK_SIZE, upload.size - index * CHUNK_SIZE)
+        digest = hashlib.sha256()
+        written = 0
+        with open(partial_path(upload), 'r+b') as part:
+            # Drop anything a previously failed attempt left behind
+            part.seek(index * CHUNK_SIZE)
+            part.truncate()
+            while written <= expected_size:
+                piece = stream.read(min(READ_SIZE, expected_size - written + 1))
+                if not piece:
+                    break
+                digest.update(piece)
+                part.write(piece)
+                written += len(piece)
+
+        if written != expected_size:
+            raise UploadError(f"Chunk {index} must be exactly {expected_size} bytes.")
+        if expected_digest and expected_digest.lower() != digest.hexdigest():
+            raise UploadError(f"Chunk {index} is corrupt (checksum mismatch).")
+
+        upload.chunk_digests += digest.hexdigest()
+        upload.received += written
+        upload.save(update_fields=['chunk_digests', 'received', 'updated_at'])
+        return upload
+
+
+def complete_upload(upload_id):
+    """Turn a fully received upload into a Document, sharing an existing blob if possible."""
+    try:
+        return _complete_upload(upload_id)
+    except FileNotFoundError:
+        raise _lost(upload_id)
+
+
+def _complete_upload(upload_id):
+    with transaction.atomic():
+        upload = UploadSession.objects.select_for_update().get(pk=upload_id)
+        _check_not_failed(upload)
+        if upload.received != upload.size:
+            raise UploadError(f"Upload incomplete: {upload.received} of {upload.size} bytes received.")
+
+        path = partial_path(upload)
+        with open(path, 'rb') as part:
+            blob = store_blob(address_of(upload.chunk_digests), upload.size, part)
+        document = Document.objects.create(
+            booking=upload.booking,
+            uploaded_by=upload.uploaded_by,
+            blob=blob,
+            file=blob.file.name,
+            filename=upload.filename,
+            title=upload.title,
+            description=upload.description,
+        )
+        upload.delete()
+    path.unlink(missing_ok=True)
+    return document
+
+
+# -------------------------
+# BLOBS
+# -------------------------
+def store_blob(address, size, content):
+    """Return the blob for *address*, saving *content* only if it is new."""
+    blob = DocumentBlob.objects.filter(pk=address).first()
+    if blob is not None:
+        return blob
+
+    name = default_storage.save(blob_name(address), File(content))
+    try:
+        with transaction.atomic():
+            return DocumentBlob.objects.create(address=address, size=size, file=name)
+    except IntegrityError:
+        # Someone stored the same content concurrently; keep theirs
+        default_storage.delete(name)
+        return DocumentBlob.objects.get(pk=address)
+
+
+def save_uploaded_file(booking, user, uploaded_file, title, description=''):
+    """One-shot upload of a Django UploadedFile through the same content addressing."""
+    if uploaded_file.size > max_document_size():
+        raise UploadError(f"Documents must be at most {max_document_size()} bytes.")
+    # Not uploaded_file.chunks(): in-memory uploads ignore its chunk_size
+    digests = ''
+    uploaded_file.seek(0)
+    for chunk in iter(lambda: uploaded_file.read(CHUNK_SIZE), b''):
+        digests += hashlib.sha256(chunk).hexdigest()
+    uploaded_file.seek(0)
+    with transaction.atomic():
+        blob = store_blob(address_of(digests), uploaded_file.size, uploaded_file)
+        return Document.objects.create(
+            booking=booking,
+            uploaded_by=user,
+            blob=blob,
+            file=blob.file.name,
+            filename=os.path.basename(uploaded_file.name),
+            title=title,
+            description=description,
+        )
+
+
+def purge_stale_uploads(older_than=datetime.timedelta(days=2)):
+    """Delete upload sessions (and their partial files) that stopped making progress."""
+    stale = UploadSession.objects.filter(updated_at__lt=timezone.now() - older_than)
+    purged = 0
+    for upload in stale.iterator():
+        partial_path(upload).unlink(missing_ok=True)
+        upload.delete()
+        purged += 1
+    return purged
@@ -24,7 +24,29 @@ urlpatterns = [
     # Search
     path('search/advocates/', views.search_advocates, name='search_advocates'),
     
+    # Advocates
+    path('advocate/<int:advocate_id>/', views.advocate_detail, name='advocate_detail'),
+
+    # Booking
+    path('advocate/<int:advocate_id>/book/', views.book_consultation, name='book_consultation'),
+    path('availability/', views.advocate_availability, name='advocate_availability'),
+    path('booking/<int:booking_id>/status/', views.update_booking_status, name='update_booking_status'),
+    
     # Placeholder routes (to be implemented)
     path('advocate/profile/edit/', views.edit_advocate_profile, name='edit_advocate_profile'),
     path('booking/<int:booking_id>/', views.booking_detail, name='booking_detail'),
+
+    # Calendar feed
+    path('calendar/<int:user_id>/<str:token>.ics', views.booking_calendar, name='booking_calendar'),
+    path('calendar/reset/', views.reset_calendar_token, name='reset_calendar_token'),
+    
+    # Documents
+    path('booking/<int:booking_id>/documents/upload/', views.upload_document, name='upload_document'),
+    path('booking/<int:booking_id>/uploads/', views.start_document_upload, name='start_document_upload'),
+    path('uploads/<uuid:upload_id>/', views.document_upload_status, name='document_upload_status'),
+    path('uploads/<uuid:upload_id>/chunks/<int:index>/', views.upload_document_chunk, name='upload_document_chunk'),
+    path('uploads/<uuid:upload_id>/complete/', views.complete_document_upload, name='complete_document_upload'),
+
+    # Monitoring
+    path('metrics/', views.prometheus_metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""
+Path: bookmyadvocate/main/usercache.py
+Per-process cache of signed-in users (with their advocate profile) for the
+authentication backends.
+
+Every authenticated request turns the session's user id back into a User;
+with this cache that is a dictionary lookup rather than a query, and the
+advocate profile comes along so request.user.advocate_profile is free too.
+
+Entries are plain field values, so every request gets its own fresh
+instances to modify. They live AUTH_USER_CACHE_TTL seconds, and the
+least recently used are dropped beyond AUTH_USER_CACHE_SIZE. Saving or
+deleting a user or profile (profile edits, the admin, password changes)
+evicts the entry at once in the process that saved; other processes see the
+change when their entry expires, which bounds how long a changed password
+or deactivated account can go unnoticed there.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import FileField
+
+from .models import AdvocateProfile, User
+
+_USER_FIELDS = [field.attname for field in User._meta.concrete_fields]
+_PROFILE_FIELDS = [field.attname for field in AdvocateProfile._meta.concrete_fields]
+
+
+def _settings():
+    return getattr(settings, 'AUTH_USER_CACHE_TTL', 30), getattr(settings, 'AUTH_USER_CACHE_SIZE', 1024)
+
+
+def _values(instance):
+    # Column values only: a FieldFile would tie the entry to this instance
+    return tuple(
+        getattr(instance, field.attname).name if isinstance(field, FileField) else getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+    )
+
+
+def _snapshot(user):
+    profile = getattr(user, 'advocate_profile', None)
+    return _values(user), profile and _values(profile)
+
+
+def _restore(values):
+    user_values, profile_values = values
+    user = User.from_db(DEFAULT_DB_ALIAS, _USER_FIELDS, user_values)
+    profile = profile_values and AdvocateProfile.from_db(DEFAULT_DB_ALIAS, _PROFILE_FIELDS, profile_values)
+    # As select_related would leave them: no query for either side of the relation
+    User.advocate_profile.related.set_cached_value(user, profile)
+    if profile is not None:
+        AdvocateProfile.user.field.set_cached_value(profile, user)
+    return user
+
+
+class UserCache:
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every eviction, so a load that raced with a save is not cached
+        self.version = 0
+
+    def get(self, user_id):
+        ttl, _ = _settings()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            stored, values = entry
+            if time.monotonic() - stored > ttl:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        return _restore(values)
+
+    def put(self, user, version):
+        _, size = _settings()
+        values = _snapshot(user)
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[user.pk] = (time.monotonic(), values)
+            self._entries.move_to_end(user.pk)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def forget(self, user_id):
+        with self._lock:
+            self.version += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+
+users = UserCache()
+
+
+def get_user(user_id):
+    """The user with *user_id*, advocate profile included, or None."""
+    user = users.get(user_id)
+    if user is not None:
+        return user
+    version = users.version
+    user = User._default_manager.select_related('advocate_profile').filter(pk=user_id).first()
+    if user is not None:
+        users.put(user, version)
+    return user
@@ -2,26 +2,61 @@
 Path: bookmyadvocate/main/views.py
 COMPLETE FIX - Role-based login + Email checking instead of username
 """
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import login, logout
+from django.contrib.auth.signals import user_login_failed
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
 from django.contrib import messages
-from django.db.models import Q, Avg
-from .models import User, AdvocateProfile, Booking, Document, Review
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.dateparse import parse_date, parse_time
+from django.db import transaction
+from django.db.models import Q
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from . import availability, facets, hashing, ical, metrics, ratings, search, showcase, tasks, uploads
+from .routers import replica_reads
+from .backends import RoleCredentialBackend
+from .forms import ProfilePictureForm
+from .models import User, AdvocateProfile, Booking, Document, Review, UploadSession, new_calendar_token
+from .pagination import akeyset_page, keyset_page, page_size_from
+
+
+# -------------------------
+# ASYNC HELPERS
+# -------------------------
+async def arender(request, template_name, context=None, status=200):
+    # Templates read the session (user, messages), which has to happen off the event loop
+    return await sync_to_async(render)(request, template_name, context, status=status)
+
+
+async def hashing_busy(request, template_name):
+    messages.error(request, "We are handling a lot of sign-ins right now. Please try again in a moment.")
+    response = await arender(request, template_name, status=503)
+    response['Retry-After'] = '5'
+    return response
 
 
 # -------------------------
 # HOME PAGE
 # -------------------------
-def home(request):
-    advocates = User.objects.filter(role='advocate', is_active_advocate=True)[:6]
-    return render(request, "home.html", {'advocates': advocates})
+@replica_reads
+async def home(request):
+    # Served from the cache; see main/showcase.py for invalidation
+    advocates = await showcase.aget_showcase()
+    return await arender(request, "home.html", {'advocates': advocates})
 
 
 # -------------------------
-# CLIENT REGISTRATION - FIXED
+# CLIENT REGISTRATION - FIXED (async, hashing on the main.hashing pool)
 # -------------------------
-def register_client(request):
+async def register_client(request):
     if request.method == "POST":
         username = request.POST.get("username")
         email = request.POST.get("email")
@@ -31,38 +66,47 @@ def register_client(request):
         # Validate required fields
         if not username or not email or not password:
             messages.error(request, "All fields except phone are required!")
-            return render(request, "register_client.html")
+            return await arender(request, "register_client.html")
 
         # FIXED: Check if EMAIL already exists (not username)
-        if User.objects.filter(email=email).exists():
+        if await User.objects.filter(email=email).aexists():
             messages.error(request, "Email already registered!")
-            return render(request, "register_client.html")
+            return await arender(request, "register_client.html")
 
         # Create client user
         try:
-            user = User.objects.create_user(
+            await User.objects.acreate(
                 username=email,  # Use email as username internally
-                email=email,
-                password=password,
+                email=User.objects.normalize_email(email),
+                password=await hashing.ahash(password),
                 role="client",
-                phone=phone
+                phone=phone,
+                is_active=True,
             )
-            user.is_active = True
-            user.save()
             
             messages.success(request, "Registration successful! Please login with your email.")
             return redirect("login")
+        except hashing.HashingBusy:
+            return await hashing_busy(request, "register_client.html")
         except Exception as e:
             messages.error(request, f"Registration failed: {str(e)}")
-            return render(request, "register_client.html")
+            return await arender(request, "register_client.html")
 
-    return render(request, "register_client.html")
+    return await arender(request, "register_client.html")
 
 
 # -------------------------
-# ADVOCATE REGISTRATION - FIXED
+# ADVOCATE REGISTRATION - FIXED (async, hashing on the main.hashing pool)
 # -------------------------
-def register_advocate(request):
+@sync_to_async
+def create_advocate(**fields):
+    with transaction.atomic():
+        user = User.objects.create(role="advocate", is_active=True, is_active_advocate=True, **fields)
+        AdvocateProfile.objects.create(user=user)
+    return user
+
+
+async def register_advocate(request):
     if request.method == "POST":
         username = request.POST.get("username")
         email = request.POST.get("email")
@@ -73,48 +117,46 @@ def register_advocate(request):
         # Validate required fields
         if not username or not email or not bar_council_number or not password:
             messages.error(request, "All fields except phone are required!")
-            return render(request, "register_advocate.html")
-
-        # FIXED: Check if email already exists
-        if User.objects.filter(email=email).exists():
+            return await arender(request, "register_advocate.html")
+
+        # Check email and bar council number in one query
+        taken = [
+            row async for row in User.objects.filter(
+                Q(email=email) | Q(bar_council_number=bar_council_number)
+            ).values_list('email', 'bar_council_number')[:2]
+        ]
+        if any(row[0] == email for row in taken):
             messages.error(request, "Email already registered!")
-            return render(request, "register_advocate.html")
-        
-        # Check if bar council number already exists
-        if User.objects.filter(bar_council_number=bar_council_number).exists():
+            return await arender(request, "register_advocate.html")
+        if taken:
             messages.error(request, "Bar Council Number already registered!")
-            return render(request, "register_advocate.html")
+            return await arender(request, "register_advocate.html")
 
-        # Create advocate user
+        # Create advocate user and profile
         try:
-            user = User.objects.create_user(
+            await create_advocate(
                 username=bar_council_number,  # Use bar council number as username internally
-                email=email,
-                password=password,
-                role="advocate",
+                email=User.objects.normalize_email(email),
+                password=await hashing.ahash(password),
                 phone=phone,
-                bar_council_number=bar_council_number
+                bar_council_number=bar_council_number,
             )
-            user.is_active = True
-            user.is_active_advocate = True
-            user.save()
-            
-            # Create advocate profile
-            AdvocateProfile.objects.create(user=user)
             
             messages.success(request, "Registration successful! Please login with your Bar Council Number.")
             return redirect("login")
+        except hashing.HashingBusy:
+            return await hashing_busy(request, "register_advocate.html")
         except Exception as e:
             messages.error(request, f"Registration failed: {str(e)}")
-            return render(request, "register_advocate.html")
+            return await arender(request, "register_advocate.html")
 
-    return render(request, "register_advocate.html")
+    return await arender(request, "register_advocate.html")
 
 
 # -------------------------
-# LOGIN - FIXED (Role-based)
+# LOGIN - FIXED (Role-based, async)
 # -------------------------
-def user_login(request):
+async def user_login(request):
     if request.method == "POST":
         role = request.POST.get("role")  # 'client' or 'advocate'
         credential = request.POST.get("credential")  # email or bar_council_number
@@ -122,46 +164,46 @@ def user_login(request):
 
         if not role or not credential or not password:
             messages.error(request, "All fields are required!")
-            return render(request, "login.html")
+            return await arender(request, "login.html")
 
-        user = None
+        if role not in ("client", "advocate"):
+            messages.error(request, "Please choose whether you are a client or an advocate!")
+            return await arender(request, "login.html")
 
         try:
-            if role == "client":
-                # Client login with email
-                try:
-                    user_obj = User.objects.get(email=credential, role='client')
-                    # Authenticate using the internal username (which is email)
-                    user = authenticate(request, username=user_obj.username, password=password)
-                except User.DoesNotExist:
-                    messages.error(request, "No client found with this email!")
-                    return render(request, "login.html")
-                
-            elif role == "advocate":
-                # Advocate login with bar council number
-                try:
-                    user_obj = User.objects.get(bar_council_number=credential, role='advocate')
-                    # Authenticate using the internal username (which is bar council number)
-                    user = authenticate(request, username=user_obj.username, password=password)
-                except User.DoesNotExist:
-                    messages.error(request, "No advocate found with this Bar Council Number!")
-                    return render(request, "login.html")
+            # One indexed lookup by role + email / Bar Council Number (main/backends.py)
+            user = await RoleCredentialBackend().aauthenticate(
+                request, role=role, credential=credential, password=password
+            )
+            
+            if user is None:
+                # Sent by authenticate(), which this path bypasses; lockout and audit receivers
+                # rely on it. The password is masked the way authenticate() masks it.
+                await sync_to_async(user_login_failed.send)(
+                    sender='django.contrib.auth',
+                    credentials={'role': role, 'credential': credential, 'password': '*' * 20},
+                    request=request,
+                )
             
             if user is not None:
-                login(request, user)
+                await sync_to_async(login)(request, user, backend='main.backends.RoleCredentialBackend')
                 messages.success(request, f"Welcome back, {user.email}!")
                 
                 if user.role == "client":
                     return redirect("client_dashboard")
                 elif user.role == "advocate":
                     return redirect("advocate_dashboard")
+            elif role == "client":
+                messages.error(request, "Invalid email or password!")
             else:
-                messages.error(request, "Invalid password!")
+                messages.error(request, "Invalid Bar Council Number or password!")
                 
+        except hashing.HashingBusy:
+            return await hashing_busy(request, "login.html")
         except Exception as e:
             messages.error(request, f"Login failed: {str(e)}")
 
-    return render(request, "login.html")
+    return await arender(request, "login.html")
 
 
 # -------------------------
@@ -181,8 +223,30 @@ def client_dashboard(request):
     if request.user.role != 'client':
         return redirect('advocate_dashboard')
     
-    bookings = Booking.objects.filter(client=request.user).order_by('-created_at')
-    return render(request, "client_dashboard.html", {'bookings': bookings})
+    all_bookings = Booking.objects.filter(client=request.user)
+    today = timezone.now().date()
+    counts = all_bookings.status_counts(upcoming=Q(date__gte=today), past=Q(date__lt=today))
+    
+    # Upcoming soonest first, past most recent first; both on the (client, date, time) index
+    section = 'past' if request.GET.get('section') == 'past' else 'upcoming'
+    if section == 'upcoming':
+        bookings = all_bookings.filter(date__gte=today)
+        keys = ('date', 'time', 'id')
+    else:
+        bookings = all_bookings.filter(date__lt=today)
+        keys = ('-date', '-time', '-id')
+    bookings = keyset_page(
+        bookings.select_related('advocate__advocate_profile'),
+        keys,
+        cursor=request.GET.get('cursor', ''),
+        page_size=page_size_from(request.GET),
+    )
+    
+    return render(request, "client_dashboard.html", {
+        'bookings': bookings,
+        'counts': counts,
+        'section': section,
+    })
 
 
 # -------------------------
@@ -197,14 +261,32 @@ def advocate_dashboard(request):
         messages.error(request, "Access denied!")
         return redirect("home")
     
-    # Get advocate's bookings
-    bookings = Booking.objects.filter(advocate=request.user).order_by('-created_at')
+    # Per-status counts for the stat cards and tabs (one query)
+    all_bookings = Booking.objects.filter(advocate=request.user)
+    counts = all_bookings.status_counts()
+    
+    # One page of bookings, optionally for a single status, clients joined in
+    status = request.GET.get('status', '')
+    if status not in dict(Booking.STATUS):
+        status = ''
+    bookings = all_bookings.select_related('client')
+    if status:
+        bookings = bookings.filter(status=status)
+    bookings = keyset_page(
+        bookings,
+        ('-created_at', '-id'),
+        cursor=request.GET.get('cursor', ''),
+        page_size=page_size_from(request.GET),
+    )
     
     # Get advocate's profile
     profile = request.user.advocate_profile
     
     context = {
         'bookings': bookings,
+        'counts': counts,
+        'status': status,
+        'status_tabs': [(value, label, counts[value]) for value, label in Booking.STATUS],
         'profile': profile
     }
     return render(request, "advocate_dashboard.html", context)
@@ -219,9 +301,18 @@ def edit_advocate_profile(request):
         messages.error(request, "Only advocates can access this page!")
         return redirect('home')
     
-    profile, created = AdvocateProfile.objects.get_or_create(user=request.user)
+    # Loaded along with the signed-in user (main/usercache.py)
+    profile = getattr(request.user, 'advocate_profile', None)
+    if profile is None:
+        profile, created = AdvocateProfile.objects.get_or_create(user=request.user)
     
     if request.method == 'POST':
+        # Checked first so a bad picture leaves the whole profile unsaved
+        picture_form = ProfilePictureForm(request.POST, request.FILES, instance=request.user)
+        if not picture_form.is_valid():
+            messages.error(request, picture_form.errors['profile_picture'][0])
+            return render(request, 'edit_advocate_profile.html', {'profile': profile})
+
         specialization = request.POST.get('specialization')
         experience_years = request.POST.get('experience_years', 0)
         location = request.POST.get('location', '')
@@ -233,10 +324,18 @@ def edit_advocate_profile(request):
         profile.location = location
         profile.bio = bio
         profile.consultation_fee = consultation_fee
-        profile.save()
+        # Only the edited fields: the rating counters are maintained concurrently
+        profile.save(update_fields=['specialization', 'experience_years', 'location', 'locality', 'bio',
+                                    'consultation_fee'])
         
         request.user.is_active_advocate = True
-        request.user.save()
+        # Only the edited fields: request.user may be a cached copy, and a full
+        # save would write back stale thumbnail state. A new picture is stored
+        # (and its thumbnails queued) only when one was uploaded.
+        user_fields = ['is_active_advocate']
+        if 'profile_picture' in picture_form.changed_data:
+            user_fields.append('profile_picture')
+        request.user.save(update_fields=user_fields)
         
         messages.success(request, "Profile updated successfully!")
         return redirect('advocate_dashboard')
@@ -247,38 +346,76 @@ def edit_advocate_profile(request):
 # -------------------------
 # SEARCH ADVOCATES
 # -------------------------
-def search_advocates(request):
-    query = request.GET.get('q', '')
-    
-    if query:
-        advocates = User.objects.filter(
-            Q(role='advocate') &
-            Q(is_active_advocate=True) &
-            (Q(email__icontains=query) |
-             Q(advocate_profile__location__icontains=query) |
-             Q(bar_council_number__icontains=query))
-        ).distinct()
-    else:
-        advocates = User.objects.filter(role='advocate', is_active_advocate=True)
+@replica_reads
+async def search_advocates(request):
+    query = request.GET.get('q', '').strip()
+    filters = search.SearchFilters.from_params(request.GET)
+    advocates = await search.afind_advocates(
+        query,
+        filters,
+        cursor=request.GET.get('cursor', ''),
+        page_size=page_size_from(request.GET),
+    )
+    
+    # Counts for the whole result, not the page: cached, so most searches skip the query
+    search_facets = await facets.afacet_counts(query, filters)
+    if search_facets is not None:
+        search_facets.link(request.GET)
+
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    first_params = params.urlencode() if request.GET.get('cursor') else None
+    next_params = None
+    if advocates.has_next:
+        params['cursor'] = advocates.next_cursor
+        next_params = params.urlencode()
     
-    return render(request, 'search_advocates.html', {
+    return await arender(request, 'search_advocates.html', {
         'advocates': advocates,
-        'query': query
+        'first_params': first_params,
+        'next_params': next_params,
+        'query': query,
+        'filters': filters,
+        'facets': search_facets,
+        'specializations': AdvocateProfile.SPECIALIZATION_CHOICES,
+        'radius_choices': search.RADIUS_CHOICES,
+        # afind_advocates has looked the place up by now
+        'unknown_place': bool(filters.near) and filters.origin is None,
     })
 
 
 # -------------------------
 # ADVOCATE DETAIL
 # -------------------------
-def advocate_detail(request, advocate_id):
-    advocate = get_object_or_404(User, id=advocate_id, role='advocate')
-    profile = get_object_or_404(AdvocateProfile, user=advocate)
-    reviews = Review.objects.filter(advocate=advocate).order_by('-created_at')
+REVIEWS_PAGE_SIZE = 20
+
+
+@replica_reads
+async def advocate_detail(request, advocate_id):
+    # One query: the advocate and profile (with its star histogram) come joined onto
+    # their page of reviews. Only a page without reviews needs a second query.
+    reviews = await akeyset_page(
+        Review.objects.filter(advocate_id=advocate_id, advocate__role='advocate')
+        .select_related('client', 'advocate__advocate_profile'),
+        ('-created_at', '-id'),
+        request.GET.get('cursor', ''),
+        REVIEWS_PAGE_SIZE,
+    )
+    if reviews:
+        profile = getattr(reviews.items[0].advocate, 'advocate_profile', None)
+    else:
+        profile = await (
+            AdvocateProfile.objects.select_related('user')
+            .filter(user_id=advocate_id, user__role='advocate').afirst()
+        )
+    if profile is None:
+        raise Http404("No such advocate")
     
-    return render(request, 'advocate_detail.html', {
-        'advocate': advocate,
+    return await arender(request, 'advocate_detail.html', {
+        'advocate': profile.user,
         'profile': profile,
-        'reviews': reviews
+        'reviews': reviews,
+        'newest_page': bool(request.GET.get('cursor')),
     })
 
 
@@ -294,25 +431,63 @@ def book_consultation(request, advocate_id):
     advocate = get_object_or_404(User, id=advocate_id, role='advocate')
     
     if request.method == 'POST':
-        date = request.POST.get('date')
-        time = request.POST.get('time')
+        # A picked slot arrives as "YYYY-MM-DD HH:MM", free entry as date + time
+        slot = request.POST.get('slot', '').split(' ')
+        try:
+            date = parse_date(slot[0] if len(slot) == 2 else request.POST.get('date', ''))
+            time = parse_time(slot[1] if len(slot) == 2 else request.POST.get('time', ''))
+        except ValueError:
+            # Well formed but impossible, like 2031-02-30
+            date = time = None
         purpose = request.POST.get('purpose')
         notes = request.POST.get('notes', '')
         
-        booking = Booking.objects.create(
-            client=request.user,
-            advocate=advocate,
-            date=date,
-            time=time,
-            purpose=purpose,
-            notes=notes
-        )
+        if not date or not time or not purpose:
+            messages.error(request, "Please choose a date, a time and a purpose")
+            return redirect('book_consultation', advocate_id=advocate_id)
+        
+        try:
+            availability.book_slot(request.user, advocate, date, time, purpose=purpose, notes=notes)
+        except availability.SlotUnavailable as e:
+            messages.error(request, str(e))
+            return redirect('book_consultation', advocate_id=advocate_id)
         
         messages.success(request, "Consultation booked successfully!")
         return redirect('client_dashboard')
     
+    start = timezone.now().date()
+    slots = availability.free_slots([advocate.id], start).get(advocate.id)
+    
     return render(request, 'book_consultation.html', {
-        'advocate': advocate
+        'advocate': advocate,
+        'slots': slots,
+    })
+
+
+# -------------------------
+# ADVOCATE AVAILABILITY (JSON, many advocates and days in one call)
+# -------------------------
+def advocate_availability(request):
+    try:
+        advocate_ids = [int(i) for i in request.GET.get('advocates', '').split(',') if i]
+        days = int(request.GET.get('days', 7))
+    except ValueError:
+        return JsonResponse({'error': "advocates must be a comma separated list of ids"}, status=400)
+    try:
+        start = parse_date(request.GET.get('start', '')) or timezone.now().date()
+    except ValueError:
+        return JsonResponse({'error': "start is not a valid date"}, status=400)
+    
+    slots = availability.free_slots(advocate_ids, start, days)
+    return JsonResponse({
+        'start': start.isoformat(),
+        'slots': {
+            str(advocate_id): {
+                day.isoformat(): [slot.strftime('%H:%M') for slot in times]
+                for day, times in calendar.items()
+            }
+            for advocate_id, calendar in slots.items()
+        },
     })
 
 
@@ -327,7 +502,7 @@ def booking_detail(request, booking_id):
         messages.error(request, "Access denied")
         return redirect('home')
     
-    documents = Document.objects.filter(booking=booking)
+    documents = Document.objects.filter(booking=booking).order_by('uploaded_at')
     
     return render(request, 'booking_detail.html', {
         'booking': booking,
@@ -335,6 +510,49 @@ def booking_detail(request, booking_id):
     })
 
 
+# -------------------------
+# CALENDAR FEED (see main/ical.py)
+# -------------------------
+def _feed_headers(response, etag, last_modified):
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    # Always revalidate, which costs an unchanged poll two indexed queries
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+async def booking_calendar(request, user_id, token):
+    # From the database, not the user cache: a reset must revoke the old URL in
+    # every process at once, and anonymous polls must not churn the cache
+    user = await User.objects.filter(pk=user_id, is_active=True).only('role', 'calendar_token').afirst()
+    if user is None or not constant_time_compare(token, user.calendar_token):
+        raise Http404("No such calendar")
+
+    bookings = ical.bookings_for(user)
+    etag, last_modified = await ical.avalidators(bookings)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return _feed_headers(not_modified, etag, last_modified)
+
+    # Each handler streams from its own kind of iterator, so neither buffers the feed
+    content = ical.astream(request, user, bookings) if isinstance(request, ASGIRequest) else \
+        ical.stream(request, user, bookings)
+    response = StreamingHttpResponse(content, content_type='text/calendar; charset=utf-8')
+    response.headers['Content-Disposition'] = 'inline; filename="consultations.ics"'
+    return _feed_headers(response, etag, last_modified)
+
+
+@login_required
+@require_POST
+def reset_calendar_token(request):
+    """Issue a new feed URL, for when the old one has leaked."""
+    request.user.calendar_token = new_calendar_token()
+    request.user.save(update_fields=['calendar_token'])
+    messages.success(request, "Your calendar link has been changed. Subscribe again with the new one.")
+    return redirect('advocate_dashboard' if request.user.role == 'advocate' else 'client_dashboard')
+
+
 # -------------------------
 # UPDATE BOOKING STATUS
 # -------------------------
@@ -351,10 +569,22 @@ def update_booking_status(request, booking_id):
         meeting_link = request.POST.get('meeting_link', '')
         
         if status in ['accepted', 'rejected', 'completed', 'cancelled']:
+            previous_status = booking.status
             booking.status = status
             if status == 'accepted' and meeting_link:
                 booking.meeting_link = meeting_link
-            booking.save()
+            try:
+                with transaction.atomic():
+                    if status in availability.RELEASED_STATUSES:
+                        availability.release_slot(booking)
+                    elif previous_status in availability.RELEASED_STATUSES:
+                        availability.claim_slot(booking)
+                    booking.save()
+                    # Notification and case count run in the background (main/tasks.py)
+                    tasks.booking_status_changed(booking, previous_status)
+            except availability.SlotUnavailable as e:
+                messages.error(request, str(e))
+                return redirect('booking_detail', booking_id=booking_id)
             messages.success(request, f"Booking {status} successfully!")
     
     return redirect('booking_detail', booking_id=booking_id)
@@ -376,19 +606,89 @@ def upload_document(request, booking_id):
         description = request.POST.get('description', '')
         file = request.FILES['file']
         
-        document = Document.objects.create(
-            booking=booking,
-            uploaded_by=request.user,
-            file=file,
-            title=title,
-            description=description
-        )
+        try:
+            document = uploads.save_uploaded_file(booking, request.user, file, title, description)
+        except uploads.UploadError as e:
+            messages.error(request, str(e))
+            return redirect('upload_document', booking_id=booking_id)
+        tasks.document_added(document)
         
         messages.success(request, "Document uploaded successfully!")
         return redirect('booking_detail', booking_id=booking_id)
     
     return render(request, 'upload_document.html', {
-        'booking': booking
+        'booking': booking,
+        'chunk_size': uploads.CHUNK_SIZE,
+    })
+
+
+# -------------------------
+# CHUNKED UPLOADS (JSON protocol used by upload_document.html)
+# -------------------------
+def _upload_state(upload):
+    return {
+        'upload_id': str(upload.pk),
+        'chunk_size': uploads.CHUNK_SIZE,
+        'size': upload.size,
+        'received': upload.received,
+        'next_chunk': len(upload.chunk_digests) // 64,
+        'failed': upload.failed,
+    }
+
+
+@login_required
+@require_POST
+def start_document_upload(request, booking_id):
+    booking = get_object_or_404(Booking, id=booking_id)
+    if request.user.id not in (booking.client_id, booking.advocate_id):
+        return JsonResponse({'error': "Access denied"}, status=403)
+    
+    try:
+        upload = uploads.start_upload(
+            booking,
+            request.user,
+            filename=request.POST.get('filename', ''),
+            size=int(request.POST.get('size', '')),
+            title=request.POST.get('title', ''),
+            description=request.POST.get('description', ''),
+        )
+    except ValueError:
+        return JsonResponse({'error': "size must be a number of bytes"}, status=400)
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(_upload_state(upload), status=201)
+
+
+@login_required
+def document_upload_status(request, upload_id):
+    upload = get_object_or_404(UploadSession, pk=upload_id, uploaded_by=request.user)
+    return JsonResponse(_upload_state(upload))
+
+
+@login_required
+@require_POST
+def upload_document_chunk(request, upload_id, index):
+    get_object_or_404(UploadSession.objects.only('pk'), pk=upload_id, uploaded_by=request.user)
+    try:
+        upload = uploads.write_chunk(upload_id, index, request, request.headers.get('X-Chunk-SHA256', ''))
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse(_upload_state(upload))
+
+
+@login_required
+@require_POST
+def complete_document_upload(request, upload_id):
+    upload = get_object_or_404(UploadSession.objects.only('booking_id'), pk=upload_id, uploaded_by=request.user)
+    try:
+        document = uploads.complete_upload(upload_id)
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    tasks.document_added(document)
+    messages.success(request, "Document uploaded successfully!")
+    return JsonResponse({
+        'document_id': document.pk,
+        'redirect': reverse('booking_detail', args=[upload.booking_id]),
     })
 
 
@@ -412,25 +712,49 @@ def add_review(request, booking_id):
         return redirect('booking_detail', booking_id=booking_id)
     
     if request.method == 'POST':
-        rating = request.POST.get('rating')
+        try:
+            rating = int(request.POST.get('rating', ''))
+        except ValueError:
+            rating = None
         comment = request.POST.get('comment', '')
         
-        review = Review.objects.create(
-            advocate=booking.advocate,
-            client=request.user,
-            booking=booking,
-            rating=rating,
-            comment=comment
-        )
+        # create() does not enforce the choices, and the counters only have 1-5 star buckets
+        if rating not in ratings.STARS:
+            messages.error(request, "Please choose a rating from 1 to 5 stars")
+            return redirect('booking_detail', booking_id=booking_id)
         
-        # Update advocate rating
-        avg_rating = Review.objects.filter(advocate=booking.advocate).aggregate(Avg('rating'))['rating__avg']
-        booking.advocate.advocate_profile.rating = avg_rating or 0
-        booking.advocate.advocate_profile.save()
+        with transaction.atomic():
+            review = Review.objects.create(
+                advocate=booking.advocate,
+                client=request.user,
+                booking=booking,
+                rating=rating,
+                comment=comment
+            )
+            # The Review post_save signal queues the rating counter update
+            tasks.review_added(review)
         
         messages.success(request, "Review submitted successfully!")
         return redirect('booking_detail', booking_id=booking_id)
     
     return render(request, 'add_review.html', {
         'booking': booking
-    })
\ No newline at end of file
+    })
+
+
+# -------------------------
+# METRICS (Prometheus text format)
+# -------------------------
+def prometheus_metrics(request):
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if token:
+        allowed = constant_time_compare(authorization, f'Bearer {token}')
+    else:
+        allowed = request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.exposition(metrics.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )